@@ -21,13 +21,21 @@
 # In applying this license, CERN does not
 # waive the privileges and immunities granted to it by virtue of its status
 # as an Intergovernmental Organization or submit itself to any jurisdiction.
-"""Cap cli API module."""
+"""Cap cli API module.
 
-from .analysis_api import AnalysisAPI
-from .files_api import FilesAPI
-from .metadata_api import MetadataAPI
-from .permissions_api import PermissionsAPI
-from .repositories_api import RepositoriesAPI
+API classes are imported on first access, so that importing the package
+does not load the HTTP stack.
+"""
+
+import importlib
+
+_MODULES = {
+    'AnalysisAPI': '.analysis_api',
+    'FilesAPI': '.files_api',
+    'MetadataAPI': '.metadata_api',
+    'PermissionsAPI': '.permissions_api',
+    'RepositoriesAPI': '.repositories_api',
+}
 
 __all__ = [
     'AnalysisAPI',
@@ -36,3 +44,18 @@ __all__ = [
     'PermissionsAPI',
     'RepositoriesAPI',
 ]
+
+
+def __getattr__(name):
+    """Import API classes lazily."""
+    if name in _MODULES:
+        module = importlib.import_module(_MODULES[name], __name__)
+        return getattr(module, name)
+
+    raise AttributeError('module {!r} has no attribute {!r}'.format(
+        __name__, name))
+
+
+def __dir__():
+    """List module attributes, including the lazily imported ones."""
+    return sorted(set(globals()) | set(__all__))
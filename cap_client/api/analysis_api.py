@@ -23,14 +23,30 @@
 # as an Intergovernmental Organization or submit itself to any jurisdiction.
 """Analysis API class."""
 
-import json
+import collections
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from click import UsageError
 from future.moves.urllib.parse import urljoin, urlencode
 
+from cap_client import codec
 from cap_client.errors import BadStatusCode
 
 from .base import CapAPI
+from .metadata_api import MetadataAPI
+
+PAGE_SIZE = int(os.environ.get('CAP_PAGE_SIZE', 100))
+PAGE_SIZE_MAX = int(os.environ.get('CAP_PAGE_SIZE_MAX', 1000))
+PAGE_SIZE_MIN = 10
+PAGE_WORKERS = int(os.environ.get('CAP_PAGE_WORKERS', 4))
+# pages fetched in parallel need an order that does not change between them
+PAGE_SORT = 'mostrecent'
+CREATE_WORKERS = int(os.environ.get('CAP_CREATE_WORKERS', 4))
+
+CreateResult = collections.namedtuple('CreateResult',
+                                      ['index', 'analysis', 'error'])
 
 
 class AnalysisAPI(CapAPI):
@@ -103,13 +119,33 @@ class AnalysisAPI(CapAPI):
         :return: list of analyses
         :rtype: list
         """
-        response = self._make_request(
-            url='deposits/?{}'.format(self._param_encoder(all, query, search, type, sort, page, size)),
-            headers={'Accept': 'application/basic+json'},
-        )
+        response = self._search('deposits/', all, query, search, type, sort,
+                                page, size)
 
         return response['hits']['hits']
 
+    def iter_drafts(
+            self,
+            all=False,
+            query='',
+            search=None,
+            type=None,
+            sort=None,
+            size=PAGE_SIZE,
+            workers=1):
+        """Iterate over user's draft analyses, following pagination.
+
+        See `AnalysisAPI.get_drafts` for the parameters, `size` is the
+        number of analyses fetched with every request (None for the
+        largest page size accepted by the server) and `workers` the number
+        of pages fetched in parallel.
+
+        :return: generator of analyses
+        :rtype: generator
+        """
+        return self._iter_pages('deposits/', all, query, search, type, sort,
+                                size, workers)
+
     def get_draft_by_pid(self, pid):
         """Get draft analysis.
 
@@ -153,12 +189,133 @@ class AnalysisAPI(CapAPI):
         :return: list of analysis
         :rtype: list
         """
-        response = self._make_request(
-            url='records/?{}'.format(self._param_encoder(all, query, search, type, sort, page, size)),
+        response = self._search('records/', all, query, search, type, sort,
+                                page, size)
+
+        return response['hits']['hits']
+
+    def iter_published(
+            self,
+            all=False,
+            query='',
+            search=None,
+            type=None,
+            sort=None,
+            size=PAGE_SIZE,
+            workers=1):
+        """Iterate over user's published analyses, following pagination.
+
+        See `AnalysisAPI.get_published` for the parameters, `size` is the
+        number of analyses fetched with every request (None for the
+        largest page size accepted by the server) and `workers` the number
+        of pages fetched in parallel.
+
+        :return: generator of analyses
+        :rtype: generator
+        """
+        return self._iter_pages('records/', all, query, search, type, sort,
+                                size, workers)
+
+    def _search(self, url, all, query, search, type, sort, page, size):
+        """Get a page of search results, see `AnalysisAPI.get_drafts`."""
+        return self._make_request(
+            url='{}?{}'.format(url, self._param_encoder(
+                all, query, search, type, sort, page, size)),
             headers={'Accept': 'application/basic+json'},
         )
 
-        return response['hits']['hits']
+    def _iter_pages(self, url, all, query, search, type, sort, size,
+                    workers=1):
+        """Yield search results page by page, in order.
+
+        While the current page is consumed, up to `workers` following
+        pages are fetched by a pool of threads, so at most `workers + 1`
+        pages are held in memory. Analyses shifted to the next page by
+        ones created in the meantime are yielded only once (by their PID),
+        and pages are read until one comes back short, so the ones shifted
+        past the last page counted at the start are not lost either.
+
+        The default order of the server (best match) breaks ties
+        differently from one request to another, so analyses could be
+        missed when pages are fetched in parallel. Unless `sort` is given,
+        they are sorted by `PAGE_SORT` then.
+        """
+        if workers > 1 and not sort:
+            sort = PAGE_SORT
+
+        fetch = functools.partial(self._search, url, all, query, search,
+                                  type, sort)
+        if size:
+            response = fetch(page=1, size=size)
+        else:
+            response, size = self._probe_page_size(fetch)
+
+        hits = response['hits']['hits']
+        total = response['hits'].get('total')
+        if isinstance(total, dict):  # Elasticsearch >= 7
+            total = total.get('value')
+
+        if hits and len(hits) < size and (total is None or total > len(hits)):
+            size = len(hits)  # server caps the page size
+
+        # the total only bounds prefetching, results can grow meanwhile
+        expected_pages = -(-total // size) if total is not None else None
+        last_page = 1 if len(hits) < size else None
+
+        executor = ThreadPoolExecutor(max_workers=workers)
+        pending = collections.deque()
+        page, next_page, seen = 1, 2, set()
+
+        try:
+            while True:
+                limit = max(expected_pages, page + 1) \
+                    if expected_pages is not None else None
+                while len(pending) < workers and last_page is None and \
+                        (limit is None or next_page <= limit):
+                    pending.append((next_page,
+                                    executor.submit(fetch, page=next_page,
+                                                    size=size)))
+                    next_page += 1
+
+                for hit in hits:
+                    key = hit.get('pid', hit.get('id'))
+                    if key is not None:
+                        if key in seen:
+                            continue
+                        seen.add(key)
+                    yield hit
+
+                if not pending:
+                    return
+
+                page, future = pending.popleft()
+                hits = future.result()['hits']['hits']
+                if len(hits) < size:  # last page, drop the ones after it
+                    last_page = page
+                    while pending:
+                        pending.pop()[1].cancel()
+        finally:
+            for _, future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def _probe_page_size(self, fetch):
+        """Fetch first page with the largest page size the server accepts.
+
+        Starts with `PAGE_SIZE_MAX` and halves the size while the server
+        rejects it.
+
+        :return: first page and its size
+        :rtype: tuple(dict, int)
+        """
+        size = PAGE_SIZE_MAX
+        while True:
+            try:
+                return fetch(page=1, size=size), size
+            except BadStatusCode as e:
+                if e.status_code != 400 or size // 2 < PAGE_SIZE_MIN:
+                    raise
+                size //= 2
 
     def get_published_by_pid(self, pid):
         """Get published analysis.
@@ -175,14 +332,23 @@ class AnalysisAPI(CapAPI):
 
         return response
 
-    def create(self, data, type_=None):
+    def create(self, data, type_=None, fetch=True):
         """Create new analysis.
 
+        The basic serialization of the new analysis is requested with the
+        creation itself, so it takes a single round trip. Servers ignoring
+        the `Accept` header reply with the deposit instead, then the
+        analysis is fetched with a follow-up GET, unless `fetch` is False.
+
         :param data: analysis metadata (JSON serializable)
         :type data: dict
         :param type: analysis type
         :type type: str, optional
-        :return: newly created draft analysis
+        :param fetch: fetch the analysis if the server did not reply with
+        its basic serialization
+        :type fetch: bool, optional
+        :return: newly created draft analysis (with the PID in `pid`,
+        or in `id` when not fetched)
         :rtype: dict
         """
         if not isinstance(data, dict):
@@ -202,21 +368,57 @@ class AnalysisAPI(CapAPI):
         res = self._make_request(
             url='deposits/',
             method='post',
-            data=json.dumps(data),
+            data=codec.dumps(data),
             expected_status_code=201,
-        )
-
-        return self._make_request(
-            url=urljoin('deposits/', res['id']),
-            data=json.dumps(res['metadata']),
-            expected_status_code=200,
-            method='put',
             headers={
                 'Content-Type': 'application/json',
                 'Accept': 'application/basic+json'
             },
         )
 
+        if 'pid' in res or not fetch:
+            return res
+
+        return self.get_draft_by_pid(res['id'])
+
+    def create_many(self,
+                    data,
+                    type_=None,
+                    workers=CREATE_WORKERS,
+                    callback=None):
+        """Create new analyses in parallel.
+
+        Creations are sent by a pool of `workers` threads, over the
+        connections of the shared session.
+
+        :param data: metadata of the analyses (JSON serializable)
+        :type data: list(dict)
+        :param type: analysis type
+        :type type: str, optional
+        :param workers: number of parallel creations
+        :type workers: int, optional
+        :param callback: called with `CreateResult` after every analysis
+        :type callback: callable, optional
+        :return: results in the order of data
+        :rtype: list(`CreateResult`)
+        """
+        def create(index):
+            try:
+                return CreateResult(index, self.create(data[index], type_),
+                                    None)
+            except Exception as e:
+                return CreateResult(index, None, e)
+
+        results = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(create, i) for i in range(len(data))]
+            for future in as_completed(futures):
+                results.append(future.result())
+                if callback:
+                    callback(results[-1])
+
+        return sorted(results, key=lambda r: r.index)
+
     def delete(self, pid):
         """Delete draft analysis.
 
@@ -249,7 +451,7 @@ class AnalysisAPI(CapAPI):
                 'Accept': 'application/basic+json',
                 'Content-Type': 'application/json'
             },
-            data=json.dumps(data),
+            data=codec.dumps(data),
         )
 
     def patch(self, pid, data):
@@ -265,17 +467,7 @@ class AnalysisAPI(CapAPI):
         if type(data) not in [list, dict]:
             raise UsageError('Not a JSON object or array.')
 
-        res = self._make_request(
-            url=urljoin('deposits/', pid),
-            method='patch',
-            headers={
-                'Content-Type': 'application/json-patch+json',
-                'Accept': 'application/basic+json'
-            },
-            data=json.dumps(data),
-        )
-
-        return res
+        return self._make_request(**MetadataAPI._patch_request(pid, data))
 
     def publish(self, pid):
         """Publish draft analysis.
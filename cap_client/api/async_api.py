@@ -0,0 +1,523 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of CERN Analysis Preservation Framework.
+# Copyright (C) 2020 CERN.
+#
+# CERN Analysis Preservation Framework is free software; you can redistribute
+# it and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# CERN Analysis Preservation Framework is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with CERN Analysis Preservation Framework; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+"""Asyncio CAP API classes.
+
+Mirror the synchronous API classes, with coroutine methods running on a
+single event loop and sharing one `aiohttp` connection pool per loop::
+
+    async def main():
+        api = AsyncMetadataAPI()
+        try:
+            return await asyncio.gather(*(api.get(pid) for pid in pids))
+        finally:
+            await close_async_session()
+
+Requires the `async` extra (`pip install cap-client[async]`).
+"""
+
+import asyncio
+import os
+import weakref
+
+from future.moves.urllib.parse import urljoin
+
+from cap_client import codec
+from cap_client.errors import BadStatusCode
+
+from .analysis_api import AnalysisAPI
+from .base import server_config, status_code_to_msg
+from .cache import bucket_link_key, drop_stale_bucket_link, \
+    get_bucket_link_cache
+from .files_api import DOWNLOAD_CHUNK_SIZE
+from .metadata_api import MetadataAPI
+from .permissions_api import PermissionsAPI
+from .session import POOL_IDLE_TIMEOUT, backoff, is_retryable, \
+    retry_budget, stats
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+ASYNC_POOL_LIMIT = int(os.environ.get('CAP_ASYNC_POOL_LIMIT', 100))
+
+_sessions = weakref.WeakKeyDictionary()
+
+
+def get_async_session():
+    """Get the session shared by the async API classes within the loop.
+
+    Has to be called from a coroutine running on the loop.
+
+    :return: session
+    :rtype: `aiohttp.ClientSession`
+    """
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+
+    if session is None or session.closed:
+        session = _sessions[loop] = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=ASYNC_POOL_LIMIT,
+                keepalive_timeout=POOL_IDLE_TIMEOUT,
+            ))
+
+    return session
+
+
+async def close_async_session():
+    """Close the session shared within the running loop."""
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+
+    if session is not None:
+        await session.close()
+
+
+class AsyncCapAPI(object):
+    """Base asyncio CAP interface class."""
+
+    def __init__(self, session=None):
+        """Initialize.
+
+        :param session: session to use instead of the shared one
+        :type session: `aiohttp.ClientSession`, optional
+        """
+        if aiohttp is None:
+            raise ImportError(
+                'The async client requires aiohttp, install it with: '
+                'pip install cap-client[async]')
+
+        self.api, self.access_token = server_config()
+        self._session = session
+
+    @property
+    def session(self):
+        """Session used for the requests."""
+        return self._session or get_async_session()
+
+    async def _make_request(self,
+                            url,
+                            method='get',
+                            expected_status_code=200,
+                            headers={'Content-type': 'application/json'},
+                            stream=False,
+                            **kwargs):
+        """Make request to the CAP server.
+
+        Retries transient failures the same way as `CapAPI._make_request`.
+
+        :param url: endpoint url eg. 'deposits/{pid}'
+        :type url: str
+        :param method: request method
+        :type method: str, optional
+        :param expected_status_code: status code(s) expected on success
+        :type expected_status_code: int or tuple(int), optional
+        :param headers: request headers
+        :type headers: dict, optional
+        :param stream: return the response without reading its body
+        :type stream: bool, optional
+
+        :raises BadStatusCode: when response status code
+        different than expected
+
+        :return: response data
+        """
+        endpoint = urljoin(self.api, url)
+        headers = dict(headers,
+                       Authorization='OAuth2 {}'.format(self.access_token))
+
+        expected_status_codes = (expected_status_code, ) \
+            if isinstance(expected_status_code, int) else expected_status_code
+
+        response = await self._send(method.upper(), endpoint, headers,
+                                    expected_status_codes, **kwargs)
+
+        if stream and response.status in expected_status_codes:
+            return response
+
+        try:
+            text = await response.text()
+        finally:
+            response.release()
+
+        try:
+            data = codec.loads(text)
+        except ValueError:
+            data = text
+
+        if response.status not in expected_status_codes:
+            msg = status_code_to_msg.get(
+                response.status, text if data is text else None)
+
+            raise BadStatusCode(
+                message=msg,
+                expected_status_code=expected_status_code,
+                status_code=response.status,
+                endpoint=endpoint,
+                data=data,
+            )
+
+        return data
+
+    async def _send(self, method, endpoint, headers, expected_status_codes,
+                    **kwargs):
+        """Send request, retrying transient failures of idempotent ones."""
+        data = kwargs.get('data')
+        retries, position = retry_budget(method, data)
+
+        for attempt in range(retries + 1):
+            stats.incr('requests')
+            try:
+                response = await self.session.request(method,
+                                                      endpoint,
+                                                      headers=headers,
+                                                      ssl=False,
+                                                      **kwargs)
+            except aiohttp.ClientConnectionError:
+                if attempt == retries:
+                    raise
+                delay = backoff(attempt)
+            else:
+                if attempt == retries or not is_retryable(
+                        response.status, expected_status_codes):
+                    return response
+                delay = backoff(attempt, response)
+                response.release()
+
+            await asyncio.sleep(delay)
+
+            if position is not None:
+                data.seek(position)
+
+
+class AsyncAnalysisAPI(AsyncCapAPI):
+    """Asyncio interface for CAP analysis methods."""
+
+    _param_encoder = AnalysisAPI._param_encoder
+
+    async def get_drafts(self,
+                         all=False,
+                         query='',
+                         search=None,
+                         type=None,
+                         sort=None,
+                         page=None,
+                         size=None):
+        """Get list of user's draft analyses.
+
+        See `AnalysisAPI.get_drafts`.
+        """
+        response = await self._make_request(
+            url='deposits/?{}'.format(self._param_encoder(
+                all, query, search, type, sort, page, size)),
+            headers={'Accept': 'application/basic+json'},
+        )
+
+        return response['hits']['hits']
+
+    async def get_draft_by_pid(self, pid):
+        """Get draft analysis.
+
+        :param pid: analysis PID
+        :type pid: str
+        :return: draft analysis
+        :rtype: dict
+        """
+        return await self._make_request(
+            url=urljoin('deposits/', pid),
+            headers={'Accept': 'application/basic+json'},
+        )
+
+    async def get_published(self,
+                            all=False,
+                            query='',
+                            search=None,
+                            type=None,
+                            sort=None,
+                            page=None,
+                            size=None):
+        """Get list of user's published analyses.
+
+        See `AnalysisAPI.get_published`.
+        """
+        response = await self._make_request(
+            url='records/?{}'.format(self._param_encoder(
+                all, query, search, type, sort, page, size)),
+            headers={'Accept': 'application/basic+json'},
+        )
+
+        return response['hits']['hits']
+
+    async def get_published_by_pid(self, pid):
+        """Get published analysis.
+
+        :param pid: analysis PID
+        :type pid: str
+        :return: published analysis
+        :rtype: dict
+        """
+        return await self._make_request(
+            url=urljoin('records/', pid),
+            headers={'Accept': 'application/basic+json'},
+        )
+
+
+class AsyncMetadataAPI(AsyncCapAPI):
+    """Asyncio interface for CAP metadata methods."""
+
+    async def get(self, pid, field=None):
+        """Get metadata for analysis with given PID.
+
+        :param pid: analysis PID
+        :type pid: str
+        :param field: get specific field, eg. obj.nested_arr.0
+        :type field: str, optional
+        :return: metadata field's object|value
+        :rtype: JSON serializable object
+        """
+        response = await self._make_request(
+            url=urljoin('deposits/', pid),
+            headers={'Accept': 'application/basic+json'},
+        )
+
+        return MetadataAPI._get_field(response['metadata'], field)
+
+    async def set(self, pid, value, field=None):
+        """Update analysis metadata.
+
+        :param pid: analysis PID
+        :type pid: str
+        :param value: value to set
+        :type value: JSON serializable object
+        :param field: set specific field, eg. obj.nested_arr.0
+        :type field: str, optional
+        :return: updated analysis metadata
+        :rtype: dict
+        """
+        return await self._make_request(
+            **MetadataAPI._set_request(pid, value, field))
+
+    async def remove(self, pid, field):
+        """Remove metadata field for analysis with given PID.
+
+        :param pid: analysis PID
+        :type pid: str
+        :param field: field name, eg. obj.nested_arr.0
+        :type field: str
+        :return: updated analysis metadata
+        :rtype: dict
+        """
+        response = await self._make_request(
+            **MetadataAPI._remove_request(pid, field))
+
+        return response['metadata']
+
+
+class AsyncFilesAPI(AsyncCapAPI):
+    """Asyncio interface for CAP files methods."""
+
+    async def get(self, pid):
+        """Get list of files attached to analysis.
+
+        :param pid: analysis PID
+        :type pid: str
+        :return: list of files
+        :rtype: list
+        """
+        return await self._make_request(url='deposits/{}/files'.format(pid))
+
+    async def download(self,
+                       pid,
+                       filename,
+                       output_filepath=None,
+                       chunk_size=DOWNLOAD_CHUNK_SIZE):
+        """Download a file attached to your analysis.
+
+        The file is streamed to `<output_filepath>.part` and renamed once
+        complete. Unlike `FilesAPI.download`, interrupted downloads are
+        not resumed.
+
+        :param pid: analysis PID
+        :type pid: str
+        :param filename: filename
+        :type filename: str
+        :param output_filepath: save your file as..
+        :type output_filepath: str, optional
+        :param chunk_size: size of chunks read from the response (bytes)
+        :type chunk_size: int, optional
+        :return: number of bytes received
+        :rtype: int
+        """
+        filepath = output_filepath or filename
+        part_filepath = filepath + '.part'
+        received = 0
+
+        async def request(bucket_url):
+            return await self._make_request(url=bucket_url + '/' + filename,
+                                            stream=True)
+
+        response = await self._bucket_request(pid, request)
+        try:
+            with open(part_filepath, 'wb') as fp:
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    fp.write(chunk)
+                    received += len(chunk)
+        except BaseException:
+            os.remove(part_filepath)
+            raise
+        finally:
+            response.release()
+
+        os.replace(part_filepath, filepath)
+        return received
+
+    async def upload_file(self, pid, filepath, output_filename=None):
+        """Upload a file to your analysis.
+
+        :param pid: analysis PID
+        :type pid: str
+        :param filepath: filepath to uploaded file
+        :type filepath: str
+        :param output_filename: save your file as..
+        :type output_filename: str, optional
+        :return: uploaded file
+        :rtype: dict
+        """
+        fname = output_filename or os.path.basename(filepath)
+
+        async def request(bucket_url):
+            with open(filepath, 'rb') as fp:
+                return await self._make_request(
+                    url=bucket_url + '/' + fname,
+                    method='put',
+                    headers={},
+                    data=fp,
+                )
+
+        return await self._bucket_request(pid, request)
+
+    async def remove(self, pid, filename):
+        """Remove file from analysis.
+
+        :param pid: analysis PID
+        :type pid: str
+        :param filename: filename
+        :type filename: str
+        """
+        async def request(bucket_url):
+            await self._make_request(
+                url=bucket_url + '/' + filename,
+                method='delete',
+                expected_status_code=204,
+            )
+
+        await self._bucket_request(pid, request)
+
+    async def _bucket_request(self, pid, request):
+        """Await `request` with the link to analysis bucket.
+
+        Same as `FilesAPI._bucket_request`, a request failing with 404 is
+        retried once with a fresh link.
+
+        :param pid: analysis PID
+        :type pid: str
+        :param request: coroutine function taking the bucket url
+        :type request: callable
+        :return: result of request
+        """
+        bucket_url = await self._get_bucket_link(pid)
+        try:
+            return await request(bucket_url)
+        except BadStatusCode as e:
+            if not drop_stale_bucket_link(bucket_link_key(self.api, pid), e):
+                raise
+            fresh_url = await self._get_bucket_link(pid)
+            if fresh_url == bucket_url:
+                raise
+
+        return await request(fresh_url)
+
+    async def _get_bucket_link(self, pid):
+        links = get_bucket_link_cache()
+        key = bucket_link_key(self.api, pid)
+
+        link = links.get(key)
+        if not link:
+            ana = await self._make_request(urljoin('deposits/', pid))
+            link = ana['links']['bucket']
+            links.put(key, link)
+
+        return link
+
+
+class AsyncPermissionsAPI(AsyncCapAPI):
+    """Asyncio interface for CAP permissions methods."""
+
+    _construct_permission = PermissionsAPI._construct_permission
+
+    async def get(self, pid):
+        """List permissions for analysis.
+
+        :param pid: analysis PID
+        :type pid: str
+        :return: list of users/egroups with access to analysis
+        :rtype: dict
+        """
+        res = await self._make_request(
+            url=urljoin('deposits/', pid),
+            headers={'Accept': 'application/permissions+json'})
+
+        return res.get('permissions')
+
+    async def add(self, pid, email, rights, is_egroup=False):
+        """Give user permissions to analysis.
+
+        See `PermissionsAPI.add`.
+        """
+        return await self._update(pid, email, 'add', rights, is_egroup)
+
+    async def remove(self, pid, email, rights, is_egroup=False):
+        """Revoke user permissions to analysis.
+
+        See `PermissionsAPI.remove`.
+        """
+        return await self._update(pid, email, 'remove', rights, is_egroup)
+
+    async def _update(self, pid, email, operation, rights, is_egroup):
+        data = self._construct_permission(email,
+                                          operation,
+                                          rights,
+                                          is_egroup=is_egroup)
+        res = await self._make_request(
+            url='deposits/{}/actions/permissions'.format(pid),
+            method='post',
+            expected_status_code=201,
+            headers={
+                'Content-type': 'application/json',
+                'Accept': 'application/permissions+json'
+            },
+            data=codec.dumps(data),
+        )
+
+        return res.get('permissions')
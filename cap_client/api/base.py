@@ -24,14 +24,20 @@
 """Base CAP API class."""
 
 import os
+import time
 
-import requests
 import urllib3
 from click import UsageError
+from requests.exceptions import ConnectionError
 from urllib.parse import urljoin
 
+from cap_client import codec
 from cap_client.errors import BadStatusCode
 
+from .cache import get_http_cache
+from .session import backoff, get_session, is_retryable, retry_budget, \
+    stats
+
 # @TOFIX
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -43,6 +49,28 @@ status_code_to_msg = {
 }
 
 
+def server_config():
+    """Read CAP server url and access token from the environment.
+
+    :raises UsageError: when no access token is provided
+    :return: API url and access token
+    :rtype: tuple(str, str)
+    """
+    server_url = os.environ.get('CAP_SERVER_URL',
+                                'https://analysispreservation.cern.ch')
+    apipath = os.environ.get('CAP_SERVER_API_PATH', 'api/')
+    try:
+        access_token = os.environ['CAP_ACCESS_TOKEN']
+    except KeyError:
+        raise UsageError(
+            'No personal access token provided.\n'
+            'Try: export CAP_ACCESS_TOKEN=[TOKEN]\n\n'
+            'If you do not have your token yet, login to the website and'
+            'generate one from your account settings page.')
+
+    return urljoin(server_url, apipath), access_token
+
+
 class CapAPI(object):
     """Base CAP interface class.
 
@@ -51,18 +79,8 @@ class CapAPI(object):
 
     def __init__(self):
         """Initialize."""
-        server_url = os.environ.get('CAP_SERVER_URL',
-                                    'https://analysispreservation.cern.ch')
-        apipath = os.environ.get('CAP_SERVER_API_PATH', 'api/')
-        self.api = urljoin(server_url, apipath)
-        try:
-            self.access_token = os.environ['CAP_ACCESS_TOKEN']
-        except KeyError:
-            raise UsageError(
-                'No personal access token provided.\n'
-                'Try: export CAP_ACCESS_TOKEN=[TOKEN]\n\n'
-                'If you do not have your token yet, login to the website and'
-                'generate one from your account settings page.')
+        self.api, self.access_token = server_config()
+        self.session = get_session()
 
     def _make_request(self,
                       url,
@@ -70,19 +88,32 @@ class CapAPI(object):
                       expected_status_code=200,
                       headers={'Content-type': 'application/json'},
                       stream=False,
+                      retries=None,
                       **kwargs):
         """Make request to the CAP server.
 
+        Idempotent requests (GET, PUT, DELETE..) failing with a connection
+        error or a 429/502/503/504 status code are retried with exponential
+        backoff, POST and PATCH requests are never repeated.
+
+        When the HTTP cache is enabled, responses to GET requests are
+        stored on disk and revalidated with `If-None-Match` and
+        `If-Modified-Since` headers, so unchanged ones are not downloaded
+        again.
+
         :param url: endpoint url eg. 'deposits/{pid}'
         :type url: str
         :param method: request method
         :type method: str, optional
-        :param expected_status_code: status code expected on success
-        :type expected_status_code: int, optional
+        :param expected_status_code: status code(s) expected on success
+        :type expected_status_code: int or tuple(int), optional
         :param headers: request headers
         :type headers: dict, optional
         :param stream: request streamed response
         :type stream: bool, optional
+        :param retries: max number of retries of idempotent requests
+        (`CAP_RETRY_TOTAL` by default)
+        :type retries: int, optional
 
         :raises BadStatusCode: when response status code
         different than expected
@@ -90,19 +121,31 @@ class CapAPI(object):
         :return: response data
         """
         endpoint = urljoin(self.api, url)
-        method_obj = getattr(requests, method)
-        headers.update(
-            {'Authorization': 'OAuth2 {}'.format(self.access_token)})
+        headers = dict(headers,
+                       Authorization='OAuth2 {}'.format(self.access_token))
+
+        expected_status_codes = (expected_status_code, ) \
+            if isinstance(expected_status_code, int) else expected_status_code
 
-        response = method_obj(url=endpoint,
-                              verify=False,
-                              headers=headers,
-                              stream=stream,
-                              **kwargs)
+        cache = get_http_cache() \
+            if method.upper() == 'GET' and not stream else None
+        cached = None
+        if cache:
+            key = cache.key(endpoint, headers.get('Accept'), self.access_token)
+            cached = cache.get(key)
+            if cached:
+                headers = dict(headers, **self._conditional_headers(cached))
 
-        if response.status_code != expected_status_code:
+        response = self._send(method.upper(), endpoint, headers, stream,
+                              expected_status_codes, retries, **kwargs)
+
+        if cached and response.status_code == 304:
+            stats.incr('cache_hits')
+            return self._decode(cached.body)
+
+        if response.status_code not in expected_status_codes:
             try:
-                data, msg = response.json(), None
+                data, msg = codec.loads(response.content), None
             except ValueError:
                 data = msg = response.text
 
@@ -117,10 +160,67 @@ class CapAPI(object):
                 data=data,
             )
 
+        if cache:
+            self._cache_response(cache, key, response)
+
         if stream:
             return response
         else:
             try:
-                return response.json()
+                return codec.loads(response.content)
             except ValueError:
                 return response.text
+
+    def _conditional_headers(self, cached):
+        headers = {}
+        if cached.etag:
+            headers['If-None-Match'] = cached.etag
+        if cached.last_modified:
+            headers['If-Modified-Since'] = cached.last_modified
+        return headers
+
+    def _cache_response(self, cache, key, response):
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+
+        if 'no-store' in response.headers.get('Cache-Control', '') or \
+                not (etag or last_modified):
+            cache.remove(key)
+        else:
+            cache.put(key, response.content, etag, last_modified)
+
+    def _decode(self, body):
+        try:
+            return codec.loads(body)
+        except ValueError:
+            return body.decode('utf-8', 'replace')
+
+    def _send(self, method, endpoint, headers, stream, expected_status_codes,
+              retries=None, **kwargs):
+        """Send request, retrying transient failures of idempotent ones."""
+        data = kwargs.get('data')
+        retries, position = retry_budget(method, data, retries)
+
+        for attempt in range(retries + 1):
+            try:
+                response = self.session.request(method=method,
+                                                url=endpoint,
+                                                verify=False,
+                                                headers=headers,
+                                                stream=stream,
+                                                **kwargs)
+            except ConnectionError:
+                if attempt == retries:
+                    raise
+                delay = backoff(attempt)
+            else:
+                if attempt == retries or not is_retryable(
+                        response.status_code, expected_status_codes):
+                    return response
+                delay = backoff(attempt, response)
+                response.close()
+
+            time.sleep(delay)
+
+            if position is not None:
+                data.seek(position)
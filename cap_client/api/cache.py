@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of CERN Analysis Preservation Framework.
+# Copyright (C) 2020 CERN.
+#
+# CERN Analysis Preservation Framework is free software; you can redistribute
+# it and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# CERN Analysis Preservation Framework is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with CERN Analysis Preservation Framework; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+"""Client-side caches of server responses.
+
+`HTTPCache` keeps GET responses on disk and revalidates them with
+conditional requests, `BucketLinkCache` remembers analysis bucket links.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from future.moves.urllib.parse import urljoin
+
+from cap_client.utils import cache_dir, private_file
+
+
+def _env_flag(name):
+    return os.environ.get(name, '').lower() in ('1', 'true', 'yes', 'on')
+
+
+HTTP_CACHE_SIZE = int(
+    os.environ.get('CAP_HTTP_CACHE_SIZE', 50 * 1024 * 1024))
+BUCKET_LINK_TTL = float(os.environ.get('CAP_BUCKET_LINK_TTL', 600))
+BUCKET_LINK_PERSIST = _env_flag('CAP_BUCKET_LINK_PERSIST')
+
+CachedResponse = namedtuple('CachedResponse', ['etag', 'last_modified',
+                                               'body'])
+
+_enabled = _env_flag('CAP_HTTP_CACHE')
+_cache = None
+_cache_lock = threading.Lock()
+_bucket_links = None
+
+
+class HTTPCache(object):
+    """Responses cached in a SQLite database, evicted least recently used.
+
+    Entries are keyed by URL, `Accept` header and a hash of the access
+    token, so responses are never shared between users or serializers.
+    """
+
+    def __init__(self, filepath=None, max_size=HTTP_CACHE_SIZE):
+        """Initialize."""
+        self.filepath = filepath or os.path.join(cache_dir(), 'http.db')
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(private_file(self.filepath),
+                                   timeout=10,
+                                   isolation_level=None,
+                                   check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, '
+            'body BLOB, size INTEGER, accessed REAL)')
+
+    @staticmethod
+    def key(url, accept, token):
+        """Build cache key of a request.
+
+        :param url: request url
+        :type url: str
+        :param accept: `Accept` header of the request
+        :type accept: str
+        :param token: access token used for the request
+        :type token: str
+        :return: cache key
+        :rtype: str
+        """
+        token_hash = hashlib.sha256(token.encode('utf-8')).hexdigest()
+        return hashlib.sha256('\n'.join(
+            [url, accept or '', token_hash]).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Get cached response, marking it as recently used.
+
+        :param key: cache key, see `HTTPCache.key`
+        :type key: str
+        :return: cached response or None
+        :rtype: `CachedResponse`
+        """
+        with self._lock:
+            row = self._db.execute(
+                'SELECT etag, last_modified, body FROM responses '
+                'WHERE key = ?', (key, )).fetchone()
+            if row:
+                self._db.execute(
+                    'UPDATE responses SET accessed = ? WHERE key = ?',
+                    (time.time(), key))
+
+        return CachedResponse(*row) if row else None
+
+    def put(self, key, body, etag=None, last_modified=None):
+        """Store response, evicting the least recently used ones if full.
+
+        :param key: cache key, see `HTTPCache.key`
+        :type key: str
+        :param body: response body
+        :type body: bytes
+        :param etag: `ETag` header of the response
+        :type etag: str, optional
+        :param last_modified: `Last-Modified` header of the response
+        :type last_modified: str, optional
+        :return: None
+        """
+        if len(body) > self.max_size:
+            return
+
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                (key, etag, last_modified, body, len(body), time.time()))
+            self._evict()
+
+    def remove(self, key):
+        """Remove cached response."""
+        with self._lock:
+            self._db.execute('DELETE FROM responses WHERE key = ?', (key, ))
+
+    def size(self):
+        """Get total size of cached responses (bytes)."""
+        with self._lock:
+            return self._db.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def close(self):
+        """Close the database."""
+        self._db.close()
+
+    def _evict(self):
+        total = self._db.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_size:
+            return
+
+        evicted = []
+        for key, size in self._db.execute(
+                'SELECT key, size FROM responses ORDER BY accessed'):
+            if total <= self.max_size:
+                break
+            evicted.append((key, ))
+            total -= size
+
+        self._db.executemany('DELETE FROM responses WHERE key = ?', evicted)
+
+
+class BucketLinkCache(object):
+    """Links to analysis buckets, valid for `ttl` seconds.
+
+    Links are kept in memory and, if `filepath` is given, also in a JSON
+    file, so that they are shared between consecutive commands.
+    """
+
+    def __init__(self, ttl=BUCKET_LINK_TTL, filepath=None):
+        """Initialize."""
+        self.ttl = ttl
+        self.filepath = filepath
+        self._lock = threading.Lock()
+        self._links = self._load() if filepath else {}
+
+    def get(self, key):
+        """Get link, None if not cached or expired.
+
+        :param key: analysis url
+        :type key: str
+        :return: bucket link
+        :rtype: str
+        """
+        with self._lock:
+            link, expires = self._links.get(key, (None, 0))
+
+        return link if expires > time.time() else None
+
+    def put(self, key, link):
+        """Store link.
+
+        :param key: analysis url
+        :type key: str
+        :param link: bucket link
+        :type link: str
+        :return: None
+        """
+        with self._lock:
+            self._links[key] = (link, time.time() + self.ttl)
+            if self.filepath:
+                self._save()
+
+    def invalidate(self, key):
+        """Remove link."""
+        with self._lock:
+            if self._links.pop(key, None) and self.filepath:
+                self._save()
+
+    def _load(self):
+        try:
+            with open(self.filepath) as fp:
+                links = json.load(fp)
+        except (IOError, ValueError):
+            return {}
+
+        now = time.time()
+        return {k: tuple(v) for k, v in links.items() if v[1] > now}
+
+    def _save(self):
+        now = time.time()
+        tmp_filepath = '{}.{}'.format(self.filepath, os.getpid())
+
+        with open(private_file(tmp_filepath), 'w') as fp:
+            json.dump({k: v for k, v in self._links.items() if v[1] > now},
+                      fp)
+        os.replace(tmp_filepath, self.filepath)
+
+
+def enable_http_cache(enabled=True):
+    """Turn the HTTP cache on or off (`CAP_HTTP_CACHE` by default).
+
+    :param enabled: whether to use the cache, None to follow
+        `CAP_HTTP_CACHE` again
+    :type enabled: bool or None
+    """
+    global _enabled
+
+    _enabled = _env_flag('CAP_HTTP_CACHE') if enabled is None else enabled
+
+
+def get_http_cache():
+    """Get the cache shared within the process, None if disabled."""
+    global _cache
+
+    if not _enabled:
+        return None
+
+    with _cache_lock:
+        if _cache is None:
+            _cache = HTTPCache()
+
+        return _cache
+
+
+def close_http_cache():
+    """Close the shared cache."""
+    global _cache
+
+    with _cache_lock:
+        if _cache is not None:
+            _cache.close()
+            _cache = None
+
+
+def get_bucket_link_cache():
+    """Get the bucket link cache shared within the process.
+
+    Persisted in the cache directory with `CAP_BUCKET_LINK_PERSIST`.
+    """
+    global _bucket_links
+
+    with _cache_lock:
+        if _bucket_links is None:
+            _bucket_links = BucketLinkCache(
+                filepath=os.path.join(cache_dir(), 'bucket_links.json')
+                if BUCKET_LINK_PERSIST else None)
+
+        return _bucket_links
+
+
+def bucket_link_key(api, pid):
+    """Get the key of analysis bucket link in the bucket link cache.
+
+    :param api: API url
+    :type api: str
+    :param pid: analysis PID
+    :type pid: str
+    :rtype: str
+    """
+    return urljoin(api, urljoin('deposits/', pid))
+
+
+def drop_stale_bucket_link(key, error):
+    """Drop the cached bucket link if a request to it failed with a 404.
+
+    Bucket links are cached, so a 404 may come from a stale one. Both
+    API clients then fetch the link again and, if it changed, retry once.
+
+    :param key: key of the bucket link
+    :type key: str
+    :param error: error raised by the request
+    :type error: `cap_client.errors.BadStatusCode`
+    :return: whether the link was dropped
+    :rtype: bool
+    """
+    if error.status_code != 404:
+        return False
+
+    get_bucket_link_cache().invalidate(key)
+    return True
+
+
+def clear_bucket_link_cache():
+    """Forget the bucket links cached in memory."""
+    global _bucket_links
+
+    with _cache_lock:
+        _bucket_links = None
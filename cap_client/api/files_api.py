@@ -23,14 +23,92 @@
 # as an Intergovernmental Organization or submit itself to any jurisdiction.
 """Files API class."""
 
+import fnmatch
+import hashlib
+import json
 import os
+import queue
 import tarfile
 import tempfile
+import threading
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from click import UsageError
 from future.moves.urllib.parse import urljoin
+from requests.exceptions import ChunkedEncodingError
+from requests.exceptions import ConnectionError as RequestsConnectionError
+
+from cap_client.compression import EXTENSIONS, open_compressed
+from cap_client.errors import BadStatusCode, ChecksumMismatch, \
+    TransferError
+from cap_client.hashing import ALGORITHMS, HASH_BLOCK_SIZE, HashCache
 
 from .base import CapAPI
+from .cache import bucket_link_key, drop_stale_bucket_link, \
+    get_bucket_link_cache
+
+DOWNLOAD_CHUNK_SIZE = int(
+    os.environ.get('CAP_DOWNLOAD_CHUNK_SIZE', 1024 * 1024))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+TRANSFER_WORKERS = int(os.environ.get('CAP_TRANSFER_WORKERS', 4))
+TRANSFER_RETRIES = int(os.environ.get('CAP_TRANSFER_RETRIES', 2))
+
+TransferResult = namedtuple('TransferResult',
+                            ['filename', 'size', 'elapsed', 'error'])
+SyncPlan = namedtuple('SyncPlan', ['upload', 'remove', 'unchanged'])
+
+
+class _Pipe(object):
+    """Bounded in-memory pipe between a writer and a reader thread.
+
+    Writes are gathered into chunks of `chunk_size` bytes, the reader
+    iterates over the chunks until the writer closes the pipe.
+    """
+
+    def __init__(self, chunk_size, maxsize=4):
+        """Initialize."""
+        self.chunk_size = chunk_size
+        self._buffer = bytearray()
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._cancelled = threading.Event()
+
+    def write(self, data):
+        """Write data to the pipe."""
+        self._buffer.extend(data)
+        if len(self._buffer) >= self.chunk_size:
+            self.flush()
+
+        return len(data)
+
+    def flush(self):
+        """Hand buffered data over to the reader."""
+        if self._buffer:
+            self._put(bytes(self._buffer))
+            self._buffer = bytearray()
+
+    def close(self):
+        """Signal the end of data to the reader."""
+        self._put(None)
+
+    def cancel(self):
+        """Stop the writer, the reader is gone."""
+        self._cancelled.set()
+
+    def _put(self, item):
+        while not self._cancelled.is_set():
+            try:
+                return self._queue.put(item, timeout=0.1)
+            except queue.Full:
+                pass
+
+        if item is not None:
+            raise IOError('Upload stream closed.')
+
+    def __iter__(self):
+        """Iterate over chunks written to the pipe."""
+        return iter(self._queue.get, None)
 
 
 class FilesAPI(CapAPI):
@@ -46,15 +124,33 @@ class FilesAPI(CapAPI):
         """
         return self._make_request(url='deposits/{}/files'.format(pid))
 
-    def download(self, pid, filename, output_filepath=None):
+    def download(self,
+                 pid,
+                 filename,
+                 output_filepath=None,
+                 chunk_size=DOWNLOAD_CHUNK_SIZE,
+                 verify=False):
         """Download a file attached to your analysis.
 
+        The file is streamed to `<output_filepath>.part` chunk by chunk
+        and renamed once complete, so memory usage does not depend on the
+        size of the file. An interrupted download leaves the `.part` file
+        behind, together with a `.part.json` sidecar recording the expected
+        size and checksum, and the next call resumes it with a `Range`
+        request.
+
         :param pid: analysis PID
         :type pid: str
         :param filename: filename
         :type filename: str
         :param output_filepath: save your file as..
         :type output_filepath: str, optional
+        :param chunk_size: size of chunks read from the response (bytes)
+        :type chunk_size: int, optional
+        :param verify: compare checksum of the downloaded file, computed
+        while it is written, with the one in the bucket listing
+        :type verify: bool, optional
+        :raises ChecksumMismatch: when the checksums do not match
         :return: None
         """
         if output_filepath:
@@ -63,46 +159,213 @@ class FilesAPI(CapAPI):
                 raise UsageError(
                     'Directory {} does not exist.'.format(dirpath))
 
-        bucket_url = self._get_bucket_link(pid)
-        data = self._make_request(
-            url=bucket_url + '/' + filename,
-            headers={},
-            stream=True,
-        )
+        checksum, hashes = None, None
+        if verify:
+            checksum = self._get_checksum(pid, filename)
+            hashes = HashCache()
+
+        try:
+            self._bucket_request(
+                pid, lambda bucket_url: self._download_file(
+                    url=bucket_url + '/' + filename,
+                    filepath=output_filepath or filename,
+                    chunk_size=chunk_size,
+                    checksum=checksum,
+                    hashes=hashes))
+        finally:
+            if hashes:
+                hashes.close()
+
+    def download_many(self,
+                      pid,
+                      pattern='*',
+                      output_dir='.',
+                      workers=TRANSFER_WORKERS,
+                      chunk_size=DOWNLOAD_CHUNK_SIZE,
+                      verify=False,
+                      skip=(),
+                      callback=None):
+        """Download files attached to your analysis in parallel.
+
+        The list of files and the bucket link are fetched once, then
+        the files are downloaded by a pool of `workers` threads.
 
-        with open(output_filepath or filename, 'wb') as fp:
-            fp.write(data.content)
+        :param pid: analysis PID
+        :type pid: str
+        :param pattern: download only files matching this glob
+        :type pattern: str, optional
+        :param output_dir: directory to save the files in
+        :type output_dir: str, optional
+        :param workers: number of parallel downloads
+        :type workers: int, optional
+        :param chunk_size: size of chunks read from the response (bytes)
+        :type chunk_size: int, optional
+        :param verify: compare checksums of the downloaded files with the
+        ones in the bucket listing, remove the files that do not match
+        (files without a checksum in the listing fail)
+        :type verify: bool, optional
+        :param skip: filenames not to download, eg. the ones downloaded by
+        an interrupted job
+        :type skip: collection(str), optional
+        :param callback: called with `TransferResult` after every file
+        :type callback: callable, optional
+        :return: results in the order of the bucket listing
+        :rtype: list(`TransferResult`)
+        """
+        if not os.path.isdir(output_dir):
+            raise UsageError('Directory {} does not exist.'.format(output_dir))
+
+        checksums = {
+            f['filename']: f.get('checksum') for f in self.get(pid)
+            if fnmatch.fnmatch(f['filename'], pattern)
+            if f['filename'] not in skip
+        }
+        filenames = list(checksums)
+        if filenames:  # resolve bucket link once, before the workers start
+            self._get_bucket_link(pid)
+        hashes = HashCache() if verify else None
+
+        def download(filename):
+            filepath = self._safe_join(output_dir, filename)
+            dirpath = os.path.dirname(filepath)
+            if not os.path.isdir(dirpath):
+                os.makedirs(dirpath, exist_ok=True)
+
+            return self._bucket_request(
+                pid, lambda bucket_url: self._download_file(
+                    url=bucket_url + '/' + filename,
+                    filepath=filepath,
+                    chunk_size=chunk_size,
+                    checksum=self._required_checksum(
+                        filename, checksums[filename]) if verify else None,
+                    hashes=hashes))
 
-    def upload_directory(self, pid, filepath, output_filename=None):
+        try:
+            return self._run_transfers(download, filenames, workers,
+                                       callback)
+        finally:
+            if hashes:
+                hashes.close()
+
+    def upload_directory(self,
+                         pid,
+                         filepath,
+                         output_filename=None,
+                         stream=False,
+                         compression='gzip',
+                         level=None):
         """Upload a directory to your analysis.
 
+        By default the tarball is built in a temporary file and uploaded
+        once complete. With `stream` it is built in a background thread
+        and sent with chunked transfer encoding while being compressed,
+        without touching the local disk.
+
         :param pid: analysis PID
         :type pid: str
         :param filepath: filepath to uploaded file
         :type filepath: str
         :param output_filename: save your file as..
         :type output_filename: str
+        :param stream: upload while building the tarball
+        :type stream: bool, optional
+        :param compression: tarball compression, one of `COMPRESSIONS`
+        :type compression: str, optional
+        :param level: compression level (0-9)
+        :type level: int, optional
         :return: None
         """
-        bucket_url = self._get_bucket_link(pid)
+        ext = EXTENSIONS[compression]
         fname = output_filename or os.path.basename(filepath)
-        fname = fname if fname.endswith('.tar.gz') else fname + '.tar.gz'
+        fname = fname if fname.endswith(ext) else fname + ext
+
+        if stream:
+            self._bucket_request(
+                pid, lambda bucket_url: self._make_request(
+                    url=bucket_url + '/' + fname,
+                    method='put',
+                    headers={},
+                    data=self._stream_tarball(filepath,
+                                              compression=compression,
+                                              level=level),
+                ))
+            return
 
         with tempfile.TemporaryFile() as fp:
-            with tarfile.open(fileobj=fp, mode='w:gz') as tar:
-                tar.add(filepath)
+            self._write_tarball(fp, filepath, compression, level)
 
             fp.flush()
-            fp.seek(0)
 
-            self._make_request(
-                url=bucket_url + '/' + fname,
-                method='put',
-                headers={},
-                data=fp,
-            )
+            def upload(bucket_url):
+                fp.seek(0)
+                self._make_request(
+                    url=bucket_url + '/' + fname,
+                    method='put',
+                    headers={},
+                    data=fp,
+                )
+
+            self._bucket_request(pid, upload)
+
+    def _write_tarball(self, fileobj, filepath, compression='gzip',
+                       level=None):
+        """Write compressed tarball of filepath to fileobj.
+
+        :param fileobj: writable file object
+        :type fileobj: file
+        :param filepath: path to the directory
+        :type filepath: str
+        :param compression: tarball compression, one of `COMPRESSIONS`
+        :type compression: str, optional
+        :param level: compression level (0-9)
+        :type level: int, optional
+        :return: None
+        """
+        with open_compressed(fileobj, compression, level) as out:
+            with tarfile.open(fileobj=out, mode='w|') as tar:
+                tar.add(filepath)
 
-    def upload_file(self, pid, filepath, output_filename=None):
+    def _stream_tarball(self, filepath, chunk_size=UPLOAD_CHUNK_SIZE,
+                        compression='gzip', level=None):
+        """Build tarball of filepath in a background thread.
+
+        :param filepath: path to the directory
+        :type filepath: str
+        :param chunk_size: size of the yielded chunks (bytes)
+        :type chunk_size: int, optional
+        :param compression: tarball compression, one of `COMPRESSIONS`
+        :type compression: str, optional
+        :param level: compression level (0-9)
+        :type level: int, optional
+        :return: generator of tarball chunks
+        """
+        pipe = _Pipe(chunk_size)
+        errors = []
+
+        def produce():
+            try:
+                self._write_tarball(pipe, filepath, compression, level)
+                pipe.flush()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                pipe.close()
+
+        thread = threading.Thread(target=produce)
+        thread.daemon = True
+        thread.start()
+
+        try:
+            for chunk in pipe:
+                yield chunk
+        finally:
+            pipe.cancel()
+            thread.join()
+
+        if errors:
+            raise errors[0]
+
+    def upload_file(self, pid, filepath, output_filename=None, verify=False):
         """Upload a file to your analysis.
 
         :param pid: analysis PID
@@ -111,19 +374,225 @@ class FilesAPI(CapAPI):
         :type filepath: str
         :param output_filename: save your file as..
         :type output_filename: str
+        :param verify: compare checksum of the uploaded file with the
+        local one
+        :type verify: bool, optional
         :return: None
         """
-        bucket_url = self._get_bucket_link(pid)
         fname = output_filename or os.path.basename(filepath)
+        hashes = HashCache() if verify else None
+
+        try:
+            self._bucket_request(
+                pid, lambda bucket_url: self._upload_file(
+                    bucket_url + '/' + fname, filepath, hashes))
+        finally:
+            if hashes:
+                hashes.close()
+
+    def upload_many(self,
+                    pid,
+                    filepaths,
+                    fnames=None,
+                    workers=TRANSFER_WORKERS,
+                    retries=TRANSFER_RETRIES,
+                    verify=False,
+                    callback=None):
+        """Upload files to your analysis in parallel.
 
+        The bucket link is fetched once, then the files are uploaded by
+        a pool of `workers` threads. Every upload failing with a transient
+        error is retried up to `retries` times on its own (instead of
+        `CAP_RETRY_TOTAL` times, see `CapAPI._make_request`).
+
+        :param pid: analysis PID
+        :type pid: str
+        :param filepaths: filepaths to uploaded files
+        :type filepaths: list(str)
+        :param fnames: save the files as.. (base names by default)
+        :type fnames: list(str), optional
+        :param workers: number of parallel uploads
+        :type workers: int, optional
+        :param retries: number of retries of every failed upload
+        :type retries: int, optional
+        :param verify: compare checksums of the uploaded files with the
+        local ones
+        :type verify: bool, optional
+        :param callback: called with `TransferResult` after every file
+        :type callback: callable, optional
+        :return: results in the order of filepaths
+        :rtype: list(`TransferResult`)
+        """
+        fnames = fnames or [os.path.basename(f) for f in filepaths]
+        duplicates = [f for f, n in Counter(fnames).items() if n > 1]
+        if duplicates:
+            raise UsageError('Multiple files named {}.'.format(
+                ', '.join(sorted(duplicates))))
+
+        fnames = dict(zip(filepaths, fnames))
+        self._get_bucket_link(pid)
+        hashes = HashCache() if verify else None
+
+        def upload(filepath):
+            return self._bucket_request(
+                pid, lambda bucket_url: self._upload_file(
+                    bucket_url + '/' + fnames[filepath], filepath, hashes,
+                    retries=retries))
+
+        try:
+            return self._run_transfers(upload, filepaths, workers, callback)
+        finally:
+            if hashes:
+                hashes.close()
+
+    def _upload_file(self, url, filepath, hashes=None, retries=None):
+        """Upload file to url.
+
+        :param url: file url
+        :type url: str
+        :param filepath: filepath to uploaded file
+        :type filepath: str
+        :param hashes: verify the checksum of the uploaded file using
+        this hash cache
+        :type hashes: `HashCache`, optional
+        :param retries: number of retries on transient errors
+        (`CAP_RETRY_TOTAL` by default)
+        :type retries: int, optional
+        :return: number of bytes transferred
+        :rtype: int
+        """
         with open(filepath, 'rb') as fp:
-            self._make_request(
-                url=bucket_url + '/' + fname,
+            res = self._make_request(
+                url=url,
                 method='put',
                 headers={},
                 data=fp,
+                retries=retries,
             )
 
+        if hashes:
+            self._verify(filepath, res.get('checksum'), hashes)
+
+        return os.path.getsize(filepath)
+
+    def sync_plan(self, pid, dirpath, delete=False):
+        """Compare a local directory with the analysis files.
+
+        Local files are compared with the bucket listing by size and MD5
+        checksum. Digests of local files are cached, so unchanged files
+        are not hashed again.
+
+        :param pid: analysis PID
+        :type pid: str
+        :param dirpath: local directory
+        :type dirpath: str
+        :param delete: list files that do not exist locally for removal
+        :type delete: bool, optional
+        :return: files to upload (bucket filename -> local filepath),
+        bucket filenames to remove, number of unchanged files
+        :rtype: `SyncPlan`
+        """
+        if not os.path.isdir(dirpath):
+            raise UsageError('Directory {} does not exist.'.format(dirpath))
+
+        remote = {f['filename']: f for f in self.get(pid)}
+        local = self._list_local_files(dirpath)
+
+        upload, candidates = {}, {}
+        for key, filepath in local.items():
+            remote_file = remote.get(key)
+            algo, _, checksum = \
+                (remote_file or {}).get('checksum', '').partition(':')
+            if remote_file and algo == 'md5' and \
+                    os.path.getsize(filepath) == remote_file.get('filesize'):
+                candidates[key] = (filepath, checksum)
+            else:
+                upload[key] = filepath
+
+        hashes = HashCache()
+        digests = hashes.get_many([f for f, _ in candidates.values()])
+        hashes.close()
+
+        unchanged = 0
+        for key, (filepath, checksum) in candidates.items():
+            if digests[filepath] == checksum:
+                unchanged += 1
+            else:
+                upload[key] = filepath
+        upload = dict(sorted(upload.items()))
+
+        remove = sorted(set(remote) - set(local)) if delete else []
+
+        return SyncPlan(upload, remove, unchanged)
+
+    def remove_many(self,
+                    pid,
+                    filenames,
+                    workers=TRANSFER_WORKERS,
+                    callback=None):
+        """Remove files attached to your analysis in parallel.
+
+        :param pid: analysis PID
+        :type pid: str
+        :param filenames: filenames
+        :type filenames: list(str)
+        :param workers: number of parallel requests
+        :type workers: int, optional
+        :param callback: called with `TransferResult` after every file
+        :type callback: callable, optional
+        :return: results in the order of filenames
+        :rtype: list(`TransferResult`)
+        """
+        self._get_bucket_link(pid)
+
+        def remove(filename):
+            return self._bucket_request(
+                pid, lambda bucket_url: self._remove_file(
+                    bucket_url + '/' + filename))
+
+        return self._run_transfers(remove, filenames, workers, callback)
+
+    def _list_local_files(self, dirpath):
+        """List files in a directory tree, keyed by bucket filename.
+
+        :param dirpath: local directory
+        :type dirpath: str
+        :return: mapping of bucket filename to local filepath
+        :rtype: dict
+        """
+        files = {}
+        for root, _, filenames in os.walk(dirpath):
+            for filename in filenames:
+                filepath = os.path.join(root, filename)
+                key = os.path.relpath(filepath, dirpath).replace(os.sep, '/')
+                files[key] = filepath
+
+        return files
+
+    def _verify(self, filepath, checksum, hashes):
+        """Verify checksum of a local file, using the hash cache.
+
+        :param filepath: local filepath
+        :type filepath: str
+        :param checksum: checksum reported by the server, eg. md5:<hex>
+        :type checksum: str
+        :param hashes: local hash cache
+        :type hashes: `HashCache`
+        :raises ChecksumMismatch: when the checksums do not match
+        :return: None
+        """
+        algo, _, expected = (checksum or '').partition(':')
+        if algo not in ALGORITHMS:
+            raise ChecksumMismatch(
+                'Cannot verify {}, unsupported checksum {!r}.'.format(
+                    filepath, checksum))
+
+        actual = hashes.get(filepath, algo)
+        if actual != expected:
+            raise ChecksumMismatch(
+                'Checksum mismatch for {} (expected {}, got {}:{}).'.format(
+                    filepath, checksum, algo, actual))
+
     def remove(self, pid, filename):
         """Remove a file attached to your analysis.
 
@@ -133,21 +602,330 @@ class FilesAPI(CapAPI):
         :type filename: str
         :return: None
         """
-        bucket_url = self._get_bucket_link(pid)
+        self._bucket_request(
+            pid,
+            lambda bucket_url: self._remove_file(bucket_url + '/' + filename))
 
+    def _remove_file(self, url):
+        """Remove file at url.
+
+        :param url: file url
+        :type url: str
+        :return: number of bytes transferred (always 0)
+        :rtype: int
+        """
         self._make_request(
-            url=bucket_url + '/' + filename,
+            url=url,
             method='delete',
             expected_status_code=204,
         )
 
+        return 0
+
+    def _download_file(self, url, filepath, chunk_size, checksum=None,
+                       hashes=None):
+        """Download file from url, resuming a previous partial download.
+
+        If checksum is given, the digest of the file is computed while
+        the chunks are written and the file is kept only if it matches.
+
+        :param url: file url
+        :type url: str
+        :param filepath: destination path
+        :type filepath: str
+        :param chunk_size: size of chunks read from the response (bytes)
+        :type chunk_size: int
+        :param checksum: expected checksum, eg. md5:<hex>
+        :type checksum: str, optional
+        :param hashes: hash cache to store the digest of the file in
+        :type hashes: `HashCache`, optional
+        :raises TransferError: when the transfer ends prematurely
+        :raises ChecksumMismatch: when the checksums do not match
+        :return: number of bytes transferred
+        :rtype: int
+        """
+        part_filepath = filepath + '.part'
+        info_filepath = part_filepath + '.json'
+
+        algo, _, expected = (checksum or '').partition(':')
+        if checksum and algo not in ALGORITHMS:
+            raise ChecksumMismatch(
+                'Cannot verify {}, unsupported checksum {!r}.'.format(
+                    filepath, checksum))
+
+        info = self._load_part_info(info_filepath, url)
+        offset = os.path.getsize(part_filepath) \
+            if info and os.path.exists(part_filepath) else 0
+
+        if offset and offset == info['size']:  # nothing left to fetch
+            digest = self._hash_part(part_filepath, algo) if checksum \
+                else None
+            self._finish_download(filepath, digest, expected, hashes)
+            return 0
+
+        response = self._make_request(
+            url=url,
+            headers={'Range': 'bytes={}-'.format(offset)} if offset else {},
+            stream=True,
+            expected_status_code=(200, 206),
+        )
+
+        interrupted, received = False, 0
+        try:
+            size, etag = self._content_info(response)
+
+            if response.status_code == 206:
+                if (size, etag) != (info['size'], info['checksum']):
+                    # file changed on the server, start from scratch
+                    response.close()
+                    os.remove(info_filepath)
+                    return self._download_file(url, filepath, chunk_size,
+                                               checksum, hashes)
+                mode = 'ab'
+                digest = self._hash_part(part_filepath, algo) if checksum \
+                    else None
+            else:  # server ignored the range, fetch the whole file
+                offset, mode = 0, 'wb'
+                digest = hashlib.new(algo) if checksum else None
+                self._save_part_info(info_filepath, url, size, etag)
+
+            with open(part_filepath, mode) as fp:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    fp.write(chunk)
+                    if digest:
+                        digest.update(chunk)
+                    offset += len(chunk)
+                    received += len(chunk)
+        except (ChunkedEncodingError, RequestsConnectionError):
+            interrupted = True
+        finally:
+            response.close()
+
+        if interrupted or (size is not None and offset != size):
+            raise TransferError(
+                'Download of {} interrupted ({} of {} bytes). '
+                'Run the command again to resume.'.format(
+                    url, offset, size or 'unknown'))
+
+        self._finish_download(filepath, digest, expected, hashes)
+
+        return received
+
+    def _hash_part(self, part_filepath, algo):
+        """Hash data downloaded so far, to continue hashing the rest.
+
+        :param part_filepath: path to the partial download
+        :type part_filepath: str
+        :param algo: hash algorithm
+        :type algo: str
+        :return: hash object
+        """
+        digest = hashlib.new(algo)
+        with open(part_filepath, 'rb') as fp:
+            for chunk in iter(lambda: fp.read(HASH_BLOCK_SIZE), b''):
+                digest.update(chunk)
+
+        return digest
+
+    def _finish_download(self, filepath, digest, expected, hashes):
+        """Move complete download in place, if its digest is as expected.
+
+        :param filepath: destination path
+        :type filepath: str
+        :param digest: hash object fed with the downloaded data
+        :param expected: expected hex digest
+        :type expected: str
+        :param hashes: hash cache to store the digest of the file in
+        :type hashes: `HashCache`, optional
+        :raises ChecksumMismatch: when the digests do not match
+        :return: None
+        """
+        part_filepath = filepath + '.part'
+
+        if digest and digest.hexdigest() != expected:
+            os.remove(part_filepath)
+            os.remove(part_filepath + '.json')
+            raise ChecksumMismatch(
+                'Checksum mismatch for {} (expected {}:{}, got {}:{}).'.format(
+                    filepath, digest.name, expected, digest.name,
+                    digest.hexdigest()))
+
+        os.replace(part_filepath, filepath)
+        os.remove(part_filepath + '.json')
+
+        if digest and hashes:
+            hashes.put(filepath, **{digest.name: digest.hexdigest()})
+
+    def _content_info(self, response):
+        """Get total size and checksum of the file served in response.
+
+        :param response: streamed response
+        :type response: `requests.Response`
+        :return: size (None if unknown) and checksum (None if unknown)
+        :rtype: tuple
+        """
+        headers = response.headers
+        size = None
+
+        if response.status_code == 206:
+            total = headers.get('Content-Range', '').rpartition('/')[2]
+            size = int(total) if total.isdigit() else None
+        elif 'Content-Encoding' not in headers and \
+                headers.get('Content-Length', '').isdigit():
+            size = int(headers['Content-Length'])
+
+        return size, headers.get('Content-MD5') or headers.get('ETag')
+
+    def _load_part_info(self, info_filepath, url):
+        """Load the sidecar of a partial download of url.
+
+        :param info_filepath: sidecar path
+        :type info_filepath: str
+        :param url: file url
+        :type url: str
+        :return: sidecar data, None when missing or for another url
+        :rtype: dict
+        """
+        try:
+            with open(info_filepath) as fp:
+                info = json.load(fp)
+        except (IOError, ValueError):
+            return None
+
+        return info if info.get('url') == url else None
+
+    def _save_part_info(self, info_filepath, url, size, checksum):
+        """Save the sidecar of a partial download of url.
+
+        :param info_filepath: sidecar path
+        :type info_filepath: str
+        :param url: file url
+        :type url: str
+        :param size: expected size of the file
+        :type size: int
+        :param checksum: expected checksum of the file
+        :type checksum: str
+        :return: None
+        """
+        with open(info_filepath, 'w') as fp:
+            json.dump({'url': url, 'size': size, 'checksum': checksum}, fp)
+
+    def _run_transfers(self, transfer, filenames, workers, callback=None):
+        """Run transfer function for every filename on a thread pool.
+
+        :param transfer: function transferring a single file, returning
+        the number of bytes transferred
+        :type transfer: callable
+        :param filenames: filenames to transfer
+        :type filenames: list(str)
+        :param workers: size of the thread pool
+        :type workers: int
+        :param callback: called with `TransferResult` after every file
+        :type callback: callable, optional
+        :return: results in the order of filenames
+        :rtype: list(`TransferResult`)
+        """
+        def timed(filename):
+            start = time.time()
+            try:
+                size, error = transfer(filename), None
+            except Exception as e:
+                size, error = 0, e
+
+            return TransferResult(filename, size, time.time() - start, error)
+
+        results = {}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(timed, f) for f in filenames]
+            for future in as_completed(futures):
+                result = future.result()
+                results[result.filename] = result
+                if callback:
+                    callback(result)
+
+        return [results[f] for f in filenames]
+
+    def _safe_join(self, dirpath, filename):
+        """Join bucket filename with dirpath, refusing to leave it.
+
+        :param dirpath: local directory
+        :type dirpath: str
+        :param filename: filename (key) in the bucket
+        :type filename: str
+        :raises UsageError: when the filename points outside of dirpath
+        :return: local filepath
+        :rtype: str
+        """
+        parts = filename.split('/')
+        if os.path.isabs(filename) or '..' in parts:
+            raise UsageError('Unsafe filename {}.'.format(filename))
+
+        return os.path.join(dirpath, *parts)
+
+    def _get_checksum(self, pid, filename):
+        """Get checksum of a file from the bucket listing.
+
+        :param pid: analysis PID
+        :type pid: str
+        :param filename: filename
+        :type filename: str
+        :raises ChecksumMismatch: when the listing has no checksum for it
+        :return: checksum, eg. md5:<hex>
+        :rtype: str
+        """
+        for f in self.get(pid):
+            if f['filename'] == filename:
+                return self._required_checksum(filename, f.get('checksum'))
+
+        raise UsageError('File {} does not exist.'.format(filename))
+
+    def _required_checksum(self, filename, checksum):
+        """Make sure a file to verify has a checksum in the listing."""
+        if not checksum:
+            raise ChecksumMismatch(
+                'Cannot verify {}, the server reported no checksum.'.format(
+                    filename))
+        return checksum
+
+    def _bucket_request(self, pid, request):
+        """Call `request` with the link to analysis bucket.
+
+        A request failing with 404 is retried once with a fresh link, see
+        `drop_stale_bucket_link`.
+
+        :param pid: analysis PID
+        :type pid: str
+        :param request: function taking the bucket url
+        :type request: callable
+        :return: result of request
+        """
+        bucket_url = self._get_bucket_link(pid)
+        try:
+            return request(bucket_url)
+        except BadStatusCode as e:
+            if not drop_stale_bucket_link(bucket_link_key(self.api, pid), e):
+                raise
+            fresh_url = self._get_bucket_link(pid)
+            if fresh_url == bucket_url:
+                raise
+
+        return request(fresh_url)
+
     def _get_bucket_link(self, pid):
-        """Make request to server to fetch link to analysis bucket.
+        """Get link to analysis bucket, from the cache if possible.
 
         :param pid: analysis PID
         :type pid: str
         :return: url to analysis bucket
         :rtype: str
         """
+        links = get_bucket_link_cache()
+        key = bucket_link_key(self.api, pid)
+
+        link = links.get(key)
+        if link:
+            return link
+
         ana = self._make_request(urljoin('deposits/', pid))
+        links.put(key, ana['links']['bucket'])
         return ana['links']['bucket']
@@ -23,11 +23,12 @@
 # as an Intergovernmental Organization or submit itself to any jurisdiction.
 """Metadata API class."""
 
-import json
 
 from click import UsageError
 from future.moves.urllib.parse import urljoin
 
+from cap_client import codec, jsonpatch
+
 from .base import CapAPI
 
 
@@ -49,6 +50,11 @@ class MetadataAPI(CapAPI):
             headers={'Accept': 'application/basic+json'},
         )['metadata']
 
+        return self._get_field(metadata, field)
+
+    @staticmethod
+    def _get_field(metadata, field=None):
+        """Get field, eg. obj.nested_arr.0, out of analysis metadata."""
         fields = field.split('.') if field else []
         for x in fields:
             try:
@@ -63,7 +69,7 @@ class MetadataAPI(CapAPI):
 
         return metadata
 
-    def set(self, pid, value, field=None):
+    def set(self, pid, value, field=None, diff=False):
         """Update analysis metadata.
 
         :param pid: analysis PID
@@ -72,37 +78,69 @@ class MetadataAPI(CapAPI):
         :type value: JSON serializable object
         :param field: set specific field, eg. obj.nested_arr.0
         :type field: str, optional
+        :param diff: send only the changes, see `MetadataAPI.set_diff`
+        :type diff: bool, optional
         :return: updated analysis metadata
         :rtype: dict
         """
-        if field:  # use JSON patch to patch fields
-            res = self._make_request(
-                url=urljoin('deposits/', pid),
-                method='patch',
-                headers={
-                    'Content-Type': 'application/json-patch+json',
-                    'Accept': 'application/basic+json'
-                },
-                data=json.dumps([{
-                    "op": "replace",
-                    "path": '/' + field.replace('.', '/'),
-                    "value": value,
-                }]))
-        else:  # use PUT request to update the whole object
-            if not isinstance(value, dict):
-                raise UsageError('Not a JSON object.')
-
-            res = self._make_request(
-                url=urljoin('deposits/', pid),
-                method='put',
-                headers={
-                    'Content-Type': 'application/json',
-                    'Accept': 'application/basic+json'
-                },
-                data=json.dumps(value),
-            )
-
-        return res
+        if diff:
+            return self.set_diff(pid, value, field=field)
+
+        return self._make_request(**self._set_request(pid, value, field))
+
+    def set_diff(self, pid, value, field=None):
+        """Update analysis metadata, sending only what changed.
+
+        The current metadata is fetched (or revalidated, when the HTTP cache
+        is enabled) and compared with the value locally, then the minimal
+        JSON Patch between them is sent. The result is the same as with
+        `MetadataAPI.set`, but large documents are not uploaded and
+        validated again as a whole.
+
+        :param pid: analysis PID
+        :type pid: str
+        :param value: value to set
+        :type value: JSON serializable object
+        :param field: set specific field, eg. obj.nested_arr.0
+        :type field: str, optional
+        :return: updated analysis metadata
+        :rtype: dict
+        """
+        if not field and not isinstance(value, dict):
+            raise UsageError('Not a JSON object.')
+
+        current = self._make_request(
+            url=urljoin('deposits/', pid),
+            headers={'Accept': 'application/basic+json'},
+        )
+        patch = jsonpatch.diff(
+            self._get_field(current['metadata'], field), value,
+            path=jsonpatch.field_pointer(field) if field else '')
+
+        if not patch:
+            return current
+
+        return self.patch(pid, patch)
+
+    def patch(self, pid, operations):
+        """Apply many changes to analysis metadata in a single request.
+
+        All the operations are sent together as one JSON Patch, so the
+        analysis is validated and revised on the server only once, and
+        none of them is applied if any fails.
+
+        :param pid: analysis PID
+        :type pid: str
+        :param operations: JSON Patch operations, eg.
+            [{'op': 'replace', 'path': '/general_title', 'value': 'x'}]
+        :type operations: list(dict)
+        :return: updated analysis metadata
+        :rtype: dict
+        """
+        if not operations:
+            raise UsageError('No changes given.')
+
+        return self._make_request(**self._patch_request(pid, operations))
 
     def remove(self, pid, field):
         """Remove metadata field for analysis with given PID.
@@ -114,18 +152,50 @@ class MetadataAPI(CapAPI):
         :return: updated analysis metadata
         :rtype: dict
         """
-        response = self._make_request(
+        return self._make_request(
+            **self._remove_request(pid, field))['metadata']
+
+    @staticmethod
+    def _set_request(pid, value, field=None):
+        """Build request setting a field, or the whole metadata."""
+        if field:  # use JSON patch to patch fields
+            return MetadataAPI._patch_request(pid, [{
+                "op": "replace",
+                "path": jsonpatch.field_pointer(field),
+                "value": value,
+            }])
+
+        # use PUT request to update the whole object
+        if not isinstance(value, dict):
+            raise UsageError('Not a JSON object.')
+
+        return dict(
+            url=urljoin('deposits/', pid),
+            method='put',
+            headers={
+                'Content-Type': 'application/json',
+                'Accept': 'application/basic+json'
+            },
+            data=codec.dumps(value),
+        )
+
+    @staticmethod
+    def _remove_request(pid, field):
+        """Build request removing a field."""
+        return MetadataAPI._patch_request(pid, [{
+            "op": "remove",
+            "path": jsonpatch.field_pointer(field),
+        }])
+
+    @staticmethod
+    def _patch_request(pid, operations):
+        """Build request applying JSON Patch operations."""
+        return dict(
             url=urljoin('deposits/', pid),
             method='patch',
-            data=json.dumps([
-                {
-                    "op": "remove",
-                    "path": '/' + field.replace('.', '/')
-                },
-            ]),
             headers={
-                'Content-Type': 'application/json-patch+json',  # noqa
+                'Content-Type': 'application/json-patch+json',
                 'Accept': 'application/basic+json'
-            })
-
-        return response['metadata']
+            },
+            data=codec.dumps(operations),
+        )
@@ -23,10 +23,11 @@
 # as an Intergovernmental Organization or submit itself to any jurisdiction.
 """Permissions API class."""
 
-import json
 
 from future.moves.urllib.parse import urljoin
 
+from cap_client import codec
+
 from .base import CapAPI
 
 
@@ -73,7 +74,7 @@ class PermissionsAPI(CapAPI):
                 'Content-type': 'application/json',
                 'Accept': 'application/permissions+json'
             },
-            data=json.dumps(data),
+            data=codec.dumps(data),
         )
 
         return res.get('permissions')
@@ -104,7 +105,7 @@ class PermissionsAPI(CapAPI):
                 'Content-type': 'application/json',
                 'Accept': 'application/permissions+json'
             },
-            data=json.dumps(data),
+            data=codec.dumps(data),
         )
 
         return res.get('permissions')
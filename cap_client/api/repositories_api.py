@@ -23,10 +23,11 @@
 # as an Intergovernmental Organization or submit itself to any jurisdiction.
 """Repositories API class."""
 
-import json
 
 from future.moves.urllib.parse import urljoin
 
+from cap_client import codec
+
 from .base import CapAPI
 
 
@@ -69,7 +70,7 @@ class RepositoriesAPI(CapAPI):
                            headers={
                                'Content-Type': 'application/json',
                                'Accept': 'application/repositories+json'},
-                           data=json.dumps({
+                           data=codec.dumps({
                                'url': url,
                                'webhook': True if event_type else False,
                                'event_type': event_type
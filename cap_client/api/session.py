@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of CERN Analysis Preservation Framework.
+# Copyright (C) 2020 CERN.
+#
+# CERN Analysis Preservation Framework is free software; you can redistribute
+# it and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# CERN Analysis Preservation Framework is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with CERN Analysis Preservation Framework; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+"""Shared HTTP session used by all CAP API classes."""
+
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPConnectionPool, HTTPSConnectionPool
+
+POOL_CONNECTIONS = int(os.environ.get('CAP_POOL_CONNECTIONS', 10))
+POOL_MAXSIZE = int(os.environ.get('CAP_POOL_MAXSIZE', 10))
+POOL_IDLE_TIMEOUT = float(os.environ.get('CAP_POOL_IDLE_TIMEOUT', 60))
+
+RETRY_TOTAL = int(os.environ.get('CAP_RETRY_TOTAL', 3))
+RETRY_BACKOFF = float(os.environ.get('CAP_RETRY_BACKOFF', 0.5))
+RETRY_BACKOFF_MAX = float(os.environ.get('CAP_RETRY_BACKOFF_MAX', 30))
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+
+class TransportStats(object):
+    """Thread-safe counters describing the HTTP traffic of the process."""
+
+    def __init__(self):
+        """Initialize."""
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def incr(self, name, value=1):
+        """Increase counter `name` by `value`."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def get(self, name):
+        """Get current value of counter `name`."""
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self):
+        """Return a copy of all the counters."""
+        with self._lock:
+            stats = dict(self._counters)
+
+        stats['connections_reused'] = max(
+            stats.get('requests', 0) - stats.get('connections_opened', 0), 0)
+        return stats
+
+    def reset(self):
+        """Reset all counters."""
+        with self._lock:
+            self._counters.clear()
+
+
+stats = TransportStats()
+
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    """HTTP connection pool counting newly opened connections."""
+
+    def _new_conn(self):
+        stats.incr('connections_opened')
+        return super(CountingHTTPConnectionPool, self)._new_conn()
+
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    """HTTPS connection pool counting newly opened connections."""
+
+    def _new_conn(self):
+        stats.incr('connections_opened')
+        return super(CountingHTTPSConnectionPool, self)._new_conn()
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """Keep-alive adapter closing connections idle for too long."""
+
+    def __init__(self, idle_timeout=POOL_IDLE_TIMEOUT, **kwargs):
+        """Initialize."""
+        self.idle_timeout = idle_timeout
+        self._last_used = None
+        self._lock = threading.Lock()
+        super(PooledHTTPAdapter, self).__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        """Use connection pools that report to the transport stats."""
+        super(PooledHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': CountingHTTPConnectionPool,
+            'https': CountingHTTPSConnectionPool,
+        }
+
+    def send(self, request, **kwargs):
+        """Send request, dropping the pool first if it was idle."""
+        with self._lock:
+            now = time.monotonic()
+            if self._last_used is not None and \
+                    now - self._last_used > self.idle_timeout:
+                self.poolmanager.clear()
+                stats.incr('idle_pool_resets')
+            self._last_used = now
+
+        stats.incr('requests')
+        return super(PooledHTTPAdapter, self).send(request, **kwargs)
+
+
+def retry_budget(method, data=None, retries=None):
+    """Get how many times a request can be retried on transient failures.
+
+    Only idempotent requests are retried, and only when their body can be
+    sent again: streamed bodies have to be rewound to where they started.
+
+    :param method: request method
+    :type method: str
+    :param data: request body
+    :param retries: max number of retries (`RETRY_TOTAL` by default)
+    :type retries: int, optional
+    :return: number of retries and position to rewind the body to before
+    every retry, None when there is nothing to rewind
+    :rtype: tuple(int, int)
+    """
+    if method.upper() not in IDEMPOTENT_METHODS:
+        retries = 0
+    elif retries is None:
+        retries = RETRY_TOTAL
+
+    position = None
+    if hasattr(data, 'seek') and hasattr(data, 'tell'):
+        position = data.tell()
+    elif data is not None and \
+            not isinstance(data, (bytes, str, dict, list, tuple)):
+        retries = 0
+
+    return retries, position
+
+
+def is_retryable(status_code, expected_status_codes):
+    """Check whether a response status code is a transient failure.
+
+    :param status_code: response status code
+    :type status_code: int
+    :param expected_status_codes: status codes expected on success
+    :type expected_status_codes: tuple(int)
+    :rtype: bool
+    """
+    return status_code not in expected_status_codes and \
+        status_code in RETRY_STATUS_CODES
+
+
+def backoff(attempt, response=None):
+    """Get delay before the next retry, counting it in the stats.
+
+    See `retry_delay`.
+
+    :return: delay in seconds
+    :rtype: float
+    """
+    delay = retry_delay(attempt, response)
+    stats.incr('retries')
+    stats.incr('backoff_seconds', delay)
+    return delay
+
+
+def retry_delay(attempt, response=None):
+    """Compute how long to wait before retrying a failed request.
+
+    Honours the `Retry-After` header of the response when present,
+    otherwise uses exponential backoff with full jitter.
+
+    :param attempt: number of the failed attempt, starting from 0
+    :type attempt: int
+    :param response: response that triggered the retry, if any
+    :type response: `requests.Response`, optional
+    :return: delay in seconds, never longer than `RETRY_BACKOFF_MAX`
+    :rtype: float
+    """
+    retry_after = response.headers.get('Retry-After') \
+        if response is not None else None
+
+    if retry_after:
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            try:
+                date = parsedate_to_datetime(retry_after)
+                delay = date.timestamp() - time.time()
+            except (TypeError, ValueError):
+                delay = None
+        if delay is not None:
+            return min(max(delay, 0), RETRY_BACKOFF_MAX)
+
+    return random.uniform(0, min(RETRY_BACKOFF * 2**attempt,
+                                 RETRY_BACKOFF_MAX))
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def create_session(pool_connections=POOL_CONNECTIONS,
+                   pool_maxsize=POOL_MAXSIZE,
+                   idle_timeout=POOL_IDLE_TIMEOUT):
+    """Create a new session with a keep-alive connection pool.
+
+    :param pool_connections: number of host pools to keep
+    :type pool_connections: int, optional
+    :param pool_maxsize: max number of connections kept per host
+    :type pool_maxsize: int, optional
+    :param idle_timeout: seconds after which idle connections are dropped
+    :type idle_timeout: float, optional
+    :return: session
+    :rtype: `requests.Session`
+    """
+    session = requests.Session()
+    adapter = PooledHTTPAdapter(
+        idle_timeout=idle_timeout,
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return session
+
+
+def get_session():
+    """Get the session shared by all API classes within the process."""
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            _session = create_session()
+
+        return _session
+
+
+def close_session():
+    """Close the shared session and its pooled connections."""
+    global _session
+
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of CERN Analysis Preservation Framework.
+# Copyright (C) 2020 CERN.
+#
+# CERN Analysis Preservation Framework is free software; you can redistribute
+# it and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# CERN Analysis Preservation Framework is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with CERN Analysis Preservation Framework; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+"""Batch operations read from a JSONL manifest.
+
+Every line of the manifest is a JSON object naming an operation in `op`
+and the analysis it applies to, either by `pid` or by `ref`. A `create`
+operation with a `ref` makes the new analysis available to the following
+operations with the same `ref`, eg.::
+
+    {"op": "create", "ref": "a1", "type": "cms-analysis", "data": {}}
+    {"op": "metadata.set", "ref": "a1", "field": "title", "value": "Z"}
+    {"op": "permissions.add", "ref": "a1", "email": "a@cern.ch",
+     "rights": ["read"]}
+    {"op": "files.upload", "pid": "b2c3", "file": "results.root"}
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from click import UsageError
+
+from cap_client import codec
+from cap_client.api import AnalysisAPI, FilesAPI, MetadataAPI, \
+    PermissionsAPI
+
+BATCH_WORKERS = int(os.environ.get('CAP_BATCH_WORKERS', 4))
+
+# operation -> required fields, besides pid/ref
+OPERATIONS = {
+    'create': ('data', ),
+    'metadata.set': ('value', ),
+    'metadata.remove': ('field', ),
+    'permissions.add': ('email', 'rights'),
+    'permissions.remove': ('email', 'rights'),
+    'files.upload': ('file', ),
+    'publish': (),
+    'delete': (),
+}
+
+BatchResult = namedtuple(
+    'BatchResult',
+    ['line', 'op', 'pid', 'status', 'result', 'error', 'elapsed'])
+
+
+def load_operations(lines):
+    """Parse and validate manifest lines.
+
+    :param lines: manifest lines, eg. an open file
+    :type lines: iterable(str)
+    :raises UsageError: when a line is not a valid operation
+    :return: operations, with their line number in `line`
+    :rtype: list(dict)
+    """
+    ops, refs = [], set()
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+
+        try:
+            op = codec.loads(line)
+        except ValueError:
+            raise UsageError('Line {}: not valid JSON.'.format(number))
+
+        if not isinstance(op, dict) or op.get('op') not in OPERATIONS:
+            raise UsageError(
+                'Line {}: unknown operation, use one of: {}.'.format(
+                    number, ', '.join(sorted(OPERATIONS))))
+
+        name = op['op']
+        if name == 'create' and 'pid' in op:
+            raise UsageError(
+                'Line {}: create accepts a ref, not a pid.'.format(number))
+        elif name == 'create' and 'ref' in op:
+            if op['ref'] in refs:
+                raise UsageError('Line {}: ref {} is already created.'.format(
+                    number, op['ref']))
+            refs.add(op['ref'])
+        elif 'ref' in op:
+            if 'pid' in op:
+                raise UsageError(
+                    'Line {}: pid and ref are mutually exclusive.'.format(
+                        number))
+            if op['ref'] not in refs:
+                raise UsageError(
+                    'Line {}: ref {} is not created before.'.format(
+                        number, op['ref']))
+
+        required = OPERATIONS[name] if name == 'create' or 'ref' in op \
+            else ('pid', ) + OPERATIONS[name]
+        missing = [f for f in required if f not in op]
+        if missing:
+            raise UsageError('Line {}: missing {}.'.format(
+                number, ', '.join(missing)))
+
+        op['line'] = number
+        ops.append(op)
+
+    return ops
+
+
+class BatchRunner(object):
+    """Run batch operations on a pool of threads sharing one session.
+
+    Operations on the same analysis (same `pid` or `ref`) run one after
+    another, in the order of the manifest, and once one of them fails the
+    following ones are skipped. Operations on different analyses run in
+    parallel, up to `workers` at a time.
+    """
+
+    def __init__(self, workers=BATCH_WORKERS):
+        """Initialize.
+
+        :param workers: number of analyses processed in parallel
+        :type workers: int
+        """
+        self.workers = workers
+        self.analysis = AnalysisAPI()
+        self.metadata = MetadataAPI()
+        self.permissions = PermissionsAPI()
+        self.files = FilesAPI()
+
+    def run(self, ops, callback=None):
+        """Run operations.
+
+        :param ops: operations, as returned by `load_operations`
+        :type ops: list(dict)
+        :param callback: called with `BatchResult` after every operation,
+        one call at a time
+        :type callback: callable, optional
+        :return: results in the order of operations
+        :rtype: list(`BatchResult`)
+        """
+        groups = OrderedDict()
+        for op in ops:
+            key = ('ref', op['ref']) if 'ref' in op else \
+                ('pid', op['pid']) if 'pid' in op else ('line', op['line'])
+            groups.setdefault(key, []).append(op)
+
+        results = {}
+        lock = threading.Lock()
+
+        def run_group(group):
+            pid, failed = None, False
+            for op in group:
+                pid = op.get('pid', pid)
+                result = self._run_one(op, pid) if not failed else \
+                    BatchResult(op['line'], op['op'], pid, 'skipped', None,
+                                'a previous operation failed', 0)
+
+                if op['op'] == 'create':
+                    pid = result.pid
+                failed = failed or result.status != 'ok'
+
+                with lock:
+                    results[op['line']] = result
+                    if callback:
+                        callback(result)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(run_group, g) for g in groups.values()]
+            for future in futures:
+                future.result()
+
+        return [results[op['line']] for op in ops]
+
+    def _run_one(self, op, pid):
+        start = time.time()
+        try:
+            value = self._apply(op, pid)
+        except Exception as e:
+            return BatchResult(op['line'], op['op'], pid, 'error', None,
+                               str(e) or e.__class__.__name__,
+                               time.time() - start)
+
+        if op['op'] == 'create':
+            pid, value = value, None
+
+        return BatchResult(op['line'], op['op'], pid, 'ok', value, None,
+                           time.time() - start)
+
+    def _apply(self, op, pid):
+        name = op['op']
+        if name == 'create':
+            res = self.analysis.create(op['data'], op.get('type'),
+                                       fetch=False)
+            return res.get('pid') or res['id']
+        elif name == 'metadata.set':
+            self.metadata.set(pid, op['value'], op.get('field'))
+        elif name == 'metadata.remove':
+            self.metadata.remove(pid, op['field'])
+        elif name == 'permissions.add':
+            self.permissions.add(pid, op['email'], op['rights'],
+                                 is_egroup=op.get('egroup', False))
+        elif name == 'permissions.remove':
+            self.permissions.remove(pid, op['email'], op['rights'],
+                                    is_egroup=op.get('egroup', False))
+        elif name == 'files.upload':
+            if os.path.isdir(op['file']):
+                self.files.upload_directory(
+                    pid, op['file'], output_filename=op.get('name'))
+            else:
+                self.files.upload_file(pid, op['file'],
+                                       output_filename=op.get('name'),
+                                       verify=op.get('verify', False))
+        elif name == 'publish':
+            return self.analysis.publish(pid)
+        elif name == 'delete':
+            self.analysis.delete(pid)
@@ -29,15 +29,32 @@ import sys
 import click
 
 from cap_client.version import __version__
-from cap_client.cli.analysis_cli import analysis
-from cap_client.cli.files_cli import files
-from cap_client.cli.metadata_cli import metadata
-from cap_client.cli.permissions_cli import permissions
-from cap_client.cli.repositories_cli import repositories
-from cap_client.utils import ColoredGroup
+from cap_client.utils import OUTPUT_FORMATS, LazyGroup, json_dumps
 
+# subcommands (and the HTTP stack) are imported only when invoked
+COMMANDS = {
+    'batch': ('cap_client.cli.batch_cli:batch',
+              'Run many operations from a manifest.'),
+    'analysis': ('cap_client.cli.analysis_cli:analysis',
+                 'Manage your analysis.'),
+    'files': ('cap_client.cli.files_cli:files',
+              'Manage analysis files.'),
+    'jobs': ('cap_client.cli.jobs_cli:jobs',
+             'Manage interrupted transfers and batches.'),
+    'metadata': ('cap_client.cli.metadata_cli:metadata',
+                 'Manage analysis metadata.'),
+    'permissions': ('cap_client.cli.permissions_cli:permissions',
+                    'Manage analysis permissions.'),
+    'repositories': ('cap_client.cli.repositories_cli:repositories',
+                     'Manage analysis repositories and webhooks.'),
+    'serve': ('cap_client.cli.shell_cli:serve',
+              'Run commands in a background daemon.'),
+    'shell': ('cap_client.cli.shell_cli:shell',
+              'Run commands in an interactive shell.'),
+}
 
-@click.group(cls=ColoredGroup)
+
+@click.group(cls=LazyGroup, lazy_commands=COMMANDS)
 @click.option(
     '--verbose',
     '-v',
@@ -52,9 +69,29 @@ from cap_client.utils import ColoredGroup
     type=click.Choice(['error', 'debug', 'info']),
     default='info',
 )
+@click.option(
+    '--stats',
+    is_flag=True,
+    default=False,
+    help='Print HTTP transport statistics on exit',
+)
+@click.option(
+    '--output',
+    type=click.Choice(OUTPUT_FORMATS),
+    default='json',
+    show_default=True,
+    help='Format of JSON output: indented, compact (single line) or ndjson '
+    '(list items one per line, as they come)',
+)
+@click.option(
+    '--cache/--no-cache',
+    default=None,
+    help='Cache server responses on disk and revalidate them '
+    '[default: CAP_HTTP_CACHE]',
+)
 @click.version_option(__version__, message='%(version)s')
 @click.pass_context
-def cli(ctx, loglevel, verbose):
+def cli(ctx, loglevel, verbose, stats, output, cache):
     """CAP command line interface."""
     if verbose:
         lvl = verbose
@@ -65,9 +102,14 @@ def cli(ctx, loglevel, verbose):
                         stream=sys.stderr,
                         level=lvl)
 
+    ctx.meta['output'] = output
+
+    if cache is not None:
+        from cap_client.api.cache import enable_http_cache
+        enable_http_cache(cache)
 
-cli.add_command(analysis)
-cli.add_command(files)
-cli.add_command(metadata)
-cli.add_command(permissions)
-cli.add_command(repositories)
+    if stats:
+        from cap_client.api.session import stats as transport_stats
+        ctx.call_on_close(
+            lambda: click.echo(json_dumps(transport_stats.snapshot()),
+                               err=True))
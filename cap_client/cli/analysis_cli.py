@@ -26,9 +26,11 @@
 import click
 
 from cap_client.api import AnalysisAPI
+from cap_client.api.analysis_api import CREATE_WORKERS, PAGE_WORKERS
+from cap_client.errors import CLIError
 from cap_client.utils import (
-    ColoredGroup, NotRequiredIf,
-    json_dumps, load_json, load_json_from_file, logger,
+    ColoredGroup, MultipleMutuallyExclusiveOptions, NotRequiredIf,
+    echo_json, echo_json_array, load_json, load_json_from_file, logger,
     pid_option, validate_version
 )
 
@@ -47,7 +49,7 @@ def types(api):
     """List all types of analysis you can create."""
     res = api.get_schema_types()
 
-    click.echo(json_dumps(res))
+    echo_json(res)
 
 
 @analysis.command()
@@ -74,7 +76,7 @@ def schema(api, analysis_type, version, for_published):
         record_schema=for_published,
     )
 
-    click.echo(json_dumps(res))
+    echo_json(res)
 
 
 @analysis.command()
@@ -121,16 +123,40 @@ def schema(api, analysis_type, version, for_published):
     type=click.INT,
     help='Number of results on a page. [default=10]',
 )
+@click.option(
+    '--all-pages',
+    is_flag=True,
+    default=False,
+    cls=MultipleMutuallyExclusiveOptions,
+    mutually_exclusive=['pid', 'page'],
+    help='Show results from all the pages, fetching --size of them with '
+    'every request. [default size: the largest accepted by the server]',
+)
+@click.option(
+    '--workers',
+    '-w',
+    type=click.IntRange(min=1),
+    default=PAGE_WORKERS,
+    show_default=True,
+    help='Number of pages fetched in parallel (with --all-pages).',
+)
 @logger
 @pass_api
-def get(api, pid, all, query, search, type, sort, page, size):
+def get(api, pid, all, query, search, type, sort, page, size, all_pages,
+        workers):
     """List your draft analysis."""
+    if all_pages:
+        echo_json_array(api.iter_drafts(all=all, query=query, search=search,
+                                        type=type, sort=sort, size=size,
+                                        workers=workers))
+        return
+
     if pid:
         res = api.get_draft_by_pid(pid)
     else:
         res = api.get_drafts(all=all, query=query, search=search, type=type, sort=sort, page=page, size=size)
 
-    click.echo(json_dumps(res))
+    echo_json(res)
 
 
 @analysis.command('get-published')
@@ -178,16 +204,41 @@ def get(api, pid, all, query, search, type, sort, page, size):
     type=click.INT,
     help='Number of results on a page. [default=10]',
 )
+@click.option(
+    '--all-pages',
+    is_flag=True,
+    default=False,
+    cls=MultipleMutuallyExclusiveOptions,
+    mutually_exclusive=['pid', 'page'],
+    help='Show results from all the pages, fetching --size of them with '
+    'every request. [default size: the largest accepted by the server]',
+)
+@click.option(
+    '--workers',
+    '-w',
+    type=click.IntRange(min=1),
+    default=PAGE_WORKERS,
+    show_default=True,
+    help='Number of pages fetched in parallel (with --all-pages).',
+)
 @logger
 @pass_api
-def get_published(api, pid, all, query, search, type, sort, page, size):
+def get_published(api, pid, all, query, search, type, sort, page, size,
+                  all_pages, workers):
     """List your published analysis."""
+    if all_pages:
+        echo_json_array(api.iter_published(all=all, query=query,
+                                           search=search, type=type,
+                                           sort=sort, size=size,
+                                           workers=workers))
+        return
+
     if pid:
         res = api.get_published_by_pid(pid)
     else:
         res = api.get_published(all=all, query=query, search=search, type=type, sort=sort, page=page, size=size)
 
-    click.echo(json_dumps(res))
+    echo_json(res)
 
 
 @analysis.command()
@@ -214,16 +265,36 @@ def get_published(api, pid, all, query, search, type, sort, page, size):
     default=None,
     help='Type of analysis',
 )
+@click.option(
+    '--workers',
+    '-w',
+    type=click.IntRange(min=1),
+    default=CREATE_WORKERS,
+    show_default=True,
+    help='Number of analyses created in parallel (with a JSON array).',
+)
 @logger
 @pass_api
-def create(api, jsonfile, json, type):
-    """Create an analysis."""
-    res = api.create(
-        data=jsonfile if json is None else json,
-        type_=type,
-    )
+def create(api, jsonfile, json, type, workers):
+    """Create an analysis, or many from an array."""
+    data = jsonfile if json is None else json
+
+    many = isinstance(data, list) and \
+        all(isinstance(item, dict) for item in data)
+    if not (many and data):
+        echo_json(api.create(data=data, type_=type))
+        return
+
+    results = api.create_many(data, type_=type, workers=workers)
+    for result in results:
+        if result.error:
+            click.secho('Analysis {}: failed ({})'.format(
+                result.index, result.error), fg='red', err=True)
+
+    echo_json([r.analysis for r in results if not r.error])
 
-    click.echo(json_dumps(res))
+    if any(r.error for r in results):
+        raise CLIError('Some of the analyses were not created.')
 
 
 @analysis.command()
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of CERN Analysis Preservation Framework.
+# Copyright (C) 2020 CERN.
+#
+# CERN Analysis Preservation Framework is free software; you can redistribute
+# it and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# CERN Analysis Preservation Framework is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with CERN Analysis Preservation Framework; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+"""Batch CAP Client CLI."""
+
+import os
+import time
+
+import click
+
+from cap_client.batch import BATCH_WORKERS, BatchRunner, load_operations
+from cap_client.errors import BatchError
+from cap_client.jobs import get_job_journal
+from cap_client.utils import ColoredGroup, json_dumps_compact, logger
+
+
+@click.group(cls=ColoredGroup)
+def batch():
+    """Run many operations from a manifest."""
+
+
+@batch.command()
+@click.argument('manifest', type=click.File('r'))
+@click.option(
+    '--workers',
+    '-w',
+    type=click.IntRange(1, None),
+    default=BATCH_WORKERS,
+    show_default=True,
+    help='Number of analyses processed in parallel.',
+)
+@click.option(
+    '--report',
+    '-r',
+    type=click.Path(dir_okay=False, writable=True),
+    help='File to write the NDJSON report to [default: stdout].',
+)
+@logger
+def run(manifest, workers, report):
+    """Run operations listed in a JSONL manifest.
+
+    Each line is an operation on an analysis given by `pid`, or by `ref`
+    of an analysis created earlier in the manifest: create, metadata.set,
+    metadata.remove, permissions.add, permissions.remove, files.upload,
+    publish or delete. Operations on one analysis run in order, different
+    analyses are processed in parallel.
+    """
+    ops = load_operations(manifest)
+    job = get_job_journal().create('batch', {
+        'ops': ops,
+        'workers': workers,
+        'report': os.path.abspath(report) if report else None,
+        'cwd': os.getcwd(),
+    })
+
+    run_batch_job(job)
+
+
+def run_batch_job(job, resume=False):
+    """Run the operations of a job, skipping the ones already done.
+
+    Analyses created by the operations done are passed on by their PIDs
+    to the following operations with the same `ref`, and files to upload
+    are found relative to the directory the job was started in. When
+    resuming, the report is appended to the one of the previous run.
+    """
+    done = job.done()
+    created = {op['ref']: done[str(op['line'])] for op in job.params['ops']
+               if op['op'] == 'create' and 'ref' in op
+               if str(op['line']) in done}
+
+    ops = []
+    for op in job.params['ops']:
+        if str(op['line']) in done:
+            continue
+        if op.get('ref') in created:
+            op = dict(op, pid=created[op['ref']])
+            del op['ref']
+        if op['op'] == 'files.upload':
+            op = dict(op, file=job.path(op['file']))
+        ops.append(op)
+
+    def write(result):
+        if result.status != 'skipped':
+            job.record(str(result.line),
+                       error=result.error,
+                       result=result.pid if result.op == 'create' else None)
+
+        line = {k: v for k, v in result._asdict().items() if v is not None}
+        line['elapsed'] = round(result.elapsed, 3)
+        click.echo(json_dumps_compact(line), file=report)
+
+    report = open(job.params['report'], 'a' if resume else 'w') \
+        if job.params['report'] else None
+    start = time.time()
+    try:
+        results = BatchRunner(job.params['workers']).run(ops, callback=write)
+    finally:
+        if report:
+            report.close()
+
+    counts = {s: sum(r.status == s for r in results)
+              for s in ('ok', 'error', 'skipped')}
+    click.echo('{} operations in {:.2f}s: {ok} ok, {error} failed, '
+               '{skipped} skipped.'.format(len(results),
+                                           time.time() - start, **counts),
+               err=True)
+
+    job.finish(failed=len(results) != counts['ok'])
+    if counts['error']:
+        raise BatchError('Some of the operations failed.\nRetry them with: '
+                         'cap-client jobs resume {}'.format(job.id))
@@ -24,15 +24,75 @@
 """Files CAP Client CLI."""
 
 import os
+import time
 
 import click
 
 from cap_client.api import FilesAPI
-from cap_client.utils import ColoredGroup, json_dumps, logger, pid_option
+from cap_client.api.files_api import DOWNLOAD_CHUNK_SIZE, TRANSFER_RETRIES, \
+    TRANSFER_WORKERS
+from cap_client.compression import COMPRESSIONS, DEFAULT_LEVEL
+from cap_client.errors import TransferError
+from cap_client.jobs import get_job_journal, record_transfers
+from cap_client.utils import (
+    ColoredGroup, MultipleMutuallyExclusiveOptions,
+    echo_json, echo_removal, echo_transfer, echo_transfer_summary,
+    expand_paths, logger, pid_option
+)
 
 pass_api = click.make_pass_decorator(FilesAPI, ensure=True)
 
 
+def run_download_job(api, job):
+    """Download the files of a job, skipping the ones already done."""
+    params = job.params
+
+    start = time.time()
+    results = api.download_many(params['pid'],
+                                pattern=params['pattern'],
+                                output_dir=job.path(params['output_dir']),
+                                workers=params['workers'],
+                                chunk_size=params['chunk_size'],
+                                verify=params['verify'],
+                                skip=job.done(),
+                                callback=record_transfers(job, echo_transfer))
+    echo_transfer_summary(results, time.time() - start)
+
+    finish_job(job, results, 'Some of the files failed to download.')
+
+
+def run_upload_job(api, job):
+    """Upload the files of a job, skipping the ones already done."""
+    params = job.params
+    done = job.done()
+
+    keys = {job.path(f): f
+            for f in params['filepaths'] if f not in done}
+
+    start = time.time()
+    results = api.upload_many(params['pid'],
+                              filepaths=list(keys),
+                              fnames=[os.path.basename(f) for f in keys],
+                              workers=params['workers'],
+                              retries=params['retries'],
+                              verify=params['verify'],
+                              callback=record_transfers(job, echo_transfer,
+                                                        keys))
+    echo_transfer_summary(results, time.time() - start)
+
+    finish_job(job, results, 'Some of the files failed to upload.')
+
+
+def finish_job(job, results, message):
+    """Mark transfer job as finished, raise if some of the files failed."""
+    failed = any(r.error for r in results)
+    job.finish(failed)
+
+    if failed:
+        raise TransferError('{}\nRetry them with: cap-client jobs resume '
+                            '{}'.format(message, job.id))
+
+
 @click.group(cls=ColoredGroup)
 def files():
     """Manage analysis files."""
@@ -46,7 +106,7 @@ def get(api, pid):
     """Get list of files attached to analysis with given PID."""
     res = api.get(pid=pid)
 
-    click.echo(json_dumps(res))
+    echo_json(res)
 
 
 @files.command()
@@ -56,6 +116,47 @@ def get(api, pid):
     '-o',
     help='Upload file as..',
 )
+@click.option(
+    '--workers',
+    '-w',
+    type=click.IntRange(min=1),
+    default=TRANSFER_WORKERS,
+    show_default=True,
+    help='Number of parallel uploads (with multiple files).',
+)
+@click.option(
+    '--retries',
+    type=click.IntRange(min=0),
+    default=TRANSFER_RETRIES,
+    show_default=True,
+    help='Number of retries of a failed upload (with multiple files).',
+)
+@click.option(
+    '--verify',
+    is_flag=True,
+    default=False,
+    help='Compare checksums of uploaded files with the local ones.',
+)
+@click.option(
+    '--stream',
+    is_flag=True,
+    default=False,
+    help='Upload directory tarball while it is being built, '
+    'without a temporary file.',
+)
+@click.option(
+    '--compression',
+    type=click.Choice(COMPRESSIONS),
+    default='gzip',
+    show_default=True,
+    help='Compression of directory tarballs.',
+)
+@click.option(
+    '--level',
+    type=click.IntRange(min=0, max=9),
+    help='Compression level of directory tarballs. [default={}]'.format(
+        DEFAULT_LEVEL),
+)
 @click.option(
     '--yes-i-know',
     is_flag=True,
@@ -64,12 +165,38 @@ def get(api, pid):
 )
 @click.argument(
     'file',
-    type=click.Path(exists=True),
+    nargs=-1,
+    required=True,
+    metavar='FILE',
+    callback=expand_paths,
 )
 @logger
 @pass_api
-def upload(api, pid, file, output_filename, yes_i_know):
-    """Upload a file to your analysis."""
+def upload(api, pid, file, output_filename, workers, retries, verify, stream,
+           compression, level, yes_i_know):
+    """Upload files (or glob patterns) to your analysis."""
+    if len(file) > 1:
+        if output_filename:
+            raise click.UsageError(
+                '--output-filename cannot be used with multiple files.')
+        dirs = [f for f in file if os.path.isdir(f)]
+        if dirs:
+            raise click.UsageError(
+                'Directories can only be uploaded one at a time: {}.'.format(
+                    ', '.join(dirs)))
+
+        job = get_job_journal().create('files.upload', {
+            'pid': pid,
+            'filepaths': list(file),
+            'cwd': os.getcwd(),
+            'workers': workers,
+            'retries': retries,
+            'verify': verify,
+        })
+        run_upload_job(api, job)
+        return
+
+    file = file[0]
     if os.path.isdir(file):
         if yes_i_know or click.confirm(
                 '{} is a directory. Do you want to upload a tarball?'.format(
@@ -78,12 +205,16 @@ def upload(api, pid, file, output_filename, yes_i_know):
                 pid=pid,
                 filepath=file,
                 output_filename=output_filename,
+                stream=stream,
+                compression=compression,
+                level=level,
             )
     else:
         api.upload_file(
             pid=pid,
             filepath=file,
             output_filename=output_filename,
+            verify=verify,
         )
 
     click.echo("File uploaded successfully.")
@@ -95,19 +226,88 @@ def upload(api, pid, file, output_filename, yes_i_know):
     '--output-file',
     '-o',
     type=click.Path(exists=False),
+    cls=MultipleMutuallyExclusiveOptions,
+    mutually_exclusive=['all', 'pattern', 'output_dir'],
     help='Download file as..',
 )
+@click.option(
+    '--all',
+    is_flag=True,
+    default=False,
+    cls=MultipleMutuallyExclusiveOptions,
+    mutually_exclusive=['pattern'],
+    help='Download all the files of the analysis.',
+)
+@click.option(
+    '--pattern',
+    help='Download all the files matching the glob, eg. "*.root".',
+)
+@click.option(
+    '--output-dir',
+    '-d',
+    type=click.Path(exists=True, file_okay=False),
+    default='.',
+    help='Directory to save the files in (with --all/--pattern).',
+)
+@click.option(
+    '--workers',
+    '-w',
+    type=click.IntRange(min=1),
+    default=TRANSFER_WORKERS,
+    show_default=True,
+    help='Number of parallel downloads (with --all/--pattern).',
+)
+@click.option(
+    '--chunk-size',
+    type=click.IntRange(min=1),
+    default=DOWNLOAD_CHUNK_SIZE,
+    show_default=True,
+    help='Size of the chunks streamed to disk (bytes).',
+)
+@click.option(
+    '--verify',
+    is_flag=True,
+    default=False,
+    help='Compare checksums of downloaded files with the ones on the '
+    'server, remove the files that do not match.',
+)
 @click.option(
     '--yes-i-know',
     is_flag=True,
     default=False,
     help="Bypasses prompts..Say YES to everything",
 )
-@click.argument('filename')
+@click.argument('filename', required=False)
 @logger
 @pass_api
-def download(api, pid, filename, output_file, yes_i_know):
+def download(api, pid, filename, output_file, all, pattern, output_dir,
+             workers, chunk_size, verify, yes_i_know):
     """Download file uploaded with given deposit."""
+    if all or pattern:
+        if filename:
+            raise click.UsageError(
+                'FILENAME cannot be used together with --all/--pattern.')
+
+        if not os.path.isdir(output_dir):
+            raise click.UsageError(
+                'Directory {} does not exist.'.format(output_dir))
+
+        job = get_job_journal().create('files.download', {
+            'pid': pid,
+            'pattern': pattern or '*',
+            'output_dir': output_dir,
+            'cwd': os.getcwd(),
+            'workers': workers,
+            'chunk_size': chunk_size,
+            'verify': verify,
+        })
+        run_download_job(api, job)
+        return
+
+    if not filename:
+        raise click.MissingParameter(param_type='argument',
+                                     param_hint="'FILENAME'")
+
     if not yes_i_know:
         path = output_file or filename
         if os.path.exists(path):
@@ -118,7 +318,8 @@ def download(api, pid, filename, output_file, yes_i_know):
                     show_default=True):
                 click.echo("Aborting download of {}".format(output_file or filename))
                 return
-    api.download(pid, filename, output_file)
+    api.download(pid, filename, output_file, chunk_size=chunk_size,
+                 verify=verify)
 
     click.echo("File saved as {}".format(output_file or filename))
 
@@ -133,3 +334,66 @@ def remove(api, pid, filename):
     api.remove(pid=pid, filename=filename)
 
     click.echo("File {} removed.".format(filename))
+
+
+@files.command()
+@pid_option(required=True)
+@click.option(
+    '--delete',
+    is_flag=True,
+    default=False,
+    help='Remove files of the analysis that do not exist locally.',
+)
+@click.option(
+    '--dry-run',
+    is_flag=True,
+    default=False,
+    help='Only show what would be uploaded/removed.',
+)
+@click.option(
+    '--workers',
+    '-w',
+    type=click.IntRange(min=1),
+    default=TRANSFER_WORKERS,
+    show_default=True,
+    help='Number of parallel transfers.',
+)
+@click.argument(
+    'localdir',
+    type=click.Path(exists=True, file_okay=False),
+)
+@logger
+@pass_api
+def sync(api, pid, localdir, delete, dry_run, workers):
+    """Upload new or changed files of a local directory to your analysis."""
+    plan = api.sync_plan(pid, localdir, delete=delete)
+
+    if dry_run:
+        for filename in plan.upload:
+            click.echo('upload: {}'.format(filename))
+        for filename in plan.remove:
+            click.echo('remove: {}'.format(filename))
+    else:
+        start = time.time()
+        results = []
+        if plan.upload:
+            results += api.upload_many(pid,
+                                       filepaths=list(plan.upload.values()),
+                                       fnames=list(plan.upload),
+                                       workers=workers,
+                                       callback=echo_transfer)
+        if plan.remove:
+            results += api.remove_many(pid,
+                                       plan.remove,
+                                       workers=workers,
+                                       callback=echo_removal)
+
+        if results:
+            echo_transfer_summary(results, time.time() - start)
+        if any(r.error for r in results):
+            raise TransferError('Some of the files failed to synchronize.')
+
+    click.echo('{} {}, {} {}, {} unchanged.'.format(
+        len(plan.upload), 'to upload' if dry_run else 'uploaded',
+        len(plan.remove), 'to remove' if dry_run else 'removed',
+        plan.unchanged))
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of CERN Analysis Preservation Framework.
+# Copyright (C) 2020 CERN.
+#
+# CERN Analysis Preservation Framework is free software; you can redistribute
+# it and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# CERN Analysis Preservation Framework is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with CERN Analysis Preservation Framework; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+"""Jobs CAP Client CLI."""
+
+import click
+
+from cap_client.api import FilesAPI
+from cap_client.cli.batch_cli import run_batch_job
+from cap_client.cli.files_cli import run_download_job, run_upload_job
+from cap_client.jobs import JOB_RETENTION_COUNT, JOB_RETENTION_DAYS, \
+    get_job_journal
+from cap_client.utils import ColoredGroup, echo_json, logger
+
+
+def get_job(job_id):
+    """Get job from the journal, fail if there is no such job."""
+    job = get_job_journal().get(job_id)
+    if job is None:
+        raise click.UsageError('Job {} does not exist.'.format(job_id))
+
+    return job
+
+
+@click.group(cls=ColoredGroup)
+def jobs():
+    """Manage interrupted transfers and batches."""
+
+
+@jobs.command(name='list')
+@click.option(
+    '--limit',
+    type=click.IntRange(min=1),
+    default=20,
+    show_default=True,
+    help='Number of most recent jobs to list.',
+)
+@logger
+def list_(limit):
+    """List recent jobs."""
+    echo_json(get_job_journal().list(limit=limit))
+
+
+@jobs.command()
+@click.argument('job_id', type=int)
+@logger
+def show(job_id):
+    """Show job parameters and progress."""
+    job = get_job(job_id)
+
+    echo_json(dict(job.summary(), params=job.params, units=job.units()))
+
+
+@jobs.command()
+@click.option(
+    '--older-than',
+    type=click.FloatRange(min=0),
+    default=JOB_RETENTION_DAYS,
+    show_default=True,
+    help='Delete finished jobs not updated for this many days '
+    '(CAP_JOB_RETENTION_DAYS).',
+)
+@click.option(
+    '--keep',
+    type=click.IntRange(min=0),
+    default=JOB_RETENTION_COUNT,
+    show_default=True,
+    help='Number of most recent finished jobs to keep '
+    '(CAP_JOB_RETENTION_COUNT).',
+)
+@logger
+def prune(older_than, keep):
+    """Delete old finished jobs, print their IDs."""
+    echo_json(get_job_journal().prune(max_age=older_than, keep=keep))
+
+
+@jobs.command()
+@click.argument('job_id', type=int)
+@logger
+def resume(job_id):
+    """Resume job, skipping the units already done."""
+    job = get_job(job_id)
+    if job.summary()['state'] == 'complete':
+        raise click.UsageError('Job {} is already complete.'.format(job_id))
+
+    if job.kind == 'batch':
+        run_batch_job(job, resume=True)
+    elif job.kind == 'files.download':
+        run_download_job(FilesAPI(), job)
+    elif job.kind == 'files.upload':
+        run_upload_job(FilesAPI(), job)
@@ -26,8 +26,10 @@
 import click
 
 from cap_client.api.metadata_api import MetadataAPI
-from cap_client.utils import (ColoredGroup, NotRequiredIf,
-                              json_dumps, load_json, load_json_from_file,
+from cap_client.jsonpatch import field_pointer
+from cap_client.utils import (ColoredGroup, NotRequiredIf, echo_json,
+                              load_assignments, load_json,
+                              load_json_from_file, load_json_patch_from_file,
                               load_num, logger, pid_option)
 
 pass_api = click.make_pass_decorator(MetadataAPI, ensure=True)
@@ -76,9 +78,15 @@ def metadata():
     callback=load_num,
     help='\nNumeric data.',
 )
+@click.option(
+    '--diff',
+    is_flag=True,
+    default=False,
+    help='Send only the changes to the current metadata, as a JSON Patch.',
+)
 @pass_api
 @logger
-def update(api, pid, json, jsonfile, text, num, field):
+def update(api, pid, json, jsonfile, text, num, field, diff):
     """Update analysis metadata."""
     value = [
         option for option in [json, jsonfile, text, num] if option is not None
@@ -88,9 +96,69 @@ def update(api, pid, json, jsonfile, text, num, field):
         pid=pid,
         value=value,
         field=field,
+        diff=diff,
+    )
+
+    echo_json(res)
+
+
+@metadata.command()
+@pid_option(required=True)
+@click.option(
+    '--set',
+    'set_',
+    multiple=True,
+    metavar='FIELD=VALUE',
+    callback=load_assignments,
+    help='Replace an EXISTING field, eg. basic_info.abstract="new". '
+    'VALUE is JSON, or text. Can be repeated.',
+)
+@click.option(
+    '--add',
+    multiple=True,
+    metavar='FIELD=VALUE',
+    callback=load_assignments,
+    help='Add a field, or insert into an array, eg. people.0={"name": "x"} '
+    '(people.- appends). Can be repeated.',
+)
+@click.option(
+    '--remove',
+    multiple=True,
+    metavar='FIELD',
+    help='Remove a field, eg. basic_info.ana_notes.0. Can be repeated.',
+)
+@click.option(
+    '--patch-file',
+    type=click.File('r'),
+    callback=load_json_patch_from_file,
+    help='JSON Patch file, applied before the other changes.',
+)
+@pass_api
+@logger
+def patch(api, pid, set_, add, remove, patch_file):
+    """Apply many changes in a single request."""
+    operations = list(patch_file)
+    operations += [{
+        'op': 'replace',
+        'path': field_pointer(field),
+        'value': value
+    } for field, value in set_]
+    operations += [{
+        'op': 'add',
+        'path': field_pointer(field),
+        'value': value
+    } for field, value in add]
+    operations += [{
+        'op': 'remove',
+        'path': field_pointer(field)
+    } for field in remove]
+
+    res = api.patch(
+        pid=pid,
+        operations=operations,
     )
 
-    click.echo(json_dumps(res))
+    echo_json(res)
 
 
 @metadata.command()
@@ -109,7 +177,7 @@ def remove(api, pid, field):
         field=field,
     )
 
-    click.echo(json_dumps(res))
+    echo_json(res)
 
 
 @metadata.command()
@@ -127,4 +195,4 @@ def get(api, pid, field):
         field=field,
     )
 
-    click.echo(json_dumps(res))
+    echo_json(res)
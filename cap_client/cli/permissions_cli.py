@@ -28,7 +28,7 @@ import click
 from cap_client.api import PermissionsAPI
 from cap_client.utils import (
     ColoredGroup, NotRequiredIf,
-    json_dumps, logger, pid_option
+    echo_json, logger, pid_option
 )
 
 pass_api = click.make_pass_decorator(PermissionsAPI, ensure=True)
@@ -47,7 +47,7 @@ def get(api, pid):
     """List analysis permissions."""
     res = api.get(pid=pid)
 
-    click.echo(json_dumps(res))
+    echo_json(res)
 
 
 @permissions.command()
@@ -84,7 +84,7 @@ def add(api, pid, rights, user, egroup):
         is_egroup=egroup and True,
     )
 
-    click.echo(json_dumps(res))
+    echo_json(res)
 
 
 @permissions.command()
@@ -121,4 +121,4 @@ def remove(api, pid, rights, user, egroup):
         is_egroup=egroup and True,
     )
 
-    click.echo(json_dumps(res))
+    echo_json(res)
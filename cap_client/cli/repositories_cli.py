@@ -26,7 +26,7 @@
 import click
 
 from cap_client.api import RepositoriesAPI
-from cap_client.utils import ColoredGroup, json_dumps, logger, pid_option
+from cap_client.utils import ColoredGroup, echo_json, logger, pid_option
 
 pass_api = click.make_pass_decorator(RepositoriesAPI, ensure=True)
 
@@ -54,7 +54,7 @@ def get(api, pid, with_snapshots):
         with_snapshots=with_snapshots,
     )
 
-    click.echo(json_dumps(res))
+    echo_json(res)
 
 
 @repositories.command()
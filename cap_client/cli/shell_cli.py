@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of CERN Analysis Preservation Framework.
+# Copyright (C) 2020 CERN.
+#
+# CERN Analysis Preservation Framework is free software; you can redistribute
+# it and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# CERN Analysis Preservation Framework is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with CERN Analysis Preservation Framework; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+"""Shell and daemon CAP Client CLI."""
+
+import shlex
+import socket
+
+import click
+
+from cap_client.daemon import SOCKET_ENV, is_running, run_command, serve \
+    as serve_forever
+
+
+@click.command()
+def shell():
+    """Run commands in an interactive shell."""
+    try:
+        import readline  # noqa: F401 (line editing and history)
+    except ImportError:
+        pass
+
+    click.echo('Type `help` to list the commands, `exit` to quit.')
+    while True:
+        try:
+            line = input('cap> ')
+        except EOFError:
+            break
+        except KeyboardInterrupt:
+            click.echo()
+            continue
+
+        try:
+            args = shlex.split(line)
+        except ValueError as e:
+            click.secho(str(e), fg='red', err=True)
+            continue
+
+        if not args:
+            continue
+        elif args[0] in ('exit', 'quit'):
+            break
+        elif args[0] == 'help':
+            args = ['--help']
+
+        run_command(args)
+
+
+@click.command()
+@click.option(
+    '--socket',
+    'path',
+    envvar=SOCKET_ENV,
+    required=True,
+    type=click.Path(dir_okay=False),
+    help='Path of the Unix socket to listen on [default: {}]'.format(
+        SOCKET_ENV),
+)
+def serve(path):
+    """Run commands in a background daemon."""
+    if not hasattr(socket, 'AF_UNIX'):
+        raise click.UsageError('The daemon requires Unix sockets.')
+    if is_running(path):
+        raise click.UsageError(
+            'A daemon is already listening on {}.'.format(path))
+
+    click.echo('Listening on {}, commands run with {}={} are sent '
+               'here.'.format(path, SOCKET_ENV, path), err=True)
+    try:
+        serve_forever(path)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of CERN Analysis Preservation Framework.
+# Copyright (C) 2020 CERN.
+#
+# CERN Analysis Preservation Framework is free software; you can redistribute
+# it and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# CERN Analysis Preservation Framework is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with CERN Analysis Preservation Framework; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+"""JSON codec using a fast backend when available.
+
+`orjson` is used if installed (unless `CAP_JSON_BACKEND=json`), the
+standard library otherwise. Data the fast backend cannot handle (eg.
+integers over 64 bits, non-string keys, NaN) falls back to the standard
+library, so both backends accept the same documents. The only difference
+is that `orjson` encodes NaN and infinity, which are not valid JSON, as
+null.
+
+Only data exchanged with the server goes through the codec, output shown
+to the user is still formatted by the standard library.
+"""
+
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_BACKEND = 'orjson' if orjson is not None and \
+    os.environ.get('CAP_JSON_BACKEND') != 'json' else 'json'
+
+
+def dumps(obj, sort_keys=False):
+    """Serialize object to compact JSON.
+
+    :param obj: JSON serializable object
+    :param sort_keys: sort object keys, eg. to compare documents
+    :type sort_keys: bool, optional
+    :return: UTF-8 encoded JSON
+    :rtype: bytes
+    """
+    if JSON_BACKEND == 'orjson':
+        try:
+            return orjson.dumps(
+                obj, option=orjson.OPT_SORT_KEYS if sort_keys else None)
+        except TypeError:
+            pass
+
+    return json.dumps(obj, ensure_ascii=False, sort_keys=sort_keys,
+                      separators=(',', ':')).encode('utf-8')
+
+
+def loads(data):
+    """Deserialize JSON document.
+
+    :param data: JSON document
+    :type data: bytes or str
+    :raises ValueError: when data is not a valid JSON
+    :return: deserialized object
+    """
+    if JSON_BACKEND == 'orjson':
+        try:
+            return orjson.loads(data)
+        except ValueError:
+            pass
+
+    return json.loads(data)
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of CERN Analysis Preservation Framework.
+# Copyright (C) 2020 CERN.
+#
+# CERN Analysis Preservation Framework is free software; you can redistribute
+# it and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# CERN Analysis Preservation Framework is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with CERN Analysis Preservation Framework; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+"""Compressed streams used for directory tarballs."""
+
+import gzip
+import lzma
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+COMPRESSIONS = ['gzip', 'xz', 'none', 'parallel-gzip']
+
+EXTENSIONS = {
+    'gzip': '.tar.gz',
+    'parallel-gzip': '.tar.gz',
+    'xz': '.tar.xz',
+    'none': '.tar',
+}
+
+DEFAULT_LEVEL = 6
+
+
+class ParallelGzipWriter(object):
+    """Gzip writer compressing blocks of data on a thread pool.
+
+    Like pigz, every block is deflated separately (primed with the last
+    32 KB of the previous block) and flushed to a byte boundary, so the
+    blocks concatenate into a single standard gzip member.
+    """
+
+    def __init__(self, fileobj, level=DEFAULT_LEVEL, block_size=1024 * 1024,
+                 workers=None):
+        """Initialize."""
+        self.fileobj = fileobj
+        self.level = level
+        self.block_size = block_size
+        self.workers = workers or os.cpu_count() or 1
+
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        self._pending = deque()
+        self._buffer = bytearray()
+        self._dictionary = b''
+        self._crc = 0
+        self._size = 0
+        self._closed = False
+
+        # magic, deflate, no flags, no mtime, no extra flags, unknown OS
+        self.fileobj.write(b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff')
+
+    def write(self, data):
+        """Compress data."""
+        self._buffer.extend(data)
+        while len(self._buffer) >= self.block_size:
+            block = bytes(self._buffer[:self.block_size])
+            del self._buffer[:self.block_size]
+            self._submit(block, last=False)
+
+        return len(data)
+
+    def flush(self):
+        """Nothing to do, blocks are written once compressed."""
+
+    def close(self):
+        """Compress remaining data and write the gzip trailer."""
+        if self._closed:
+            return
+        self._closed = True
+
+        self._submit(bytes(self._buffer), last=True)
+        while self._pending:
+            self.fileobj.write(self._pending.popleft().result())
+        self._executor.shutdown()
+
+        self.fileobj.write(struct.pack('<II', self._crc & 0xffffffff,
+                                       self._size & 0xffffffff))
+
+    def _submit(self, block, last):
+        self._crc = zlib.crc32(block, self._crc)
+        self._size += len(block)
+        self._pending.append(self._executor.submit(
+            _deflate, block, self._dictionary, self.level, last))
+        self._dictionary = block[-32768:]
+
+        # keep a bounded number of blocks in memory
+        while len(self._pending) > 2 * self.workers:
+            self.fileobj.write(self._pending.popleft().result())
+
+    def __enter__(self):
+        """Enter context."""
+        return self
+
+    def __exit__(self, *args):
+        """Close on exit."""
+        self.close()
+
+
+def _deflate(block, dictionary, level, last):
+    """Deflate block as a part of a raw deflate stream."""
+    if dictionary:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS,
+                                      zdict=dictionary)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+
+    return compressor.compress(block) + compressor.flush(
+        zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+class _Uncompressed(object):
+    """Pass-through writer which does not close the underlying file."""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+
+    def write(self, data):
+        return self.fileobj.write(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def open_compressed(fileobj, compression='gzip', level=None):
+    """Open a writer compressing data into fileobj.
+
+    Closing the writer finishes the compressed stream but leaves fileobj
+    open.
+
+    :param fileobj: writable file object
+    :type fileobj: file
+    :param compression: one of `COMPRESSIONS`
+    :type compression: str, optional
+    :param level: compression level (0-9), xz preset for `xz`
+    :type level: int, optional
+    :return: writable file object
+    """
+    level = DEFAULT_LEVEL if level is None else level
+
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=level)
+    elif compression == 'parallel-gzip':
+        return ParallelGzipWriter(fileobj, level=level)
+    elif compression == 'xz':
+        return lzma.LZMAFile(fileobj, mode='wb', preset=level)
+    elif compression == 'none':
+        return _Uncompressed(fileobj)
+
+    raise ValueError('Unknown compression {}.'.format(compression))
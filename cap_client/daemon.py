@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of CERN Analysis Preservation Framework.
+# Copyright (C) 2020 CERN.
+#
+# CERN Analysis Preservation Framework is free software; you can redistribute
+# it and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# CERN Analysis Preservation Framework is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with CERN Analysis Preservation Framework; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+"""Run CLI commands in a long-lived process.
+
+`cap-client serve` listens on a Unix socket and runs the commands sent by
+`main` (the `cap-client` entry point) in its own process, so they reuse
+imported modules, open connections and caches. Only the standard library is
+imported before a command is forwarded, and output is streamed back as
+newline delimited JSON frames (`{"stdout": ..}`, `{"stderr": ..}`, and
+finally `{"exit": code}`).
+"""
+
+import io
+import json
+import logging
+import os
+import socket
+import socketserver
+import sys
+
+SOCKET_ENV = 'CAP_CLIENT_SOCKET'
+
+# commands that always run in the calling process
+LOCAL_COMMANDS = {'serve', 'shell'}
+
+# settings of the client passed to the daemon, the others (eg. retries,
+# pool sizes, cache location) are read once, when the daemon starts
+FORWARDED_ENV = ('CAP_SERVER_URL', 'CAP_SERVER_API_PATH', 'CAP_ACCESS_TOKEN')
+
+# commands asking for confirmation, unless run with --yes-i-know
+PROMPTING_COMMANDS = {'files': {'download', 'upload'}}
+
+
+def run_command(args):
+    """Run a CLI command in this process.
+
+    :param args: command line arguments, without the program name
+    :type args: list(str)
+    :return: exit code
+    :rtype: int
+    """
+    from cap_client.api.cache import enable_http_cache
+    from cap_client.api.session import stats
+    from cap_client.cli import cli
+
+    # global options of the previous command must not leak into this one
+    for handler in logging.root.handlers[:]:
+        logging.root.removeHandler(handler)
+    enable_http_cache(None)
+    stats.reset()
+
+    try:
+        cli.main(args=args, prog_name='cap-client')
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        sys.stderr.write('{}\n'.format(e.code))
+    except Exception as e:
+        logging.debug(e, exc_info=True)
+        sys.stderr.write('The client encountered an unexpected error.\n')
+
+    return 1
+
+
+def _frame(data):
+    return json.dumps(data).encode('utf-8') + b'\n'
+
+
+class _FrameWriter(io.TextIOBase):
+    """Text stream sending everything written to it to the client."""
+
+    encoding = 'utf-8'
+
+    def __init__(self, wfile, key):
+        self.wfile = wfile
+        self.key = key
+
+    def writable(self):
+        return True
+
+    def isatty(self):
+        return False
+
+    def write(self, text):
+        if isinstance(text, (bytes, bytearray)):
+            text = text.decode('utf-8', 'replace')
+        if text and self.wfile is not None:
+            try:
+                self.wfile.write(_frame({self.key: text}))
+            except OSError:
+                # client went away, let the command finish anyway
+                self.wfile = None
+        return len(text)
+
+
+class _CommandHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        request = json.loads(self.rfile.readline().decode('utf-8'))
+        code = self.server.run(request, self.wfile)
+        try:
+            self.wfile.write(_frame({'exit': code}))
+        except OSError:
+            pass
+
+
+class CommandServer(socketserver.UnixStreamServer):
+    """Unix socket server running the received commands one at a time.
+
+    Each command runs with the server settings (`FORWARDED_ENV`), working
+    directory and standard streams of the client which sent it.
+    """
+
+    def __init__(self, path):
+        """Bind the socket, readable by the current user only.
+
+        :param path: socket path
+        :type path: str
+        """
+        umask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.__init__(self, path,
+                                                   _CommandHandler)
+        finally:
+            os.umask(umask)
+
+    def run(self, request, wfile):
+        """Run a command received from a client.
+
+        :param request: `args`, `env`, `cwd` and optionally `stdin`
+        :type request: dict
+        :param wfile: socket file to stream output to
+        :return: exit code
+        :rtype: int
+        """
+        environ, cwd = dict(os.environ), os.getcwd()
+        streams = sys.stdin, sys.stdout, sys.stderr
+
+        env = request.get('env', {})
+        for key in FORWARDED_ENV:
+            os.environ.pop(key, None)
+            if key in env:
+                os.environ[key] = env[key]
+
+        try:
+            os.chdir(request.get('cwd', cwd))
+            sys.stdin = io.StringIO(request.get('stdin', ''))
+            sys.stdout = _FrameWriter(wfile, 'stdout')
+            sys.stderr = _FrameWriter(wfile, 'stderr')
+
+            return run_command(request['args'])
+        finally:
+            sys.stdin, sys.stdout, sys.stderr = streams
+            os.chdir(cwd)
+            os.environ.clear()
+            os.environ.update(environ)
+
+
+def is_running(path):
+    """Check whether a daemon is listening on the socket.
+
+    :param path: socket path
+    :type path: str
+    :rtype: bool
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+    return True
+
+
+def serve(path):
+    """Serve commands on a Unix socket until interrupted.
+
+    :param path: socket path, a stale socket left there is replaced
+    :type path: str
+    """
+    if os.path.exists(path):
+        os.remove(path)
+
+    server = CommandServer(path)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(path)
+
+
+def forward(path, args):
+    """Run a command in the daemon, printing its output.
+
+    Standard input is sent along only when the command reads it (`-`).
+
+    :param path: socket path
+    :type path: str
+    :param args: command line arguments, without the program name
+    :type args: list(str)
+    :return: exit code, None when no daemon is listening
+    :rtype: int or None
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+
+    request = {
+        'args': args,
+        'cwd': os.getcwd(),
+        'env': {k: os.environ[k] for k in FORWARDED_ENV if k in os.environ},
+    }
+    if '-' in args:
+        request['stdin'] = sys.stdin.read()
+
+    with sock, sock.makefile('rwb') as fp:
+        fp.write(_frame(request))
+        fp.flush()
+
+        for line in fp:
+            frame = json.loads(line.decode('utf-8'))
+            if 'exit' in frame:
+                return frame['exit']
+
+            stream = sys.stdout if 'stdout' in frame else sys.stderr
+            stream.write(frame.get('stdout', frame.get('stderr')))
+            stream.flush()
+
+    sys.stderr.write('Connection to the cap-client daemon was lost.\n')
+    return 1
+
+
+def may_prompt(args):
+    """Check whether a command can ask the user for confirmation.
+
+    The daemon has no terminal to ask on, so such commands are not
+    forwarded to it.
+
+    :param args: command line arguments, without the program name
+    :type args: list(str)
+    :rtype: bool
+    """
+    if '--yes-i-know' in args:
+        return False
+
+    return any(group in args and commands & set(args)
+               for group, commands in PROMPTING_COMMANDS.items())
+
+
+def main():
+    """Entry point of `cap-client`.
+
+    Commands are forwarded to the daemon listening on `CAP_CLIENT_SOCKET`,
+    or run in this process when there is none, or when they may need to
+    ask for confirmation.
+    """
+    args = sys.argv[1:]
+    path = os.environ.get(SOCKET_ENV)
+
+    if path and hasattr(socket, 'AF_UNIX') and \
+            not LOCAL_COMMANDS & set(args) and not may_prompt(args):
+        code = forward(path, args)
+        if code is not None:
+            sys.exit(code)
+
+    from cap_client.cli import cli
+    cli()
@@ -74,3 +74,23 @@ class BadStatusCode(CLIError):
         """Show exception details to the user."""
         logging.debug(self.data)
         super(BadStatusCode, self).show()
+
+
+class TransferError(CLIError):
+    """File transfer did not complete."""
+
+    def __init__(self, message=''):
+        """Initialize TransferError."""
+        self.message = message
+
+
+class ChecksumMismatch(TransferError):
+    """Checksum of transferred file does not match."""
+
+
+class BatchError(CLIError):
+    """Some of the batch operations failed."""
+
+    def __init__(self, message=''):
+        """Initialize BatchError."""
+        self.message = message
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of CERN Analysis Preservation Framework.
+# Copyright (C) 2020 CERN.
+#
+# CERN Analysis Preservation Framework is free software; you can redistribute
+# it and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# CERN Analysis Preservation Framework is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with CERN Analysis Preservation Framework; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+"""Local file hashing with a persistent index of computed digests."""
+
+import hashlib
+import mmap
+import os
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from cap_client.utils import cache_dir, private_file
+
+ALGORITHMS = ('md5', 'sha256')
+HASH_BLOCK_SIZE = 8 * 1024 * 1024
+# below this total size hashing in a process pool does not pay off
+PARALLEL_HASH_THRESHOLD = 64 * 1024 * 1024
+
+
+def file_digests(filepath, algorithms=('md5', ), block_size=HASH_BLOCK_SIZE):
+    """Compute digests of a file in a single pass.
+
+    The file is memory mapped and fed to the hash functions in large
+    blocks (hashlib releases the GIL while hashing them).
+
+    :param filepath: path to the file
+    :type filepath: str
+    :param algorithms: hash algorithms, see `ALGORITHMS`
+    :type algorithms: tuple(str), optional
+    :return: hex digests, keyed by algorithm
+    :rtype: dict
+    """
+    hashes = [hashlib.new(algo) for algo in algorithms]
+
+    with open(filepath, 'rb') as fp:
+        if os.fstat(fp.fileno()).st_size:
+            with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                view = memoryview(mm)
+                try:
+                    for offset in range(0, len(view), block_size):
+                        block = view[offset:offset + block_size]
+                        for h in hashes:
+                            h.update(block)
+                        block.release()
+                finally:
+                    view.release()
+
+    return {algo: h.hexdigest() for algo, h in zip(algorithms, hashes)}
+
+
+def file_md5(filepath):
+    """Compute MD5 digest of a file.
+
+    :param filepath: path to the file
+    :type filepath: str
+    :return: hex digest
+    :rtype: str
+    """
+    return file_digests(filepath)['md5']
+
+
+class HashCache(object):
+    """Index of digests of local files, kept in a SQLite database.
+
+    Entries are keyed by (device, inode) and valid as long as the size
+    and the modification time of the file do not change, so renamed or
+    moved files are not hashed again either.
+    """
+
+    def __init__(self, filepath=None):
+        """Initialize."""
+        self.filepath = filepath or os.path.join(cache_dir(), 'hashes.db')
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(private_file(self.filepath),
+                                   check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS hashes ('
+            'device INTEGER, inode INTEGER, size INTEGER, mtime INTEGER, '
+            'md5 TEXT, sha256 TEXT, PRIMARY KEY (device, inode))')
+
+    def get(self, filepath, algorithm='md5'):
+        """Get digest of a file, hashing it only if not in the index.
+
+        :param filepath: path to the file
+        :type filepath: str
+        :param algorithm: hash algorithm, see `ALGORITHMS`
+        :type algorithm: str, optional
+        :return: hex digest
+        :rtype: str
+        """
+        return self.get_many([filepath], algorithm)[filepath]
+
+    def md5(self, filepath):
+        """Get MD5 digest of a file, hashing it only if not in the index."""
+        return self.get(filepath, 'md5')
+
+    def get_many(self, filepaths, algorithm='md5', workers=None):
+        """Get digests of files, hashing the missing ones in parallel.
+
+        :param filepaths: paths to the files
+        :type filepaths: list(str)
+        :param algorithm: hash algorithm, see `ALGORITHMS`
+        :type algorithm: str, optional
+        :param workers: size of the process pool (number of CPUs)
+        :type workers: int, optional
+        :return: hex digests, keyed by filepath
+        :rtype: dict
+        """
+        digests, missing = {}, []
+        for filepath in filepaths:
+            digest = self._lookup(filepath, algorithm)
+            if digest:
+                digests[filepath] = digest
+            else:
+                missing.append(filepath)
+
+        total_size = sum(os.path.getsize(f) for f in missing)
+        if len(missing) > 1 and total_size > PARALLEL_HASH_THRESHOLD:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                computed = executor.map(file_digests, missing,
+                                        [(algorithm, )] * len(missing))
+                computed = list(computed)
+        else:
+            computed = [file_digests(f, (algorithm, )) for f in missing]
+
+        for filepath, result in zip(missing, computed):
+            self.put(filepath, **result)
+            digests[filepath] = result[algorithm]
+
+        return digests
+
+    def put(self, filepath, md5=None, sha256=None):
+        """Store known digests of a file in the index.
+
+        :param filepath: path to the file
+        :type filepath: str
+        :param md5: MD5 hex digest
+        :type md5: str, optional
+        :param sha256: SHA256 hex digest
+        :type sha256: str, optional
+        :return: None
+        """
+        st = os.stat(filepath)
+        key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+        with self._lock:
+            row = self._db.execute(
+                'SELECT md5, sha256 FROM hashes WHERE device = ? AND '
+                'inode = ? AND size = ? AND mtime = ?', key).fetchone()
+            if row:  # keep digests computed before
+                md5, sha256 = md5 or row[0], sha256 or row[1]
+
+            self._db.execute(
+                'INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?)',
+                key + (md5, sha256))
+
+    def save(self):
+        """Write pending changes to disk."""
+        with self._lock:
+            self._db.commit()
+
+    def close(self):
+        """Save and close the index."""
+        self.save()
+        self._db.close()
+
+    def _lookup(self, filepath, algorithm):
+        if algorithm not in ALGORITHMS:
+            raise ValueError('Unsupported algorithm {}.'.format(algorithm))
+
+        st = os.stat(filepath)
+        with self._lock:
+            row = self._db.execute(
+                'SELECT {} FROM hashes WHERE device = ? AND inode = ? AND '
+                'size = ? AND mtime = ?'.format(algorithm),
+                (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)).fetchone()
+
+        return row[0] if row else None
@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of CERN Analysis Preservation Framework.
+# Copyright (C) 2020 CERN.
+#
+# CERN Analysis Preservation Framework is free software; you can redistribute
+# it and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# CERN Analysis Preservation Framework is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with CERN Analysis Preservation Framework; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+"""Journal of long running jobs, so that they can be resumed.
+
+Multi-file transfers and batches are recorded as jobs, with the parameters
+needed to run them again. Every unit of work (a file, a batch operation) is
+recorded as soon as it is done or fails, so a job that was interrupted or
+had failures can be resumed, skipping the units already done. Finished
+jobs are pruned once they are older than `CAP_JOB_RETENTION_DAYS`, or
+beyond the `CAP_JOB_RETENTION_COUNT` most recent ones.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from cap_client.utils import cache_dir, private_file
+
+JOB_RETENTION_DAYS = float(os.environ.get('CAP_JOB_RETENTION_DAYS', 30))
+JOB_RETENTION_COUNT = int(os.environ.get('CAP_JOB_RETENTION_COUNT', 100))
+FINISHED_STATES = ('complete', 'failed')
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def _isoformat(timestamp):
+    return datetime.fromtimestamp(timestamp).isoformat(timespec='seconds')
+
+
+class JobJournal(object):
+    """Jobs and their units of work, in a SQLite database.
+
+    Every change is committed immediately, so the journal survives the
+    client being killed in the middle of a job.
+    """
+
+    def __init__(self, filepath=None):
+        """Initialize."""
+        self.filepath = filepath or os.path.join(cache_dir(), 'jobs.db')
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(private_file(self.filepath),
+                                   timeout=10,
+                                   isolation_level=None,
+                                   check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT, params TEXT, '
+            'state TEXT, created REAL, updated REAL)')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS units ('
+            'job INTEGER, key TEXT, state TEXT, error TEXT, result TEXT, '
+            'updated REAL, PRIMARY KEY (job, key))')
+
+    def create(self, kind, params):
+        """Start a new job.
+
+        :param kind: kind of job, eg. `files.download`
+        :type kind: str
+        :param params: parameters needed to run the job (JSON serializable)
+        :type params: dict
+        :return: new job
+        :rtype: `Job`
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                'INSERT INTO jobs (kind, params, state, created, updated) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (kind, json.dumps(params), 'running', now, now))
+
+        return Job(self, cursor.lastrowid, kind, params)
+
+    def get(self, job_id):
+        """Get job.
+
+        :param job_id: job ID
+        :type job_id: int
+        :return: job or None if there is no such job
+        :rtype: `Job`
+        """
+        with self._lock:
+            row = self._db.execute(
+                'SELECT kind, params FROM jobs WHERE id = ?',
+                (job_id, )).fetchone()
+
+        return Job(self, job_id, row[0], json.loads(row[1])) if row else None
+
+    def list(self, limit=20):
+        """Get summaries of the most recent jobs.
+
+        :param limit: max number of jobs
+        :type limit: int
+        :return: job summaries, most recent first
+        :rtype: list(dict)
+        """
+        with self._lock:
+            ids = [row[0] for row in self._db.execute(
+                'SELECT id FROM jobs ORDER BY id DESC LIMIT ?', (limit, ))]
+
+        return [self.get(job_id).summary() for job_id in ids]
+
+    def prune(self, max_age=None, keep=None):
+        """Delete finished jobs past the retention age or count.
+
+        Running jobs, including the interrupted ones, are never deleted.
+
+        :param max_age: max age of finished jobs since their last update
+        (days), defaults to `JOB_RETENTION_DAYS`
+        :type max_age: float, optional
+        :param keep: max number of finished jobs, defaults to
+        `JOB_RETENTION_COUNT`
+        :type keep: int, optional
+        :return: IDs of deleted jobs
+        :rtype: list(int)
+        """
+        max_age = JOB_RETENTION_DAYS if max_age is None else max_age
+        keep = JOB_RETENTION_COUNT if keep is None else keep
+        oldest = time.time() - max_age * 24 * 3600
+
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT id, updated FROM jobs WHERE state IN (?, ?) '
+                'ORDER BY id DESC', FINISHED_STATES).fetchall()
+            deleted = [(job_id, )
+                       for i, (job_id, updated) in enumerate(rows)
+                       if i >= keep or updated < oldest]
+
+            if not deleted:
+                return []
+
+            self._db.execute('BEGIN')
+            try:
+                self._db.executemany('DELETE FROM units WHERE job = ?',
+                                     deleted)
+                self._db.executemany('DELETE FROM jobs WHERE id = ?', deleted)
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+            self._db.execute('COMMIT')
+
+        return sorted(job_id for job_id, in deleted)
+
+    def close(self):
+        """Close the database."""
+        self._db.close()
+
+
+class Job(object):
+    """Job recorded in a `JobJournal`."""
+
+    def __init__(self, journal, id, kind, params):
+        """Initialize."""
+        self.journal = journal
+        self.id = id
+        self.kind = kind
+        self.params = params
+
+    def path(self, path):
+        """Resolve path relative to the directory the job was started in.
+
+        :param path: path given when the job was created
+        :type path: str
+        :rtype: str
+        """
+        cwd = self.params.get('cwd')
+        return path if cwd is None or os.getcwd() == cwd \
+            else os.path.join(cwd, path)
+
+    def record(self, key, error=None, result=None):
+        """Record unit of work as done, or failed if there is an error.
+
+        :param key: unit of work, eg. a filename
+        :type key: str
+        :param error: error the unit failed with
+        :type error: Exception or str, optional
+        :param result: result of the unit (JSON serializable)
+        :type result: object, optional
+        """
+        now = time.time()
+        with self.journal._lock:
+            self.journal._db.execute(
+                'INSERT OR REPLACE INTO units VALUES (?, ?, ?, ?, ?, ?)',
+                (self.id, key, 'failed' if error else 'done',
+                 str(error) if error else None, json.dumps(result), now))
+            self.journal._db.execute(
+                'UPDATE jobs SET updated = ? WHERE id = ?', (now, self.id))
+
+    def done(self):
+        """Get units of work already done, with their results.
+
+        :rtype: dict
+        """
+        with self.journal._lock:
+            rows = self.journal._db.execute(
+                'SELECT key, result FROM units WHERE job = ? AND '
+                'state = ?', (self.id, 'done')).fetchall()
+
+        return {key: json.loads(result) for key, result in rows}
+
+    def finish(self, failed=False):
+        """Mark job as complete, or as failed if some units failed.
+
+        Finished jobs past the retention age or count are pruned.
+
+        :param failed: whether some of the units failed
+        :type failed: bool
+        """
+        with self.journal._lock:
+            self.journal._db.execute(
+                'UPDATE jobs SET state = ?, updated = ? WHERE id = ?',
+                ('failed' if failed else 'complete', time.time(), self.id))
+
+        self.journal.prune()
+
+    def summary(self):
+        """Get job state and number of units done and failed.
+
+        :rtype: dict
+        """
+        with self.journal._lock:
+            state, created, updated = self.journal._db.execute(
+                'SELECT state, created, updated FROM jobs WHERE id = ?',
+                (self.id, )).fetchone()
+            counts = dict(self.journal._db.execute(
+                'SELECT state, COUNT(*) FROM units WHERE job = ? '
+                'GROUP BY state', (self.id, )).fetchall())
+
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'state': state,
+            'done': counts.get('done', 0),
+            'failed': counts.get('failed', 0),
+            'created': _isoformat(created),
+            'updated': _isoformat(updated),
+        }
+
+    def units(self):
+        """Get units of work recorded so far.
+
+        :rtype: list(dict)
+        """
+        with self.journal._lock:
+            rows = self.journal._db.execute(
+                'SELECT key, state, error FROM units WHERE job = ? '
+                'ORDER BY updated', (self.id, )).fetchall()
+
+        return [{'key': key, 'state': state, 'error': error}
+                if error else {'key': key, 'state': state}
+                for key, state, error in rows]
+
+
+def get_job_journal():
+    """Get the journal shared within the process."""
+    global _journal
+
+    with _journal_lock:
+        if _journal is None:
+            _journal = JobJournal()
+
+        return _journal
+
+
+def close_job_journal():
+    """Close the shared journal."""
+    global _journal
+
+    with _journal_lock:
+        if _journal is not None:
+            _journal.close()
+            _journal = None
+
+
+def record_transfers(job, callback=None, keys=None):
+    """Build transfer callback recording every file in the job.
+
+    :param job: job the transfers belong to
+    :type job: `Job`
+    :param callback: called with `TransferResult` after it is recorded
+    :type callback: callable, optional
+    :param keys: unit keys of the transferred files, if they are not
+    the filenames themselves
+    :type keys: dict, optional
+    :return: callback for `FilesAPI` multi-file operations
+    :rtype: callable
+    """
+    def record(result):
+        key = keys[result.filename] if keys else result.filename
+        job.record(key, error=result.error)
+        if callback:
+            callback(result)
+
+    return record
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of CERN Analysis Preservation Framework.
+# Copyright (C) 2020 CERN.
+#
+# CERN Analysis Preservation Framework is free software; you can redistribute
+# it and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# CERN Analysis Preservation Framework is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with CERN Analysis Preservation Framework; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+"""Minimal JSON Patch (RFC 6902) between two JSON documents.
+
+Objects are compared key by key. Arrays are compared element by element
+after trimming their common prefix and suffix, and what is left is
+matched with `difflib.SequenceMatcher` on canonical encodings of the
+elements, so an element inserted or removed in the middle of a large array
+becomes a single `add` or `remove`, instead of replacing everything after
+it. Whenever the changes of a nested value take more bytes than replacing
+it as a whole, it is replaced.
+"""
+
+from difflib import SequenceMatcher
+
+from cap_client import codec
+
+
+def pointer(path, key):
+    """Append key to JSON Pointer (RFC 6901), escaping it.
+
+    :param path: JSON Pointer, eg. '/basic_info/people_info'
+    :type path: str
+    :param key: object key or array index
+    :type key: str or int
+    :rtype: str
+    """
+    return '{}/{}'.format(
+        path, str(key).replace('~', '~0').replace('/', '~1'))
+
+
+def field_pointer(field):
+    """Convert field, eg. obj.nested_arr.0, to JSON Pointer.
+
+    :param field: dot separated field
+    :type field: str
+    :rtype: str
+    """
+    path = ''
+    for key in field.split('.'):
+        path = pointer(path, key)
+    return path
+
+
+def _canonical(value):
+    return codec.dumps(value, sort_keys=True)
+
+
+def _size(ops):
+    return len(codec.dumps(ops))
+
+
+def diff(src, dst, path=''):
+    """Build JSON Patch turning src into dst.
+
+    :param src: current document
+    :type src: JSON serializable object
+    :param dst: desired document
+    :type dst: JSON serializable object
+    :param path: JSON Pointer of the documents, if they are part of a
+    larger one
+    :type path: str
+    :return: patch operations, empty if the documents are equal
+    :rtype: list(dict)
+    """
+    if isinstance(src, dict) and isinstance(dst, dict):
+        return _diff_objects(src, dst, path)
+    elif isinstance(src, list) and isinstance(dst, list):
+        return _diff_arrays(src, dst, path)
+    elif type(src) is type(dst) and src == dst:
+        return []
+
+    return [{'op': 'replace', 'path': path, 'value': dst}]
+
+
+def _diff_child(src, dst, path):
+    ops = diff(src, dst, path)
+    if len(ops) > 1:
+        replace = [{'op': 'replace', 'path': path, 'value': dst}]
+        if _size(replace) < _size(ops):
+            return replace
+
+    return ops
+
+
+def _diff_objects(src, dst, path):
+    ops = []
+    for key in src:
+        if key not in dst:
+            ops.append({'op': 'remove', 'path': pointer(path, key)})
+        else:
+            ops.extend(_diff_child(src[key], dst[key], pointer(path, key)))
+
+    for key in dst:
+        if key not in src:
+            ops.append({'op': 'add', 'path': pointer(path, key),
+                        'value': dst[key]})
+
+    return ops
+
+
+def _diff_arrays(src, dst, path):
+    src_keys = [_canonical(item) for item in src]
+    dst_keys = [_canonical(item) for item in dst]
+
+    start, end = 0, 0
+    limit = min(len(src), len(dst))
+    while start < limit and src_keys[start] == dst_keys[start]:
+        start += 1
+    while end < limit - start and \
+            src_keys[-end - 1] == dst_keys[-end - 1]:
+        end += 1
+
+    matcher = SequenceMatcher(None,
+                              src_keys[start:len(src) - end],
+                              dst_keys[start:len(dst) - end],
+                              autojunk=False)
+
+    # going backwards, indices of the earlier elements stay valid
+    ops = []
+    for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+        i1, i2, j1, j2 = i1 + start, i2 + start, j1 + start, j2 + start
+        common = min(i2 - i1, j2 - j1)
+
+        group = []
+        for k in range(common if tag == 'replace' else 0):
+            group.extend(
+                _diff_child(src[i1 + k], dst[j1 + k], pointer(path, i1 + k)))
+        for k in range(i2 - i1 - common if tag != 'insert' else 0):
+            group.append({'op': 'remove', 'path': pointer(path, i1 + common)})
+        for k in range(j2 - j1 - common if tag != 'delete' else 0):
+            group.append({'op': 'add', 'path': pointer(path, i1 + common + k),
+                          'value': dst[j1 + common + k]})
+
+        ops.extend(group)
+
+    return ops
@@ -23,6 +23,8 @@
 # as an Intergovernmental Organization or submit itself to any jurisdiction.
 """CAP Client Utils."""
 import functools
+import glob
+import importlib
 import json
 import logging
 import os
@@ -36,6 +38,43 @@ from click import BadParameter, ClickException
 
 from click_help_colors import HelpColorsGroup
 
+from cap_client import codec
+
+
+def cache_dir():
+    """Directory for the client's local caches, created if missing.
+
+    The caches hold server responses, so the directory is accessible only
+    to the current user.
+    """
+    path = os.environ.get('CAP_CACHE_DIR') or os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+        'cap-client')
+    if not os.path.isdir(path):
+        os.makedirs(path, mode=0o700, exist_ok=True)
+    elif os.stat(path).st_mode & 0o077:
+        try:
+            os.chmod(path, 0o700)
+        except OSError:  # not ours, the files are still private
+            pass
+
+    return path
+
+
+def private_file(filepath):
+    """Create file readable and writable by the current user only.
+
+    Existing files are made private too.
+
+    :param filepath: path to the file
+    :type filepath: str
+    :return: the path
+    :rtype: str
+    """
+    os.close(os.open(filepath, os.O_CREAT | os.O_WRONLY, 0o600))
+    os.chmod(filepath, 0o600)
+    return filepath
+
 
 class ColoredGroup(HelpColorsGroup):
     """CAP command group with predefined colors."""
@@ -47,6 +86,73 @@ class ColoredGroup(HelpColorsGroup):
         super(ColoredGroup, self).__init__(*args, **kwargs)
 
 
+class LazyGroup(ColoredGroup):
+    """CAP command group importing subcommands only when they are needed.
+
+    Subcommands are given as `lazy_commands`, mapping their names to
+    `('module:attribute', 'short help')`, so listing them (eg. in `--help`
+    or in shell completion) does not import anything.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """Initialize."""
+        self.lazy_commands = kwargs.pop('lazy_commands', {})
+        super(LazyGroup, self).__init__(*args, **kwargs)
+
+    def list_commands(self, ctx):
+        """List names of all the subcommands."""
+        return sorted(set(self.commands) | set(self.lazy_commands))
+
+    def get_command(self, ctx, cmd_name):
+        """Get subcommand, importing it on first use."""
+        if cmd_name not in self.commands and cmd_name in self.lazy_commands:
+            module, attr = self.lazy_commands[cmd_name][0].split(':')
+            self.add_command(getattr(importlib.import_module(module), attr),
+                             cmd_name)
+
+        return super(LazyGroup, self).get_command(ctx, cmd_name)
+
+    def shell_complete(self, ctx, incomplete):
+        """Complete subcommand names and options, without importing them."""
+        from click.shell_completion import CompletionItem
+
+        results = []
+        for name in self.list_commands(ctx):
+            if not name.startswith(incomplete):
+                continue
+            if name in self.commands:
+                if self.commands[name].hidden:
+                    continue
+                help = self.commands[name].get_short_help_str()
+            else:
+                help = self.lazy_commands[name][1]
+            results.append(CompletionItem(name, help=help))
+
+        # options only, the subcommands are already listed
+        results.extend(click.Command.shell_complete(self, ctx, incomplete))
+        return results
+
+    def format_commands(self, ctx, formatter):
+        """Write subcommands and their short help, without importing them."""
+        names = self.list_commands(ctx)
+        if not names:
+            return
+
+        limit = formatter.width - 6 - max(len(name) for name in names)
+        rows = []
+        for name in names:
+            if name in self.commands:
+                if self.commands[name].hidden:
+                    continue
+                help = self.commands[name].get_short_help_str(limit)
+            else:
+                help = self.lazy_commands[name][1]
+            rows.append((name, help))
+
+        with formatter.section('Commands'):
+            formatter.write_dl(rows)
+
+
 def make_tarfile(output_filename, source_dir):
     """Make a tarball out of {source_dir} into {output_filename}."""
     with tarfile.open(output_filename, "w:gz") as tar:
@@ -69,7 +175,7 @@ def load_json_from_file(ctx, param, value):
     """Load json from file parameter."""
     if value is not None:
         try:
-            return json.load(value)
+            return codec.loads(value.read())
         except (KeyError, ValueError):
             raise BadParameter('Not a valid JSON.')
 
@@ -78,11 +184,40 @@ def load_json(ctx, param, value):
     """Load json from parameter."""
     if value is not None:
         try:
-            return json.loads(value)
+            return codec.loads(value)
         except (KeyError, ValueError):
             raise BadParameter('Not a valid JSON.')
 
 
+def load_assignments(ctx, param, value):
+    """Load repeated FIELD=VALUE parameter, value is JSON or text."""
+    assignments = []
+    for item in value or ():
+        field, sep, data = item.partition('=')
+        if not sep or not field:
+            raise BadParameter(
+                'Expected FIELD=VALUE, got {!r}.'.format(item))
+        try:
+            data = codec.loads(data)
+        except ValueError:
+            pass
+        assignments.append((field, data))
+    return assignments
+
+
+def load_json_patch_from_file(ctx, param, value):
+    """Load JSON Patch from file parameter."""
+    patch = load_json_from_file(ctx, param, value)
+    if patch is None:
+        return []
+    if not isinstance(patch, list) or \
+            not all(isinstance(op, dict) and 'op' in op and 'path' in op
+                    for op in patch):
+        raise BadParameter(
+            'Not a valid JSON Patch (an array of operations).')
+    return patch
+
+
 def load_num(ctx, param, value):
     """Load integer from parameter."""
     if value is not None:
@@ -218,6 +353,121 @@ def logger(fun):
 
 
 json_dumps = functools.partial(json.dumps, indent=4)
+json_dumps_compact = functools.partial(json.dumps, separators=(',', ':'))
+
+OUTPUT_FORMATS = ['json', 'compact', 'ndjson']
+
+
+def output_format():
+    """Get output format chosen with `cap-client --output`."""
+    ctx = click.get_current_context(silent=True)
+    return ctx.meta.get('output', 'json') if ctx else 'json'
+
+
+def echo_json(data):
+    """Print data in the chosen output format.
+
+    `json` is indented, `compact` fits on a single line and `ndjson`
+    prints the items of a list one per line (other data as `compact`).
+    """
+    fmt = output_format()
+
+    if fmt == 'ndjson' and isinstance(data, list):
+        echo_json_array(data)
+    elif fmt == 'json':
+        click.echo(json_dumps(data))
+    else:
+        click.echo(json_dumps_compact(data))
+
+
+def echo_json_array(items):
+    """Print items as a JSON array, one by one as they come.
+
+    The output is the same as `echo_json(list(items))` without holding
+    all the items in memory.
+    """
+    fmt = output_format()
+
+    if fmt == 'ndjson':
+        for item in items:
+            click.echo(json_dumps_compact(item))
+        return
+
+    sep = '['
+    for item in items:
+        if fmt == 'json':
+            item = json_dumps(item).replace('\n', '\n    ')
+            click.echo(sep + '\n    ' + item, nl=False)
+        else:
+            click.echo(sep + json_dumps_compact(item), nl=False)
+        sep = ','
+
+    if fmt == 'json':
+        click.echo('[]' if sep == '[' else '\n]')
+    else:
+        click.echo('[]' if sep == '[' else ']')
+
+
+def human_size(num):
+    """Format number of bytes as a human readable string."""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if abs(num) < 1024:
+            return '{:.1f} {}'.format(num, unit)
+        num /= 1024.0
+
+    return '{:.1f} TB'.format(num)
+
+
+def echo_transfer(result):
+    """Print outcome of a single file transfer."""
+    if result.error:
+        click.secho('{}: failed ({})'.format(result.filename, result.error),
+                    fg='red')
+    else:
+        click.echo('{}: {} in {:.2f}s ({}/s)'.format(
+            result.filename, human_size(result.size), result.elapsed,
+            human_size(result.size / max(result.elapsed, 1e-6))))
+
+
+def echo_removal(result):
+    """Print outcome of a single file removal."""
+    if result.error:
+        echo_transfer(result)
+    else:
+        click.echo('{}: removed'.format(result.filename))
+
+
+def echo_transfer_summary(results, elapsed):
+    """Print aggregate statistics of file transfers."""
+    done = [r for r in results if not r.error]
+    size = sum(r.size for r in done)
+
+    click.echo('{} of {} files transferred, {} in {:.2f}s ({}/s).'.format(
+        len(done), len(results), human_size(size), elapsed,
+        human_size(size / max(elapsed, 1e-6))))
+
+    if done:
+        latencies = [r.elapsed for r in done]
+        click.echo('Per-file latency: avg {:.2f}s, max {:.2f}s.'.format(
+            sum(latencies) / len(latencies), max(latencies)))
+
+
+def expand_paths(ctx, param, value):
+    """Expand glob patterns in path arguments, check the paths exist."""
+    paths = []
+    for path in value:
+        if os.path.exists(path):
+            paths.append(path)
+        elif any(c in path for c in '*?['):
+            matched = sorted(glob.glob(path, recursive=True))
+            if not matched:
+                raise BadParameter(
+                    'Pattern {!r} did not match any files.'.format(path))
+            paths.extend(matched)
+        else:
+            raise BadParameter('Path {!r} does not exist.'.format(path))
+
+    return paths
 
 
 def pid_option(required):
@@ -45,10 +45,16 @@ tests_require = [
 ]
 
 extras_require = {
+    'async': [
+        'aiohttp>=3.9.0',
+    ],
     'docs': [
         'Sphinx>=7.2.0',
         'sphinx-rtd-theme>=2.0.0',
     ],
+    'orjson': [
+        'orjson>=3.8.0',
+    ],
     'tests': tests_require,
 }
 
@@ -85,7 +91,7 @@ setup(
     zip_safe=False,
     entry_points={
         'console_scripts': [
-            'cap-client = cap_client.cli:cli',
+            'cap-client = cap_client.daemon:main',
         ],
     },
     install_requires=install_requires,
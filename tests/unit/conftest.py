@@ -26,19 +26,161 @@
 from __future__ import absolute_import, print_function
 
 import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 import pytest
 from click.testing import CliRunner
 
+from cap_client.api.cache import clear_bucket_link_cache, \
+    close_http_cache, enable_http_cache
+from cap_client.api.session import close_session, stats
 from cap_client.cli import cli
+from cap_client.jobs import close_job_journal
+
+
+def pytest_addoption(parser):
+    """Add option running the benchmarks asserting timings."""
+    parser.addoption('--benchmark', action='store_true', default=False,
+                     help='Also run the tests asserting timings, which are '
+                     'unreliable on busy machines.')
+
+
+def pytest_collection_modifyitems(config, items):
+    """Skip benchmarks unless asked for."""
+    if config.getoption('--benchmark'):
+        return
+
+    skip = pytest.mark.skip(reason='needs --benchmark')
+    for item in items:
+        if 'benchmark' in item.keywords:
+            item.add_marker(skip)
 
 
 @pytest.fixture(autouse=True)
-def env():
+def env(tmp_path_factory):
     """Set environment."""
     os.environ['CAP_SERVER_URL'] = 'https://analysispreservation-dev.cern.ch'
     os.environ['CAP_SERVER_API_PATH'] = 'api/'
     os.environ['CAP_ACCESS_TOKEN'] = 'token'
+    os.environ['CAP_CACHE_DIR'] = str(tmp_path_factory.mktemp('cache'))
+
+
+@pytest.fixture(autouse=True)
+def transport(monkeypatch):
+    """Start every test with a fresh shared session and stats."""
+    monkeypatch.setattr('cap_client.api.session.RETRY_BACKOFF', 0)
+    close_session()
+    close_http_cache()
+    clear_bucket_link_cache()
+    enable_http_cache(False)
+    stats.reset()
+
+    yield
+
+    close_session()
+    close_http_cache()
+    close_job_journal()
+
+
+class LocalServer(object):
+    """Local HTTP/1.1 server standing in for the CAP server.
+
+    Responses are registered in `routes` as `path -> (status, body)`
+    or `path -> (status, body, headers)`. Requests with `If-None-Match`
+    matching the `ETag` header get a 304, `Range` requests are honoured
+    when `accept_ranges` is set, and `drop_after` (`path -> bytes`) makes
+    the server close the connection after sending that many body bytes.
+    """
+
+    def __init__(self):
+        """Initialize."""
+        self.routes = {}
+        self.requests = []
+        self.accept_ranges = True
+        self.drop_after = {}
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _respond(self):
+                server.requests.append((self.command, self.path,
+                                        dict(self.headers), self._body()))
+
+                route = server.routes.get(self.path, (404, b''))
+                status, body, headers = (route + ({}, ))[:3]
+                total = len(body)
+
+                etag = headers.get('ETag')
+                if etag and self.headers.get('If-None-Match') == etag:
+                    status, body = 304, b''
+
+                range_ = self.headers.get('Range')
+                if range_ and server.accept_ranges and status == 200:
+                    start = int(range_.split('=')[1].split('-')[0])
+                    status, body = 206, body[start:]
+                    headers = dict(headers, **{
+                        'Content-Range': 'bytes {}-{}/{}'.format(
+                            start, total - 1, total)
+                    })
+
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+
+                if self.path in server.drop_after:
+                    self.wfile.write(body[:server.drop_after[self.path]])
+                    self.close_connection = True
+                else:
+                    self.wfile.write(body)
+
+            def _body(self):
+                if self.headers.get('Transfer-Encoding') == 'chunked':
+                    body = b''
+                    while True:
+                        size = int(self.rfile.readline().strip(), 16)
+                        body += self.rfile.read(size)
+                        self.rfile.readline()
+                        if not size:
+                            return body
+
+                return self.rfile.read(
+                    int(self.headers.get('Content-Length') or 0))
+
+            do_GET = do_PUT = do_POST = do_PATCH = do_DELETE = _respond
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}'.format(self.httpd.server_port)
+
+    def start(self):
+        """Serve requests in a background thread."""
+        thread = threading.Thread(target=self.httpd.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        """Shut the server down."""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def local_server():
+    """Local HTTP server, CAP_SERVER_URL points to it."""
+    server = LocalServer()
+    server.start()
+    os.environ['CAP_SERVER_URL'] = server.url
+
+    yield server
+
+    server.stop()
 
 
 @pytest.yield_fixture
@@ -1,7 +1,13 @@
 import json
+import random
+import threading
+import time
 from tempfile import NamedTemporaryFile
+from urllib.parse import parse_qs, urlparse
 
 import responses
+from pytest import mark
+from cap_client.api import AnalysisAPI
 from cap_client.utils import json_dumps
 
 
@@ -184,7 +190,7 @@ def test_create_method_when_success_returns_newly_created_deposit_via_basic_seri
                   },
                   status=201)
     responses.add(
-        responses.PUT,
+        responses.GET,
         'https://analysispreservation-dev.cern.ch/api/deposits/some-pid',
         json={
             "created": "2020-03-25T09:25:19.578823+00:00",
@@ -205,10 +211,10 @@ def test_create_method_when_success_returns_newly_created_deposit_via_basic_seri
 
     assert responses.calls[0].request.headers[
         'Content-Type'] == 'application/json'
-    assert responses.calls[1].request.headers[
+    assert responses.calls[0].request.headers[
         'Accept'] == 'application/basic+json'
     assert responses.calls[1].request.headers[
-        'Content-Type'] == 'application/json'
+        'Accept'] == 'application/basic+json'
     assert json.loads(res.output) == {
         "updated": "2020-03-25T09:25:19.904106+00:00",
         "created": "2020-03-25T09:25:19.578823+00:00",
@@ -219,6 +225,46 @@ def test_create_method_when_success_returns_newly_created_deposit_via_basic_seri
     }
 
 
+@responses.activate
+def test_analysis_create_takes_one_request_when_server_serializes_basic(
+        cli_run):
+    responses.add(responses.POST,
+                  'https://analysispreservation-dev.cern.ch/api/deposits/',
+                  json={'pid': 'some-pid', 'metadata': {'title': 'x'}},
+                  status=201)
+
+    res = cli_run('analysis create --type lhcb --json {"title":"x"}')
+
+    assert res.exit_code == 0
+    assert json.loads(res.output) == {
+        'pid': 'some-pid',
+        'metadata': {'title': 'x'}
+    }
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_analysis_create_many_from_json_array(cli_run):
+    def created(request):
+        title = json.loads(request.body)['title']
+        if title == 'bad':
+            return (400, {}, json.dumps({'message': 'Validation error.'}))
+        return (201, {}, json.dumps({'pid': title, 'metadata': {}}))
+
+    responses.add_callback(
+        responses.POST,
+        'https://analysispreservation-dev.cern.ch/api/deposits/',
+        callback=created)
+
+    res = cli_run('analysis create -t lhcb -w 2 --json '
+                  '[{"title":"a"},{"title":"bad"},{"title":"c"}]')
+
+    assert res.exit_code == 1
+    assert [r['pid'] for r in json.loads(res.stdout.split('\nSome')[0])] \
+        == ['a', 'c']
+    assert 'Analysis 1: failed (Validation error.)' in res.stderr
+
+
 def test_analysis_create_when_no_json_nor_jsonfile_provided(cli_run):
     res = cli_run("analysis create --type some-type")
 
@@ -760,3 +806,212 @@ def test_analysis_delete_no_access_tokens(cli_run):
 
     assert res.exit_code == 1
     assert res.stripped_output == 'You are not authorized to access the server (invalid access token?)'
+
+
+def add_search_pages(url, total, max_size=None, reject_above=None,
+                     delay=0):
+    def callback(request):
+        params = parse_qs(urlparse(request.url).query)
+        page, size = int(params['page'][0]), int(params['size'][0])
+        if reject_above and size > reject_above:
+            return (400, {}, json.dumps({'message': 'Too many results.'}))
+        size = min(size, max_size or size)
+        time.sleep(delay * random.random())
+        hits = [{'pid': 'pid-{}'.format(i)}
+                for i in range((page - 1) * size, min(page * size, total))]
+        return (200, {}, json.dumps({'hits': {'hits': hits,
+                                              'total': total}}))
+
+    responses.add_callback(responses.GET, url, callback=callback)
+
+
+@responses.activate
+def test_analysis_get_drafts_with_all_pages(cli_run):
+    add_search_pages('https://analysispreservation-dev.cern.ch/api/deposits/',
+                     total=7)
+
+    res = cli_run('analysis get --all-pages --size 3')
+
+    assert res.exit_code == 0
+    assert res.stripped_output == json_dumps(
+        [{'pid': 'pid-{}'.format(i)} for i in range(7)])
+    assert len(responses.calls) == 3
+
+
+@responses.activate
+def test_analysis_get_published_with_all_pages_when_no_results(cli_run):
+    add_search_pages('https://analysispreservation-dev.cern.ch/api/records/',
+                     total=0)
+
+    res = cli_run('analysis get-published --all-pages')
+
+    assert res.exit_code == 0
+    assert res.stripped_output == '[]'
+    assert len(responses.calls) == 1
+
+
+def test_analysis_get_drafts_with_all_pages_and_page(cli_run):
+    res = cli_run('analysis get --all-pages --page 2')
+
+    assert res.exit_code == 2
+    assert 'mutually exclusive' in res.output
+
+
+@responses.activate
+def test_iter_drafts_fetches_pages_lazily():
+    add_search_pages('https://analysispreservation-dev.cern.ch/api/deposits/',
+                     total=100)
+
+    threads = threading.active_count()
+
+    drafts = AnalysisAPI().iter_drafts(size=10)
+    first = [next(drafts) for _ in range(5)]
+    drafts.close()
+    while threading.active_count() > threads:  # let the prefetch finish
+        time.sleep(0.01)
+
+    assert first == [{'pid': 'pid-{}'.format(i)} for i in range(5)]
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_analysis_get_drafts_with_all_pages_probes_page_size(cli_run):
+    add_search_pages('https://analysispreservation-dev.cern.ch/api/deposits/',
+                     total=600, reject_above=300)
+
+    res = cli_run('analysis get --all-pages')
+
+    assert res.exit_code == 0
+    assert len(json.loads(res.stripped_output)) == 600
+    sizes = [parse_qs(urlparse(c.request.url).query)['size'][0]
+             for c in responses.calls]
+    assert sizes == ['1000', '500', '250', '250', '250']
+
+
+@responses.activate
+def test_iter_drafts_adapts_to_page_size_capped_by_server():
+    add_search_pages('https://analysispreservation-dev.cern.ch/api/deposits/',
+                     total=120, max_size=50)
+
+    drafts = list(AnalysisAPI().iter_drafts(size=None))
+
+    assert drafts == [{'pid': 'pid-{}'.format(i)} for i in range(120)]
+    assert len(responses.calls) == 3
+
+
+@responses.activate
+def test_iter_drafts_fetches_pages_in_parallel_in_order():
+    add_search_pages('https://analysispreservation-dev.cern.ch/api/deposits/',
+                     total=95, delay=0.01)
+
+    drafts = list(AnalysisAPI().iter_drafts(size=5, workers=4))
+
+    assert drafts == [{'pid': 'pid-{}'.format(i)} for i in range(95)]
+    # the last page is full, so the next one is asked for
+    assert len(responses.calls) == 20
+
+
+@responses.activate
+@mark.parametrize('sort, workers, expected', [
+    (None, 4, ['mostrecent']),
+    ('bestmatch', 4, ['bestmatch']),
+    (None, 1, None),
+])
+def test_iter_drafts_sorts_pages_fetched_in_parallel(sort, workers, expected):
+    add_search_pages('https://analysispreservation-dev.cern.ch/api/deposits/',
+                     total=20)
+
+    list(AnalysisAPI().iter_drafts(size=5, sort=sort, workers=workers))
+
+    assert {str(parse_qs(urlparse(c.request.url).query).get('sort'))
+            for c in responses.calls} == {str(expected)}
+
+
+def hit(pid):
+    return {
+        'created': '2020-04-23T14:24:44.068071+00:00',
+        'metadata': {'general_title': pid},
+        'pid': pid,
+        'updated': '2020-04-23T14:24:44.068071+00:00',
+    }
+
+
+@responses.activate
+def test_iter_drafts_skips_analyses_shifted_to_next_page():
+    url = 'https://analysispreservation-dev.cern.ch/api/deposits/'
+    pages = {
+        '1': [hit('a'), hit('b')],
+        '2': [hit('b'), hit('c')],
+        '3': [hit('d')],
+    }
+    responses.add_callback(
+        responses.GET, url,
+        callback=lambda request: (200, {}, json.dumps({'hits': {
+            'hits': pages[parse_qs(urlparse(request.url).query)['page'][0]],
+            'total': 5,
+        }})))
+
+    drafts = list(AnalysisAPI().iter_drafts(size=2, workers=2))
+
+    assert [d['pid'] for d in drafts] == ['a', 'b', 'c', 'd']
+
+
+@responses.activate
+def test_iter_drafts_reads_pages_created_after_first_one():
+    url = 'https://analysispreservation-dev.cern.ch/api/deposits/'
+    analyses = [hit('pid-{}'.format(i)) for i in range(10)]
+
+    def callback(request):
+        page = int(parse_qs(urlparse(request.url).query)['page'][0])
+        body = json.dumps({'hits': {
+            'hits': analyses[(page - 1) * 5:page * 5],
+            'total': len(analyses),
+        }})
+        if page == 1:  # created during the export, shifts the others
+            analyses.insert(0, hit('new'))
+        return (200, {}, body)
+
+    responses.add_callback(responses.GET, url, callback=callback)
+
+    drafts = list(AnalysisAPI().iter_drafts(size=5, workers=2))
+
+    assert [d['pid'] for d in drafts] == \
+        ['pid-{}'.format(i) for i in range(10)]
+
+
+@responses.activate
+def test_analysis_get_drafts_with_ndjson_output(cli_run):
+    add_search_pages('https://analysispreservation-dev.cern.ch/api/deposits/',
+                     total=3)
+
+    res = cli_run('--output ndjson analysis get --all-pages --size 2')
+
+    assert res.exit_code == 0
+    assert res.output == ''.join(
+        '{{"pid":"pid-{}"}}\n'.format(i) for i in range(3))
+
+
+@responses.activate
+def test_analysis_get_drafts_with_compact_output(cli_run):
+    add_search_pages('https://analysispreservation-dev.cern.ch/api/deposits/',
+                     total=3)
+
+    res = cli_run('--output compact analysis get --all-pages --size 2')
+
+    assert res.exit_code == 0
+    assert res.output == json.dumps(
+        [{'pid': 'pid-{}'.format(i)} for i in range(3)],
+        separators=(',', ':')) + '\n'
+
+
+@responses.activate
+def test_analysis_get_draft_by_pid_with_ndjson_output(cli_run):
+    responses.add(
+        responses.GET,
+        'https://analysispreservation-dev.cern.ch/api/deposits/some-pid',
+        json={'pid': 'some-pid', 'metadata': {'title': 'test'}})
+
+    res = cli_run('--output ndjson analysis get --pid some-pid')
+
+    assert res.exit_code == 0
+    assert res.output == '{"pid":"some-pid","metadata":{"title":"test"}}\n'
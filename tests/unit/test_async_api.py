@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of CERN Analysis Preservation Framework.
+# Copyright (C) 2020, 2020 CERN.
+#
+# CERN Analysis Preservation Framework is free software; you can redistribute
+# it and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# CERN Analysis Preservation Framework is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with CERN Analysis Preservation Framework; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+"""Tests for asyncio API classes."""
+
+import asyncio
+import json
+
+import pytest
+
+from cap_client.errors import BadStatusCode
+
+pytest.importorskip('aiohttp')
+
+from cap_client.api.async_api import (  # noqa: E402
+    AsyncAnalysisAPI, AsyncFilesAPI, AsyncMetadataAPI, AsyncPermissionsAPI,
+    close_async_session, get_async_session
+)
+
+
+def run(coro):
+    async def main():
+        try:
+            return await coro
+        finally:
+            await close_async_session()
+
+    return asyncio.run(main())
+
+
+def add_analysis(server, pid, metadata):
+    server.routes['/api/deposits/{}'.format(pid)] = (200, json.dumps({
+        'metadata': metadata,
+        'links': {'bucket': server.url + '/api/files/bucket-id'},
+    }).encode())
+
+
+def test_get_metadata_concurrently_on_one_connection_pool(local_server):
+    for i in range(50):
+        add_analysis(local_server, 'pid-{}'.format(i), {'title': str(i)})
+
+    async def get_all():
+        api = AsyncMetadataAPI()
+        session = get_async_session()
+        res = await asyncio.gather(*(api.get('pid-{}'.format(i), 'title')
+                                     for i in range(50)))
+        assert get_async_session() is session
+        return res
+
+    assert run(get_all()) == [str(i) for i in range(50)]
+    assert all(r[2]['Authorization'] == 'OAuth2 token'
+               for r in local_server.requests)
+
+
+def test_get_drafts(local_server):
+    local_server.routes['/api/deposits/?by_me=True'] = (200, json.dumps({
+        'hits': {'hits': [{'id': 'some-pid'}]}
+    }).encode())
+
+    assert run(AsyncAnalysisAPI().get_drafts()) == [{'id': 'some-pid'}]
+
+
+def test_set_metadata_field_sends_json_patch(local_server):
+    add_analysis(local_server, 'some-pid', {'title': 'new'})
+
+    run(AsyncMetadataAPI().set('some-pid', 'new', 'basic_info.title'))
+
+    command, _, headers, body = local_server.requests[-1]
+    assert command == 'PATCH'
+    assert headers['Content-Type'] == 'application/json-patch+json'
+    assert json.loads(body) == [{
+        'op': 'replace', 'path': '/basic_info/title', 'value': 'new'
+    }]
+
+
+def test_request_retries_transient_errors(local_server, monkeypatch):
+    local_server.routes['/api/deposits/some-pid'] = (503, b'')
+
+    with pytest.raises(BadStatusCode) as e:
+        run(AsyncMetadataAPI().get('some-pid'))
+
+    assert e.value.status_code == 503
+    assert len(local_server.requests) == 4
+
+
+def test_permissions_add_is_not_retried(local_server):
+    local_server.routes['/api/deposits/some-pid/actions/permissions'] = \
+        (503, b'')
+
+    with pytest.raises(BadStatusCode):
+        run(AsyncPermissionsAPI().add('some-pid', 'user@cern.ch', ['read']))
+
+    assert len(local_server.requests) == 1
+    assert json.loads(local_server.requests[0][3]) == [{
+        'email': 'user@cern.ch', 'type': 'user', 'op': 'add',
+        'action': 'deposit-read'
+    }]
+
+
+def test_upload_and_download_file(local_server, tmpdir):
+    add_analysis(local_server, 'some-pid', {})
+    local_server.routes['/api/files/bucket-id/data.root'] = \
+        (200, b'0123456789')
+    filepath = tmpdir.join('data.root')
+    filepath.write_binary(b'some data')
+
+    run(AsyncFilesAPI().upload_file('some-pid', str(filepath)))
+
+    command, path, _, body = local_server.requests[-1]
+    assert (command, path, body) == \
+        ('PUT', '/api/files/bucket-id/data.root', b'some data')
+
+    output = str(tmpdir.join('out.root'))
+    received = run(AsyncFilesAPI().download('some-pid', 'data.root', output,
+                                            chunk_size=3))
+
+    assert received == 10
+    with open(output, 'rb') as fp:
+        assert fp.read() == b'0123456789'
+
+
+def move_bucket(server, new_bucket):
+    server.routes['/api/deposits/some-pid'] = (200, json.dumps({
+        'links': {'bucket': server.url + '/api/files/' + new_bucket},
+    }).encode())
+    del server.routes['/api/files/bucket-id/data.root']
+    server.routes['/api/files/{}/data.root'.format(new_bucket)] = \
+        (200, b'new content')
+
+
+def test_download_refreshes_stale_bucket_link_on_404(local_server, tmpdir):
+    add_analysis(local_server, 'some-pid', {})
+    local_server.routes['/api/files/bucket-id/data.root'] = \
+        (200, b'0123456789')
+    run(AsyncFilesAPI().download('some-pid', 'data.root',
+                                 str(tmpdir.join('a'))))
+    move_bucket(local_server, 'new-bucket')
+
+    run(AsyncFilesAPI().download('some-pid', 'data.root',
+                                 str(tmpdir.join('b'))))
+
+    with open(str(tmpdir.join('b')), 'rb') as fp:
+        assert fp.read() == b'new content'
+    assert [r[1] for r in local_server.requests[-3:]] == [
+        '/api/files/bucket-id/data.root',
+        '/api/deposits/some-pid',
+        '/api/files/new-bucket/data.root',
+    ]
+
+
+def test_upload_file_resends_whole_file_to_fresh_bucket_link(
+        local_server, tmpdir):
+    add_analysis(local_server, 'some-pid', {})
+    local_server.routes['/api/files/bucket-id/data.root'] = (200, b'{}')
+    filepath = tmpdir.join('data.root')
+    filepath.write_binary(b'some data')
+    run(AsyncFilesAPI().upload_file('some-pid', str(filepath)))
+    move_bucket(local_server, 'new-bucket')
+    local_server.routes['/api/files/new-bucket/data.root'] = (200, b'{}')
+
+    run(AsyncFilesAPI().upload_file('some-pid', str(filepath)))
+
+    command, path, _, body = local_server.requests[-1]
+    assert (command, path, body) == \
+        ('PUT', '/api/files/new-bucket/data.root', b'some data')
+
+
+def test_stale_bucket_link_is_not_retried_when_unchanged(local_server):
+    add_analysis(local_server, 'some-pid', {})
+    local_server.routes['/api/files/bucket-id/data.root'] = (204, b'')
+    run(AsyncFilesAPI().remove('some-pid', 'data.root'))
+    del local_server.routes['/api/files/bucket-id/data.root']
+
+    with pytest.raises(BadStatusCode):
+        run(AsyncFilesAPI().remove('some-pid', 'data.root'))
+
+    assert [r[1] for r in local_server.requests[-2:]] == [
+        '/api/files/bucket-id/data.root',
+        '/api/deposits/some-pid',
+    ]
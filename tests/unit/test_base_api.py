@@ -25,12 +25,15 @@
 
 from __future__ import absolute_import, print_function
 
+import io
 import json
 
 import responses
 from pytest import raises
+from requests.exceptions import ConnectionError
 
 from cap_client.api.base import CapAPI
+from cap_client.api.session import retry_budget, retry_delay, stats
 from cap_client.errors import BadStatusCode
 
 
@@ -106,3 +109,100 @@ def test_make_request_when_response_status_code_different_than_expected_and_json
         assert e.expected_status_code == 201
         assert e.status_code == 200
         assert e.endpoint == 'https://analysispreservation-dev.cern.ch/api/endpoint'
+
+
+@responses.activate
+def test_make_request_retries_idempotent_request_on_transient_error(
+        monkeypatch):
+    delays = []
+    monkeypatch.setattr('cap_client.api.base.time.sleep', delays.append)
+    url = 'https://analysispreservation-dev.cern.ch/api/endpoint'
+    responses.add(responses.GET, url, status=503,
+                  headers={'Retry-After': '2'})
+    responses.add(responses.GET, url,
+                  body=ConnectionError('connection reset'))
+    responses.add(responses.GET, url, json={'message': 'success'})
+
+    resp = CapAPI()._make_request(url='endpoint')
+
+    assert resp == {'message': 'success'}
+    assert len(responses.calls) == 3
+    assert delays[0] == 2
+    assert stats.get('retries') == 2
+    assert stats.get('backoff_seconds') == sum(delays)
+
+
+@responses.activate
+def test_make_request_gives_up_after_retry_total(monkeypatch):
+    monkeypatch.setattr('cap_client.api.session.RETRY_TOTAL', 2)
+    responses.add(responses.DELETE,
+                  'https://analysispreservation-dev.cern.ch/api/endpoint',
+                  status=502)
+
+    with raises(BadStatusCode) as e:
+        CapAPI()._make_request(url='endpoint', method='delete')
+
+    assert e.value.status_code == 502
+    assert len(responses.calls) == 3
+
+
+@responses.activate
+def test_make_request_never_retries_post():
+    responses.add(responses.POST,
+                  'https://analysispreservation-dev.cern.ch/api/endpoint',
+                  status=503)
+
+    with raises(BadStatusCode):
+        CapAPI()._make_request(url='endpoint', method='post',
+                               expected_status_code=201)
+
+    assert len(responses.calls) == 1
+    assert stats.get('retries') == 0
+
+
+@responses.activate
+def test_make_request_rewinds_file_body_before_retry(tmpdir):
+    url = 'https://analysispreservation-dev.cern.ch/api/endpoint'
+    responses.add(responses.PUT, url, status=504)
+    responses.add(responses.PUT, url, json={})
+    filepath = tmpdir.join('data.txt')
+    filepath.write_binary(b'some data')
+
+    with open(str(filepath), 'rb') as fp:
+        CapAPI()._make_request(url='endpoint', method='put', data=fp)
+
+    assert [c.request.body.read() if hasattr(c.request.body, 'read') else
+            c.request.body for c in responses.calls] == [b'some data'] * 2
+
+
+@responses.activate
+def test_make_request_does_not_retry_generator_body():
+    responses.add(responses.PUT,
+                  'https://analysispreservation-dev.cern.ch/api/endpoint',
+                  status=503)
+
+    with raises(BadStatusCode):
+        CapAPI()._make_request(url='endpoint', method='put',
+                               data=iter([b'chunk']))
+
+    assert len(responses.calls) == 1
+
+
+def test_retry_delay_is_capped_and_jittered(monkeypatch):
+    monkeypatch.setattr('cap_client.api.session.RETRY_BACKOFF', 1)
+    monkeypatch.setattr('cap_client.api.session.RETRY_BACKOFF_MAX', 5)
+
+    assert all(0 <= retry_delay(10) <= 5 for _ in range(100))
+    assert len({retry_delay(3) for _ in range(10)}) > 1
+
+
+def test_retry_budget_depends_on_method_and_body(monkeypatch):
+    monkeypatch.setattr('cap_client.api.session.RETRY_TOTAL', 3)
+    body = io.BytesIO(b'0123456789')
+    body.seek(4)
+
+    assert retry_budget('get') == (3, None)
+    assert retry_budget('POST', b'data') == (0, None)
+    assert retry_budget('PUT', b'data', retries=1) == (1, None)
+    assert retry_budget('PUT', body) == (3, 4)
+    assert retry_budget('PUT', iter([b'data'])) == (0, None)
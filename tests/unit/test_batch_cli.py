@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of CERN Analysis Preservation Framework.
+# Copyright (C) 2020, 2020 CERN.
+#
+# CERN Analysis Preservation Framework is free software; you can redistribute
+# it and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# CERN Analysis Preservation Framework is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with CERN Analysis Preservation Framework; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+"""Tests for batch commands."""
+
+import json
+
+import pytest
+import responses
+from click import UsageError
+
+from cap_client.batch import load_operations
+
+API = 'https://analysispreservation-dev.cern.ch/api/'
+
+
+def write_manifest(tmpdir, *ops):
+    path = tmpdir.join('ops.jsonl')
+    path.write('\n'.join(json.dumps(op) for op in ops) + '\n')
+    return str(path)
+
+
+@responses.activate
+def test_batch_run_chains_refs_and_skips_after_failure(cli_run, tmpdir):
+    responses.add(responses.POST, API + 'deposits/',
+                  json={'id': 'new-pid', 'metadata': {}}, status=201)
+    responses.add(responses.PUT, API + 'deposits/new-pid',
+                  json={'pid': 'new-pid', 'metadata': {}})
+    responses.add(responses.PATCH, API + 'deposits/new-pid',
+                  json={'metadata': {'title': 'Z'}})
+    responses.add(responses.POST, API + 'deposits/new-pid/actions/publish',
+                  json={'recid': 'rec-id'}, status=202)
+    responses.add(responses.DELETE, API + 'deposits/other-pid', status=404)
+    manifest = write_manifest(
+        tmpdir,
+        {'op': 'create', 'ref': 'a', 'type': 'cms', 'data': {}},
+        {'op': 'delete', 'pid': 'other-pid'},
+        {'op': 'metadata.set', 'ref': 'a', 'field': 'title', 'value': 'Z'},
+        {'op': 'metadata.remove', 'pid': 'other-pid', 'field': 'title'},
+        {'op': 'publish', 'ref': 'a'},
+    )
+
+    res = cli_run('batch run {} --workers 2'.format(manifest))
+
+    assert res.exit_code == 1
+    assert '5 operations' in res.stderr
+    lines = res.stdout.splitlines()
+    assert lines[-2] == 'Some of the operations failed.'
+    report = {r['line']: r for r in map(json.loads, lines[:-2])}
+    assert report[1]['pid'] == 'new-pid'
+    assert report[3]['status'] == 'ok'
+    assert report[5]['result'] == 'rec-id'
+    assert report[2]['status'] == 'error'
+    assert report[4]['status'] == 'skipped'
+
+    new_pid_calls = [c.request.method for c in responses.calls
+                     if 'new-pid' in c.request.url]
+    assert new_pid_calls == ['PATCH', 'POST']
+    create = next(c for c in responses.calls if c.request.method == 'POST')
+    assert json.loads(create.request.body)['$ana_type'] == 'cms'
+
+
+@pytest.mark.parametrize('op, error', [
+    ({'op': 'rename', 'pid': 'x'}, 'unknown operation'),
+    ({'op': 'publish'}, 'missing pid'),
+    ({'op': 'publish', 'ref': 'x'}, 'ref x is not created before'),
+    ({'op': 'permissions.add', 'pid': 'x', 'email': 'a@cern.ch'},
+     'missing rights'),
+    ({'op': 'create', 'pid': 'x', 'data': {}}, 'accepts a ref, not a pid'),
+])
+def test_load_operations_rejects_invalid_lines(op, error):
+    with pytest.raises(UsageError) as e:
+        load_operations(['', json.dumps(op)])
+
+    assert str(e.value).startswith('Line 2: ')
+    assert error in str(e.value)
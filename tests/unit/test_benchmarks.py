@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of CERN Analysis Preservation Framework.
+# Copyright (C) 2020 CERN.
+#
+# CERN Analysis Preservation Framework is free software; you can redistribute
+# it and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# CERN Analysis Preservation Framework is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with CERN Analysis Preservation Framework; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+"""Benchmarks guarding performance characteristics of the client.
+
+Tests asserting timings are marked as `benchmark` and run only with
+`pytest --benchmark`, the others just report them.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tarfile
+import time
+import tracemalloc
+
+import pytest
+
+from cap_client import codec
+from cap_client.api import FilesAPI
+
+MB = 1024 * 1024
+
+
+def test_download_peak_memory_does_not_depend_on_file_size(local_server,
+                                                           tmpdir):
+    size = 64 * MB
+    local_server.routes['/api/deposits/some-pid'] = (200, json.dumps({
+        'links': {'bucket': local_server.url + '/api/files/bucket-id'}
+    }).encode())
+    local_server.routes['/api/files/bucket-id/ntuple.root'] = \
+        (200, os.urandom(size))
+    filepath = str(tmpdir.join('ntuple.root'))
+
+    tracemalloc.start()
+    start = time.time()
+    try:
+        FilesAPI().download('some-pid', 'ntuple.root', filepath,
+                            chunk_size=MB)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    elapsed = time.time() - start
+
+    print('download: {} MB in {:.2f}s, peak memory {:.1f} MB'.format(
+        size // MB, elapsed, peak / MB))
+
+    assert os.path.getsize(filepath) == size
+    assert peak < 8 * MB
+
+
+def make_synthetic_tree(root, files=16, size=MB):
+    """Tree of moderately compressible files (like text ntuple dumps)."""
+    os.makedirs(root)
+    for i in range(files):
+        with open(os.path.join(root, 'f{}.txt'.format(i)), 'wb') as fp:
+            for _ in range(size // 64):
+                fp.write(os.urandom(16).hex().encode() + b' ' * 32)
+
+
+def compress_tree(tmpdir):
+    """Compress synthetic tree with gzip and parallel-gzip, time both."""
+    source = str(tmpdir.join('tree'))
+    make_synthetic_tree(source)
+    api = FilesAPI()
+
+    timings = {}
+    for compression in ['gzip', 'parallel-gzip']:
+        with open(str(tmpdir.join(compression)), 'wb') as fp:
+            start = time.time()
+            api._write_tarball(fp, source, compression=compression)
+            timings[compression] = time.time() - start
+
+        with tarfile.open(str(tmpdir.join(compression)), 'r:gz') as tar:
+            assert len(tar.getnames()) == 17
+
+        print('{}: {:.1f} MB/s'.format(
+            compression, 16 / timings[compression]))
+
+    return timings
+
+
+def test_parallel_gzip_compression_throughput(tmpdir):
+    compress_tree(tmpdir)
+
+
+@pytest.mark.benchmark
+@pytest.mark.skipif((os.cpu_count() or 1) < 4, reason='needs 4 cores')
+def test_parallel_gzip_compression_is_faster(tmpdir):
+    timings = compress_tree(tmpdir)
+
+    assert timings['parallel-gzip'] < timings['gzip'] / 1.5
+
+
+def make_deposit(size):
+    """Deposit-like metadata of roughly `size` bytes when serialized."""
+    entry = {
+        'dataset': '/DoubleMuon/Run2018A-17Sep2018-v2/MINIAOD',
+        'events': 123456789,
+        'luminosity': 13.98,
+        'triggers': ['HLT_Mu17_TrkIsoVVL_Mu8_TrkIsoVVL_DZ_Mass3p8'] * 3,
+        'comment': 'Signal région, ϕ → μμ',
+        'validated': True,
+        'parent': None,
+    }
+    entries = size // len(json.dumps(entry))
+    return {
+        'metadata': {
+            'basic_info': {'analysis_title': 'Benchmark analysis'},
+            'input_datasets': [dict(entry, index=i) for i in range(entries)],
+        },
+        'links': {'bucket': 'https://analysispreservation.cern.ch/api/files'},
+    }
+
+
+def time_codec(monkeypatch):
+    """Decode and encode a large deposit with each backend, time both."""
+    deposit = make_deposit(8 * MB)
+    document = json.dumps(deposit).encode()
+
+    timings = {}
+    for backend in ['json', codec.JSON_BACKEND]:
+        monkeypatch.setattr('cap_client.codec.JSON_BACKEND', backend)
+        timings[backend] = float('inf')
+        for _ in range(3):
+            start = time.time()
+            decoded = codec.loads(document)
+            encoded = codec.dumps(decoded)
+            timings[backend] = min(timings[backend], time.time() - start)
+
+        assert decoded == deposit
+        assert codec.loads(encoded) == deposit
+
+        print('{}: {:.1f} MB/s'.format(
+            backend, 2 * len(document) / MB / timings[backend]))
+
+    return timings
+
+
+def test_json_codec_throughput_on_deposit_sized_payload(monkeypatch):
+    time_codec(monkeypatch)
+
+
+@pytest.mark.benchmark
+@pytest.mark.skipif(codec.JSON_BACKEND != 'orjson',
+                    reason='needs orjson')
+def test_orjson_codec_is_faster(monkeypatch):
+    timings = time_codec(monkeypatch)
+
+    assert timings['orjson'] < timings['json']
+
+
+COLD_START = '''
+import json, sys, time
+start = time.perf_counter()
+from cap_client.cli import cli
+try:
+    cli(sys.argv[1:], prog_name='cap-client')
+except SystemExit:
+    pass
+print(json.dumps({'elapsed': time.perf_counter() - start,
+                  'modules': sorted(sys.modules)}), file=sys.stderr)
+'''
+# generous, the HTTP stack alone takes longer than that to import
+COLD_START_LIMIT = float(os.environ.get('CAP_COLD_START_LIMIT', 0.15))
+
+
+COLD_STARTS = [
+    (['--help'], {}),
+    ([], {'_CAP_CLIENT_COMPLETE': 'bash_complete',
+          'COMP_WORDS': 'cap-client ', 'COMP_CWORD': '1'}),
+]
+
+
+def cold_start(args, env):
+    """Run the CLI in new processes, return best time and modules."""
+    runs = []
+    for _ in range(3):
+        proc = subprocess.run([sys.executable, '-c', COLD_START] + args,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              env=dict(os.environ, **env), check=True)
+        runs.append(json.loads(proc.stderr.decode().splitlines()[-1]))
+
+    elapsed = min(run['elapsed'] for run in runs)
+    print('cold start: {:.0f} ms'.format(elapsed * 1000))
+
+    return elapsed, set(runs[0]['modules'])
+
+
+@pytest.mark.parametrize('args, env', COLD_STARTS)
+def test_cli_cold_start_does_not_import_http_stack(args, env):
+    _, modules = cold_start(args, env)
+
+    assert not modules & {'requests', 'urllib3', 'cap_client.api.base',
+                          'cap_client.cli.files_cli'}
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('args, env', COLD_STARTS)
+def test_cli_cold_start_time(args, env):
+    elapsed, _ = cold_start(args, env)
+
+    assert elapsed < COLD_START_LIMIT
+
+
+def test_lazy_commands_help_matches_subcommands():
+    from cap_client.cli import COMMANDS, cli
+
+    for name, (_, short_help) in COMMANDS.items():
+        assert cli.get_command(None, name).get_short_help_str() == short_help
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of CERN Analysis Preservation Framework.
+# Copyright (C) 2020, 2020 CERN.
+#
+# CERN Analysis Preservation Framework is free software; you can redistribute
+# it and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# CERN Analysis Preservation Framework is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with CERN Analysis Preservation Framework; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+"""Tests for HTTP cache."""
+
+import json
+import os
+import stat
+
+from cap_client.api import MetadataAPI
+from cap_client.api.cache import HTTPCache, enable_http_cache
+from cap_client.api.session import stats
+
+
+def test_cache_keys_depend_on_accept_header_and_token():
+    url = 'https://analysispreservation.cern.ch/api/deposits/some-pid'
+
+    keys = {
+        HTTPCache.key(url, 'application/json', 'token'),
+        HTTPCache.key(url, 'application/basic+json', 'token'),
+        HTTPCache.key(url, 'application/json', 'other-token'),
+    }
+
+    assert len(keys) == 3
+    assert 'token' not in ''.join(keys)
+
+
+def test_cache_evicts_least_recently_used_responses(tmpdir):
+    cache = HTTPCache(str(tmpdir.join('http.db')), max_size=10)
+
+    cache.put('a', b'aaaa', etag='"1"')
+    cache.put('b', b'bbbb', etag='"2"')
+    cache.get('a')
+    cache.put('c', b'cccc', etag='"3"')
+
+    assert cache.get('a').body == b'aaaa'
+    assert cache.get('b') is None
+    assert cache.get('c').etag == '"3"'
+    assert cache.size() == 8
+
+
+def test_cache_is_accessible_only_to_current_user(tmpdir, monkeypatch):
+    path = tmpdir.mkdir('cache')
+    path.chmod(0o755)
+    monkeypatch.setenv('CAP_CACHE_DIR', str(path))
+
+    cache = HTTPCache()
+    cache.put('a', b'aaaa', etag='"1"')
+    cache.close()
+
+    assert stat.S_IMODE(os.stat(str(path)).st_mode) == 0o700
+    assert stat.S_IMODE(os.stat(cache.filepath).st_mode) == 0o600
+
+
+def add_analysis(server, metadata, headers={'ETag': '"1"'}):
+    server.routes['/api/deposits/some-pid'] = (200, json.dumps({
+        'metadata': metadata,
+    }).encode(), headers)
+
+
+def test_make_request_revalidates_cached_response(local_server):
+    enable_http_cache()
+    add_analysis(local_server, {'title': 'cached'})
+
+    assert MetadataAPI().get('some-pid') == {'title': 'cached'}
+    assert MetadataAPI().get('some-pid') == {'title': 'cached'}
+
+    headers = local_server.requests[-1][2]
+    assert headers['If-None-Match'] == '"1"'
+    assert stats.get('cache_hits') == 1
+
+
+def test_make_request_replaces_changed_response(local_server):
+    enable_http_cache()
+    add_analysis(local_server, {'title': 'old'})
+    MetadataAPI().get('some-pid')
+    add_analysis(local_server, {'title': 'new'}, {'ETag': '"2"'})
+
+    assert MetadataAPI().get('some-pid') == {'title': 'new'}
+    assert MetadataAPI().get('some-pid') == {'title': 'new'}
+    assert stats.get('cache_hits') == 1
+
+
+def test_make_request_does_not_cache_when_disabled(local_server):
+    add_analysis(local_server, {'title': 'cached'})
+
+    MetadataAPI().get('some-pid')
+    MetadataAPI().get('some-pid')
+
+    assert 'If-None-Match' not in local_server.requests[-1][2]
+
+
+def test_cli_no_cache_flag_bypasses_cache(local_server, cli_run):
+    enable_http_cache()
+    add_analysis(local_server, {'title': 'cached'})
+
+    cli_run('metadata get --pid some-pid')
+    res = cli_run('--no-cache metadata get --pid some-pid')
+
+    assert res.exit_code == 0
+    assert 'If-None-Match' not in local_server.requests[-1][2]
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of CERN Analysis Preservation Framework.
+# Copyright (C) 2020, 2020 CERN.
+#
+# CERN Analysis Preservation Framework is free software; you can redistribute
+# it and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# CERN Analysis Preservation Framework is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with CERN Analysis Preservation Framework; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+"""Tests for JSON codec."""
+
+import json
+
+import pytest
+
+from cap_client import codec
+
+DOCUMENTS = [
+    {'basic_info': {'title': 'Zürich ϕ→μμ', 'ids': [1, 2.5, None, True]}},
+    [{'op': 'replace', 'path': '/a/0', 'value': ''}],
+    'plain string',
+    {'huge': 2 ** 70},
+]
+
+
+@pytest.fixture(params=['orjson', 'json'])
+def backend(request, monkeypatch):
+    if request.param == 'orjson':
+        pytest.importorskip('orjson')
+    monkeypatch.setattr('cap_client.codec.JSON_BACKEND', request.param)
+    return request.param
+
+
+@pytest.mark.parametrize('document', DOCUMENTS)
+def test_codec_round_trip_matches_stdlib(backend, document):
+    encoded = codec.dumps(document)
+
+    assert isinstance(encoded, bytes)
+    assert json.loads(encoded) == document
+    assert codec.loads(encoded) == document
+    assert codec.loads(json.dumps(document)) == document
+
+
+def test_codec_loads_falls_back_to_stdlib_for_nan(backend):
+    assert codec.loads(b'{"x": NaN}')['x'] != codec.loads(b'{"x": NaN}')['x']
+
+
+def test_codec_dumps_non_string_keys_like_stdlib(backend):
+    assert json.loads(codec.dumps({1: 'a'})) == {'1': 'a'}
+
+
+@pytest.mark.parametrize('data', [b'', b'not json', '{"a": }'])
+def test_codec_loads_raises_value_error_on_invalid_json(backend, data):
+    with pytest.raises(ValueError):
+        codec.loads(data)
+
+
+def test_codec_dumps_non_finite_floats_as_null_with_orjson(monkeypatch):
+    pytest.importorskip('orjson')
+    monkeypatch.setattr('cap_client.codec.JSON_BACKEND', 'orjson')
+
+    assert codec.dumps({'x': float('inf')}) == b'{"x":null}'
+
+
+def test_codec_dumps_sort_keys(backend):
+    assert codec.dumps({'b': 1, 'a': {'d': 2, 'c': 3}}, sort_keys=True) == \
+        b'{"a":{"c":3,"d":2},"b":1}'
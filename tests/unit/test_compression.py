@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of CERN Analysis Preservation Framework.
+# Copyright (C) 2020 CERN.
+#
+# CERN Analysis Preservation Framework is free software; you can redistribute
+# it and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# CERN Analysis Preservation Framework is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with CERN Analysis Preservation Framework; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+"""Tests for compressed streams."""
+
+import gzip
+import io
+import lzma
+import os
+import zlib
+
+import pytest
+
+from cap_client.compression import ParallelGzipWriter, open_compressed
+
+
+def compress(data, **kwargs):
+    out = io.BytesIO()
+    with ParallelGzipWriter(out, **kwargs) as writer:
+        for i in range(0, len(data), 1000):
+            writer.write(data[i:i + 1000])
+
+    return out.getvalue()
+
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'hello world',
+    os.urandom(100 * 1024),
+    b'compressible ' * 50000,
+])
+def test_parallel_gzip_output_is_a_single_gzip_member(data):
+    compressed = compress(data, block_size=16 * 1024, workers=3)
+
+    decompressor = zlib.decompressobj(wbits=31)
+    assert decompressor.decompress(compressed) == data
+    assert decompressor.eof
+    assert decompressor.unused_data == b''
+    assert gzip.decompress(compressed) == data
+
+
+def test_parallel_gzip_blocks_are_primed_with_previous_block():
+    data = os.urandom(8 * 1024) * 16
+
+    primed = compress(data, block_size=8 * 1024)
+
+    assert len(primed) < len(data) / 4
+
+
+@pytest.mark.parametrize('compression,decompress', [
+    ('gzip', gzip.decompress),
+    ('parallel-gzip', gzip.decompress),
+    ('xz', lzma.decompress),
+    ('none', lambda data: data),
+])
+def test_open_compressed_leaves_fileobj_open(compression, decompress):
+    out = io.BytesIO()
+    with open_compressed(out, compression, level=1) as writer:
+        writer.write(b'data' * 100)
+
+    assert not out.closed
+    assert decompress(out.getvalue()) == b'data' * 100
+
+
+def test_open_compressed_unknown_compression():
+    with pytest.raises(ValueError):
+        open_compressed(io.BytesIO(), 'zip')
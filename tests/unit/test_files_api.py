@@ -22,3 +22,288 @@
 # waive the privileges and immunities granted to it by virtue of its status
 # as an Intergovernmental Organization or submit itself to any jurisdiction.
 """Tests for Files API."""
+
+import hashlib
+import io
+import json
+import os
+import tarfile
+import threading
+import time
+
+import pytest
+import responses
+from requests.exceptions import ChunkedEncodingError
+
+from cap_client.api import FilesAPI
+from cap_client.api.cache import BucketLinkCache
+from cap_client.errors import BadStatusCode, ChecksumMismatch, \
+    TransferError
+from cap_client.hashing import HashCache
+
+BUCKET_URL = 'http://analysispreservation.cern.ch/api/files/bucket-id'
+
+
+def add_bucket_link():
+    responses.add(
+        responses.GET,
+        'https://analysispreservation-dev.cern.ch/api/deposits/some-pid',
+        json={'links': {'bucket': BUCKET_URL}},
+        status=200)
+
+
+@responses.activate
+def test_download_streams_file_in_chunks(tmpdir):
+    add_bucket_link()
+    responses.add(responses.GET, BUCKET_URL + '/test.txt',
+                  body=b'0123456789', stream=True, status=200)
+    filepath = str(tmpdir.join('test.txt'))
+
+    FilesAPI().download('some-pid', 'test.txt', filepath, chunk_size=3)
+
+    with open(filepath, 'rb') as fp:
+        assert fp.read() == b'0123456789'
+    assert not os.path.exists(filepath + '.part')
+
+
+@responses.activate
+def test_download_keeps_existing_file_when_transfer_fails(tmpdir):
+    add_bucket_link()
+    responses.add(responses.GET, BUCKET_URL + '/test.txt',
+                  body=ChunkedEncodingError('connection dropped'),
+                  status=200)
+    filepath = str(tmpdir.join('test.txt'))
+    with open(filepath, 'wb') as fp:
+        fp.write(b'old content')
+
+    with pytest.raises(ChunkedEncodingError):
+        FilesAPI().download('some-pid', 'test.txt', filepath)
+
+    with open(filepath, 'rb') as fp:
+        assert fp.read() == b'old content'
+    assert not os.path.exists(filepath + '.part')
+
+
+def add_local_file(server, body, headers=None):
+    server.routes['/api/deposits/some-pid'] = (200, json.dumps({
+        'links': {'bucket': server.url + '/api/files/bucket-id'}
+    }).encode())
+    server.routes['/api/files/bucket-id/data.root'] = \
+        (200, body, headers or {'ETag': '"md5:abc"'})
+
+
+def test_download_interrupted_keeps_part_file(local_server, tmpdir):
+    add_local_file(local_server, b'0123456789')
+    local_server.drop_after['/api/files/bucket-id/data.root'] = 4
+    filepath = str(tmpdir.join('data.root'))
+
+    with pytest.raises(TransferError):
+        FilesAPI().download('some-pid', 'data.root', filepath, chunk_size=2)
+
+    assert not os.path.exists(filepath)
+    with open(filepath + '.part', 'rb') as fp:
+        assert fp.read() == b'0123'
+    with open(filepath + '.part.json') as fp:
+        assert json.load(fp)['size'] == 10
+
+
+def test_download_resumes_from_part_file(local_server, tmpdir):
+    add_local_file(local_server, b'0123456789')
+    filepath = str(tmpdir.join('data.root'))
+    url = local_server.url + '/api/files/bucket-id/data.root'
+    with open(filepath + '.part', 'wb') as fp:
+        fp.write(b'0123')
+    with open(filepath + '.part.json', 'w') as fp:
+        json.dump({'url': url, 'size': 10, 'checksum': '"md5:abc"'}, fp)
+
+    FilesAPI().download('some-pid', 'data.root', filepath)
+
+    with open(filepath, 'rb') as fp:
+        assert fp.read() == b'0123456789'
+    assert local_server.requests[-1][2]['Range'] == 'bytes=4-'
+    assert not os.path.exists(filepath + '.part')
+    assert not os.path.exists(filepath + '.part.json')
+
+
+def test_download_falls_back_to_full_fetch_when_range_ignored(
+        local_server, tmpdir):
+    add_local_file(local_server, b'0123456789')
+    local_server.accept_ranges = False
+    filepath = str(tmpdir.join('data.root'))
+    url = local_server.url + '/api/files/bucket-id/data.root'
+    with open(filepath + '.part', 'wb') as fp:
+        fp.write(b'0123')
+    with open(filepath + '.part.json', 'w') as fp:
+        json.dump({'url': url, 'size': 10, 'checksum': '"md5:abc"'}, fp)
+
+    FilesAPI().download('some-pid', 'data.root', filepath)
+
+    with open(filepath, 'rb') as fp:
+        assert fp.read() == b'0123456789'
+
+
+def test_download_restarts_when_file_changed_on_server(local_server, tmpdir):
+    add_local_file(local_server, b'abcdefghij', {'ETag': '"md5:new"'})
+    filepath = str(tmpdir.join('data.root'))
+    url = local_server.url + '/api/files/bucket-id/data.root'
+    with open(filepath + '.part', 'wb') as fp:
+        fp.write(b'0123')
+    with open(filepath + '.part.json', 'w') as fp:
+        json.dump({'url': url, 'size': 10, 'checksum': '"md5:abc"'}, fp)
+
+    FilesAPI().download('some-pid', 'data.root', filepath)
+
+    with open(filepath, 'rb') as fp:
+        assert fp.read() == b'abcdefghij'
+    assert 'Range' not in local_server.requests[-1][2]
+
+
+def make_tree(root):
+    os.makedirs(os.path.join(root, 'sub'))
+    for i in range(20):
+        with open(os.path.join(root, 'sub', 'f{}.txt'.format(i)), 'wb') as fp:
+            fp.write(os.urandom(64 * 1024))
+
+
+def test_upload_directory_streams_tarball_without_temp_file(
+        local_server, tmpdir, monkeypatch):
+    add_local_file(local_server, b'')
+    local_server.routes['/api/files/bucket-id/dir.tar.gz'] = (200, b'{}')
+    monkeypatch.setattr('tempfile.TemporaryFile', None)
+    make_tree(str(tmpdir.join('dir')))
+    monkeypatch.chdir(str(tmpdir))
+
+    FilesAPI().upload_directory('some-pid', 'dir', stream=True)
+
+    _, path, headers, body = local_server.requests[-1]
+    assert path == '/api/files/bucket-id/dir.tar.gz'
+    assert headers['Transfer-Encoding'] == 'chunked'
+    with tarfile.open(fileobj=io.BytesIO(body), mode='r:gz') as tar:
+        names = tar.getnames()
+    assert len(names) == 22
+    assert 'dir/sub/f19.txt' in names
+
+
+def test_stream_tarball_stops_producer_when_reader_goes_away(
+        tmpdir, monkeypatch):
+    make_tree(str(tmpdir.join('dir')))
+    monkeypatch.chdir(str(tmpdir))
+    threads = threading.active_count()
+
+    chunks = FilesAPI()._stream_tarball('dir', chunk_size=1024)
+    next(chunks)
+    chunks.close()
+
+    assert threading.active_count() == threads
+
+
+def md5(data):
+    return 'md5:' + hashlib.md5(data).hexdigest()
+
+
+def test_download_with_verify_stores_digest_in_hash_cache(
+        local_server, tmpdir, monkeypatch):
+    add_local_file(local_server, b'0123456789')
+    local_server.routes['/api/deposits/some-pid/files'] = (200, json.dumps([
+        {'filename': 'data.root', 'checksum': md5(b'0123456789')}
+    ]).encode())
+    filepath = str(tmpdir.join('data.root'))
+
+    FilesAPI().download('some-pid', 'data.root', filepath, verify=True)
+
+    monkeypatch.setattr('cap_client.hashing.file_digests', None)
+    assert 'md5:' + HashCache().md5(filepath) == md5(b'0123456789')
+
+
+def test_download_with_verify_hashes_resumed_part(local_server, tmpdir):
+    add_local_file(local_server, b'0123456789')
+    filepath = str(tmpdir.join('data.root'))
+    url = local_server.url + '/api/files/bucket-id/data.root'
+    with open(filepath + '.part', 'wb') as fp:
+        fp.write(b'0123')
+    with open(filepath + '.part.json', 'w') as fp:
+        json.dump({'url': url, 'size': 10, 'checksum': '"md5:abc"'}, fp)
+
+    FilesAPI()._download_file(url, filepath, 1024,
+                              checksum=md5(b'0123456789'))
+
+    with open(filepath, 'rb') as fp:
+        assert fp.read() == b'0123456789'
+
+
+def test_download_with_verify_removes_corrupted_file(local_server, tmpdir):
+    add_local_file(local_server, b'0123456789')
+    filepath = str(tmpdir.join('data.root'))
+    url = local_server.url + '/api/files/bucket-id/data.root'
+    with open(filepath, 'wb') as fp:
+        fp.write(b'old content')
+
+    with pytest.raises(ChecksumMismatch):
+        FilesAPI()._download_file(url, filepath, 1024,
+                                  checksum=md5(b'something else'))
+
+    with open(filepath, 'rb') as fp:
+        assert fp.read() == b'old content'
+    assert os.listdir(str(tmpdir)) == ['data.root']
+
+
+def test_bucket_link_is_fetched_once_per_pid(local_server, tmpdir):
+    add_local_file(local_server, b'0123456789')
+    api = FilesAPI()
+
+    api.download('some-pid', 'data.root', str(tmpdir.join('a')))
+    api.download('some-pid', 'data.root', str(tmpdir.join('b')))
+
+    paths = [r[1] for r in local_server.requests]
+    assert paths.count('/api/deposits/some-pid') == 1
+
+
+def test_stale_bucket_link_is_refreshed_on_404(local_server, tmpdir):
+    add_local_file(local_server, b'0123456789')
+    FilesAPI().download('some-pid', 'data.root', str(tmpdir.join('a')))
+    local_server.routes['/api/deposits/some-pid'] = (200, json.dumps({
+        'links': {'bucket': local_server.url + '/api/files/new-bucket'}
+    }).encode())
+    local_server.routes['/api/files/new-bucket/data.root'] = \
+        (200, b'new content')
+    del local_server.routes['/api/files/bucket-id/data.root']
+
+    FilesAPI().download('some-pid', 'data.root', str(tmpdir.join('b')))
+
+    with open(str(tmpdir.join('b')), 'rb') as fp:
+        assert fp.read() == b'new content'
+    assert [r[1] for r in local_server.requests[-3:]] == [
+        '/api/files/bucket-id/data.root',
+        '/api/deposits/some-pid',
+        '/api/files/new-bucket/data.root',
+    ]
+
+
+def test_stale_bucket_link_is_dropped_when_analysis_is_gone(
+        local_server, tmpdir):
+    add_local_file(local_server, b'0123456789')
+    FilesAPI().download('some-pid', 'data.root', str(tmpdir.join('a')))
+    del local_server.routes['/api/deposits/some-pid']
+    del local_server.routes['/api/files/bucket-id/data.root']
+
+    for _ in range(2):
+        with pytest.raises(BadStatusCode):
+            FilesAPI().download('some-pid', 'data.root', str(tmpdir.join('b')))
+
+    assert [r[1] for r in local_server.requests[-3:]] == [
+        '/api/files/bucket-id/data.root',
+        '/api/deposits/some-pid',
+        '/api/deposits/some-pid',
+    ]
+
+
+def test_bucket_link_cache_persists_links_until_they_expire(
+        tmpdir, monkeypatch):
+    filepath = str(tmpdir.join('bucket_links.json'))
+    BucketLinkCache(ttl=60, filepath=filepath).put('pid', 'bucket')
+
+    assert BucketLinkCache(ttl=60, filepath=filepath).get('pid') == 'bucket'
+
+    now = time.time()
+    monkeypatch.setattr('time.time', lambda: now + 61)
+    assert BucketLinkCache(filepath=filepath).get('pid') is None
@@ -1,6 +1,10 @@
+import hashlib
+import io
 import json
 import os
+import tarfile
 
+import pytest
 import responses
 
 
@@ -28,6 +32,20 @@ def test_files_get(cli_run):
     }]
 
 
+@responses.activate
+def test_files_get_with_ndjson_output(cli_run):
+    responses.add(
+        responses.GET,
+        "https://analysispreservation-dev.cern.ch/api/deposits/some-pid/files",
+        json=[{"filename": "a.txt"}, {"filename": "b.txt"}],
+        status=200)
+
+    res = cli_run("--output ndjson files get -p some-pid")
+
+    assert res.exit_code == 0
+    assert res.output == '{"filename":"a.txt"}\n{"filename":"b.txt"}\n'
+
+
 def test_files_get_no_pid_given(cli_run):
     res = cli_run("files get")
 
@@ -397,3 +415,417 @@ def test_files_upload_pid_not_exists(cli_run):
 
     assert res.exit_code == 1
     assert res.stripped_output == 'PID does not exist.'
+
+
+def add_bucket_with_files(*names):
+    responses.add(
+        responses.GET,
+        'https://analysispreservation-dev.cern.ch/api/deposits/some-pid/files',
+        json=[{'filename': name, 'filesize': 4, 'checksum': ''}
+              for name in names],
+        status=200)
+    responses.add(
+        responses.GET,
+        "https://analysispreservation-dev.cern.ch/api/deposits/some-pid",
+        json={
+            'links': {
+                'bucket': 'http://analysispreservation.cern.ch/api/files/bucket-id'
+            }
+        },
+        status=200)
+    for name in names:
+        responses.add(
+            responses.GET,
+            'http://analysispreservation.cern.ch/api/files/bucket-id/' + name,
+            body=name[:4].encode(),
+            stream=True,
+            status=200)
+
+
+@responses.activate
+def test_files_download_all(runner):
+    add_bucket_with_files('a.txt', 'b.root', 'sub/c.root')
+
+    with runner.isolated_filesystem():
+        os.mkdir('out')
+        res = runner.run("files download -p some-pid --all -d out -w 2")
+        with open('out/sub/c.root') as fp:
+            content = fp.read()
+        downloaded = sorted(os.listdir('out'))
+
+    assert res.exit_code == 0
+    assert content == 'sub/'
+    assert downloaded == ['a.txt', 'b.root', 'sub']
+    assert '3 of 3 files transferred' in res.output
+    # bucket listed and looked up once
+    assert len(responses.calls) == 5
+
+
+@responses.activate
+def test_files_download_with_pattern(runner):
+    add_bucket_with_files('a.txt', 'b.root')
+
+    with runner.isolated_filesystem():
+        res = runner.run("files download -p some-pid --pattern *.root")
+        downloaded = sorted(os.listdir('.'))
+
+    assert res.exit_code == 0
+    assert downloaded == ['b.root']
+    assert 'b.root: 4.0 B in' in res.output
+
+
+@responses.activate
+def test_files_download_all_when_file_fails(runner):
+    add_bucket_with_files('a.txt', 'b.txt')
+    responses.replace(
+        responses.GET,
+        'http://analysispreservation.cern.ch/api/files/bucket-id/b.txt',
+        json={'message': 'Object does not exists.'},
+        status=404)
+
+    with runner.isolated_filesystem():
+        res = runner.run("files download -p some-pid --all")
+
+    assert res.exit_code == 1
+    assert 'b.txt: failed (Object does not exists.)' in res.output
+    assert '1 of 2 files transferred' in res.output
+    assert 'Some of the files failed to download.' in res.output
+
+
+def test_files_download_all_with_filename(cli_run):
+    res = cli_run("files download -p some-pid --all test.txt")
+
+    assert res.exit_code == 2
+    assert 'FILENAME cannot be used together with --all/--pattern.' in res.output
+
+
+@responses.activate
+def test_files_download_all_refuses_unsafe_filenames(runner):
+    add_bucket_with_files('../evil.txt')
+
+    with runner.isolated_filesystem():
+        os.mkdir('out')
+        res = runner.run("files download -p some-pid --all -d out")
+
+    assert res.exit_code == 1
+    assert '../evil.txt: failed (Unsafe filename ../evil.txt.)' in res.output
+
+
+def add_bucket_link():
+    responses.add(
+        responses.GET,
+        "https://analysispreservation-dev.cern.ch/api/deposits/some-pid",
+        json={
+            'links': {
+                'bucket': 'http://analysispreservation.cern.ch/api/files/bucket-id'
+            }
+        },
+        status=200)
+
+
+def add_upload(name, status=200):
+    responses.add(
+        responses.PUT,
+        'http://analysispreservation.cern.ch/api/files/bucket-id/' + name,
+        json={'key': name} if status == 200 else {'message': 'Error'},
+        status=status)
+
+
+def make_files(*names):
+    for name in names:
+        with open(name, 'wb') as fp:
+            fp.write(b'Hello world')
+
+
+@responses.activate
+def test_files_upload_multiple_files_and_globs(runner):
+    add_bucket_link()
+    for name in ['a.txt', 'b.root', 'c.root']:
+        add_upload(name)
+
+    with runner.isolated_filesystem():
+        make_files('a.txt', 'b.root', 'c.root')
+        res = runner.run("files upload -p some-pid a.txt *.root -w 2")
+
+    assert res.exit_code == 0
+    assert '3 of 3 files transferred, 33.0 B' in res.output
+    assert 'Per-file latency: avg' in res.output
+    # bucket link looked up once
+    assert len(responses.calls) == 4
+
+
+@responses.activate
+def test_files_upload_multiple_retries_failed_files(runner):
+    add_bucket_link()
+    add_upload('a.txt')
+    add_upload('b.txt', status=503)
+    add_upload('b.txt')
+
+    with runner.isolated_filesystem():
+        make_files('a.txt', 'b.txt')
+        res = runner.run("files upload -p some-pid a.txt b.txt")
+
+    assert res.exit_code == 0
+    assert '2 of 2 files transferred' in res.output
+    assert len(responses.calls) == 4
+
+
+@responses.activate
+def test_files_upload_multiple_retries_each_file_only_retries_times(runner):
+    add_bucket_link()
+    add_upload('a.txt', status=503)
+    add_upload('b.txt')
+
+    with runner.isolated_filesystem():
+        make_files('a.txt', 'b.txt')
+        res = runner.run("files upload -p some-pid a.txt b.txt --retries 1")
+
+    assert res.exit_code == 1
+    assert [c.request.url.endswith('/a.txt')
+            for c in responses.calls].count(True) == 2
+
+
+@responses.activate
+def test_files_upload_multiple_does_not_retry_client_errors(runner):
+    add_bucket_link()
+    add_upload('a.txt')
+    add_upload('b.txt', status=400)
+
+    with runner.isolated_filesystem():
+        make_files('a.txt', 'b.txt')
+        res = runner.run("files upload -p some-pid a.txt b.txt")
+
+    assert res.exit_code == 1
+    assert 'b.txt: failed (Error)' in res.output
+    assert 'Some of the files failed to upload.' in res.output
+    assert len(responses.calls) == 3
+
+
+def test_files_upload_glob_without_matches(cli_run):
+    res = cli_run("files upload -p some-pid *.missing")
+
+    assert res.exit_code == 2
+    assert "Pattern '*.missing' did not match any files." in res.output
+
+
+def test_files_upload_multiple_with_output_filename(runner):
+    with runner.isolated_filesystem():
+        make_files('a.txt', 'b.txt')
+        res = runner.run("files upload -p some-pid -o c.txt a.txt b.txt")
+
+    assert res.exit_code == 2
+    assert '--output-filename cannot be used with multiple files.' in res.output
+
+
+def test_files_upload_multiple_with_same_name(runner):
+    with runner.isolated_filesystem():
+        os.mkdir('x')
+        os.mkdir('y')
+        make_files('x/a.txt', 'y/a.txt', 'b.txt')
+        res = runner.run("files upload -p some-pid x/a.txt b.txt y/a.txt")
+
+    assert res.exit_code == 2
+    assert 'Multiple files named a.txt.' in res.output
+
+
+@responses.activate
+@pytest.mark.parametrize('compression,fname,opener', [
+    ('xz', 'dir.tar.xz', 'r:xz'),
+    ('none', 'dir.tar', 'r:'),
+    ('parallel-gzip', 'dir.tar.gz', 'r:gz'),
+])
+def test_files_upload_directory_with_compression(runner, compression, fname,
+                                                 opener):
+    uploaded = []
+
+    def upload_callback(request):
+        uploaded.append(request.body)
+        return 200, {}, json.dumps({'key': fname})
+
+    add_bucket_link()
+    responses.add_callback(
+        responses.PUT,
+        'http://analysispreservation.cern.ch/api/files/bucket-id/' + fname,
+        callback=upload_callback)
+
+    with runner.isolated_filesystem():
+        os.mkdir('dir')
+        make_files('dir/a.txt')
+        res = runner.run("files upload -p some-pid --yes-i-know "
+                         "--compression {} --level 1 dir".format(compression))
+
+    with tarfile.open(fileobj=io.BytesIO(uploaded[0]), mode=opener) as tar:
+        assert tar.getnames() == ['dir', 'dir/a.txt']
+    assert res.exit_code == 0
+
+
+def add_remote_files(files):
+    responses.add(
+        responses.GET,
+        'https://analysispreservation-dev.cern.ch/api/deposits/some-pid/files',
+        json=[{
+            'filename': name,
+            'filesize': len(content),
+            'checksum': 'md5:' + hashlib.md5(content).hexdigest()
+        } for name, content in files.items()],
+        status=200)
+
+
+@responses.activate
+def test_files_sync_uploads_new_and_changed_files(runner):
+    add_remote_files({'same.txt': b'same', 'changed.txt': b'old!',
+                      'extra.txt': b'extra'})
+    add_bucket_link()
+    add_upload('changed.txt')
+    add_upload('sub/new.txt')
+
+    with runner.isolated_filesystem():
+        os.makedirs('dir/sub')
+        for name, content in [('same.txt', b'same'), ('changed.txt', b'new!'),
+                              ('sub/new.txt', b'new')]:
+            with open('dir/' + name, 'wb') as fp:
+                fp.write(content)
+
+        res = runner.run("files sync -p some-pid dir")
+
+    uploaded = sorted(c.request.url for c in responses.calls
+                      if c.request.method == 'PUT')
+    assert res.exit_code == 0
+    assert uploaded == [
+        'http://analysispreservation.cern.ch/api/files/bucket-id/changed.txt',
+        'http://analysispreservation.cern.ch/api/files/bucket-id/sub/new.txt',
+    ]
+    assert '2 uploaded, 0 removed, 1 unchanged.' in res.output
+
+
+@responses.activate
+def test_files_sync_with_delete(runner):
+    add_remote_files({'same.txt': b'same', 'extra.txt': b'extra'})
+    add_bucket_link()
+    responses.add(
+        responses.DELETE,
+        'http://analysispreservation.cern.ch/api/files/bucket-id/extra.txt',
+        status=204)
+
+    with runner.isolated_filesystem():
+        os.mkdir('dir')
+        with open('dir/same.txt', 'wb') as fp:
+            fp.write(b'same')
+
+        res = runner.run("files sync -p some-pid --delete dir")
+
+    assert res.exit_code == 0
+    assert 'extra.txt: removed' in res.output
+    assert '0 uploaded, 1 removed, 1 unchanged.' in res.output
+
+
+@responses.activate
+def test_files_sync_dry_run(runner):
+    add_remote_files({'extra.txt': b'extra'})
+
+    with runner.isolated_filesystem():
+        os.mkdir('dir')
+        with open('dir/new.txt', 'wb') as fp:
+            fp.write(b'new')
+
+        res = runner.run("files sync -p some-pid --delete --dry-run dir")
+
+    assert res.exit_code == 0
+    assert res.stripped_output == ('upload: new.txt\n'
+                                   'remove: extra.txt\n'
+                                   '1 to upload, 1 to remove, 0 unchanged.')
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_files_upload_with_verify(runner):
+    add_bucket_link()
+    responses.add(
+        responses.PUT,
+        'http://analysispreservation.cern.ch/api/files/bucket-id/a.txt',
+        json={'key': 'a.txt',
+              'checksum': 'md5:' + hashlib.md5(b'Hello world').hexdigest()},
+        status=200)
+
+    with runner.isolated_filesystem():
+        make_files('a.txt')
+        res = runner.run("files upload -p some-pid --verify a.txt")
+
+    assert res.exit_code == 0
+    assert res.stripped_output == 'File uploaded successfully.'
+
+
+@responses.activate
+def test_files_upload_with_verify_when_checksum_mismatch(runner):
+    add_bucket_link()
+    responses.add(
+        responses.PUT,
+        'http://analysispreservation.cern.ch/api/files/bucket-id/a.txt',
+        json={'key': 'a.txt', 'checksum': 'md5:0123'},
+        status=200)
+
+    with runner.isolated_filesystem():
+        make_files('a.txt')
+        res = runner.run("files upload -p some-pid --verify a.txt")
+
+    assert res.exit_code == 1
+    assert 'Checksum mismatch for a.txt (expected md5:0123, got md5:' \
+        in res.output
+
+
+@responses.activate
+def test_files_download_all_with_verify(runner):
+    add_bucket_with_files('a.txt', 'b.txt')
+    responses.replace(
+        responses.GET,
+        'https://analysispreservation-dev.cern.ch/api/deposits/some-pid/files',
+        json=[{'filename': 'a.txt', 'filesize': 4,
+               'checksum': 'md5:' + hashlib.md5(b'a.tx').hexdigest()},
+              {'filename': 'b.txt', 'filesize': 4, 'checksum': 'md5:0123'}],
+        status=200)
+
+    with runner.isolated_filesystem():
+        res = runner.run("files download -p some-pid --all --verify")
+        downloaded = os.listdir('.')
+
+    assert res.exit_code == 1
+    assert downloaded == ['a.txt']
+    assert 'b.txt: failed (Checksum mismatch for ./b.txt' in res.output
+
+
+@responses.activate
+def test_files_download_with_verify_when_checksum_mismatch(runner):
+    add_bucket_with_files('a.txt')
+    responses.replace(
+        responses.GET,
+        'https://analysispreservation-dev.cern.ch/api/deposits/some-pid/files',
+        json=[{'filename': 'a.txt', 'filesize': 4, 'checksum': 'md5:0123'}],
+        status=200)
+
+    with runner.isolated_filesystem():
+        res = runner.run("files download -p some-pid --verify a.txt")
+        downloaded = os.listdir('.')
+
+    assert res.exit_code == 1
+    assert downloaded == []
+    assert 'Checksum mismatch for a.txt (expected md5:0123' in res.output
+
+
+@responses.activate
+@pytest.mark.parametrize('args', ['a.txt', '--all'])
+def test_files_download_with_verify_when_no_checksum(runner, args):
+    add_bucket_with_files('a.txt')
+    responses.replace(
+        responses.GET,
+        'https://analysispreservation-dev.cern.ch/api/deposits/some-pid/files',
+        json=[{'filename': 'a.txt', 'filesize': 4}],
+        status=200)
+
+    with runner.isolated_filesystem():
+        res = runner.run("files download -p some-pid --verify " + args)
+        downloaded = os.listdir('.')
+
+    assert res.exit_code == 1
+    assert downloaded == []
+    assert 'Cannot verify a.txt, the server reported no checksum.' \
+        in res.output
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of CERN Analysis Preservation Framework.
+# Copyright (C) 2020 CERN.
+#
+# CERN Analysis Preservation Framework is free software; you can redistribute
+# it and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# CERN Analysis Preservation Framework is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with CERN Analysis Preservation Framework; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+"""Tests for local file hashing."""
+
+import hashlib
+import os
+
+import pytest
+
+from cap_client.hashing import HashCache, file_digests
+
+
+def write(filepath, data):
+    with open(filepath, 'wb') as fp:
+        fp.write(data)
+
+
+@pytest.mark.parametrize('data', [b'', b'Hello world' * 1000])
+def test_file_digests(tmpdir, data):
+    filepath = str(tmpdir.join('file.txt'))
+    write(filepath, data)
+
+    assert file_digests(filepath, ('md5', 'sha256'), block_size=7) == {
+        'md5': hashlib.md5(data).hexdigest(),
+        'sha256': hashlib.sha256(data).hexdigest(),
+    }
+
+
+def test_hash_cache_does_not_rehash_unchanged_files(tmpdir, monkeypatch):
+    filepath = str(tmpdir.join('file.txt'))
+    write(filepath, b'Hello world')
+    hashed = []
+    monkeypatch.setattr(
+        'cap_client.hashing.file_digests',
+        lambda path, algorithms: hashed.append(path) or {'md5': 'digest'})
+
+    cache = HashCache()
+    assert cache.md5(filepath) == 'digest'
+    assert cache.md5(filepath) == 'digest'
+    cache.close()
+
+    assert HashCache().md5(filepath) == 'digest'
+    assert len(hashed) == 1
+
+
+def test_hash_cache_follows_renamed_files(tmpdir):
+    filepath = str(tmpdir.join('file.txt'))
+    write(filepath, b'Hello world')
+    cache = HashCache()
+    cache.put(filepath, md5='digest')
+
+    os.rename(filepath, str(tmpdir.join('renamed.txt')))
+
+    assert cache.md5(str(tmpdir.join('renamed.txt'))) == 'digest'
+
+
+def test_hash_cache_rehashes_modified_files(tmpdir):
+    filepath = str(tmpdir.join('file.txt'))
+    write(filepath, b'Hello world')
+    cache = HashCache()
+    cache.md5(filepath)
+
+    write(filepath, b'Hello world!')
+    os.utime(filepath, (0, 0))
+
+    assert cache.md5(filepath) == hashlib.md5(b'Hello world!').hexdigest()
+
+
+def test_hash_cache_keeps_other_digests(tmpdir):
+    filepath = str(tmpdir.join('file.txt'))
+    write(filepath, b'Hello world')
+    cache = HashCache()
+    cache.put(filepath, md5='md5-digest')
+    cache.put(filepath, sha256='sha256-digest')
+
+    assert cache.get(filepath, 'md5') == 'md5-digest'
+    assert cache.get(filepath, 'sha256') == 'sha256-digest'
+
+
+def test_hash_cache_get_many_uses_process_pool(tmpdir, monkeypatch):
+    monkeypatch.setattr('cap_client.hashing.PARALLEL_HASH_THRESHOLD', 0)
+    filepaths = []
+    for i in range(3):
+        filepaths.append(str(tmpdir.join('f{}.txt'.format(i))))
+        write(filepaths[-1], b'data' * i)
+
+    digests = HashCache().get_many(filepaths, 'sha256', workers=2)
+
+    assert digests == {
+        f: hashlib.sha256(b'data' * i).hexdigest()
+        for i, f in enumerate(filepaths)
+    }
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of CERN Analysis Preservation Framework.
+# Copyright (C) 2020, 2020 CERN.
+#
+# CERN Analysis Preservation Framework is free software; you can redistribute
+# it and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# CERN Analysis Preservation Framework is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with CERN Analysis Preservation Framework; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+"""Tests for jobs commands."""
+
+import json
+import time
+
+import pytest
+import responses
+
+from cap_client.jobs import JobJournal
+
+API = 'https://analysispreservation-dev.cern.ch/api/'
+BUCKET_URL = 'http://analysispreservation.cern.ch/api/files/bucket-id/'
+
+
+def add_bucket_with_files(*names):
+    responses.add(responses.GET, API + 'deposits/some-pid/files',
+                  json=[{'filename': name} for name in names])
+    responses.add(responses.GET, API + 'deposits/some-pid',
+                  json={'links': {'bucket': BUCKET_URL[:-1]}})
+
+
+def downloaded(name):
+    return [c for c in responses.calls if c.request.url == BUCKET_URL + name]
+
+
+@responses.activate
+def test_jobs_resume_downloads_only_failed_files(cli_run, tmpdir):
+    add_bucket_with_files('a.txt', 'b.txt')
+    responses.add(responses.GET, BUCKET_URL + 'a.txt', body=b'a')
+    responses.add(responses.GET, BUCKET_URL + 'b.txt', status=500)
+
+    res = cli_run('files download -p some-pid --all -d {}'.format(tmpdir))
+
+    assert res.exit_code == 1
+    assert 'Retry them with: cap-client jobs resume 1' in res.output
+
+    responses.replace(responses.GET, BUCKET_URL + 'b.txt', body=b'b')
+    res = cli_run('jobs resume 1')
+
+    assert res.exit_code == 0
+    assert '1 of 1 files transferred' in res.output
+    assert tmpdir.join('b.txt').read() == 'b'
+    assert len(downloaded('a.txt')) == 1
+
+    res = cli_run('jobs resume 1')
+
+    assert res.exit_code == 2
+    assert 'Job 1 is already complete.' in res.output
+
+
+@responses.activate
+def test_jobs_resume_batch_passes_created_pid_to_following_ops(
+        cli_run, tmpdir):
+    responses.add(responses.POST, API + 'deposits/',
+                  json={'id': 'new-pid', 'metadata': {}}, status=201)
+    responses.add(responses.PUT, API + 'deposits/new-pid',
+                  json={'pid': 'new-pid', 'metadata': {}})
+    responses.add(responses.PATCH, API + 'deposits/new-pid', status=400)
+    manifest = tmpdir.join('ops.jsonl')
+    manifest.write('\n'.join(json.dumps(op) for op in [
+        {'op': 'create', 'ref': 'a', 'type': 'cms', 'data': {}},
+        {'op': 'metadata.set', 'ref': 'a', 'field': 'title', 'value': 'Z'},
+    ]))
+    report = tmpdir.join('report.jsonl')
+
+    res = cli_run('batch run {} --report {}'.format(manifest, report))
+
+    assert res.exit_code == 1
+
+    responses.replace(responses.PATCH, API + 'deposits/new-pid',
+                      json={'metadata': {'title': 'Z'}})
+    res = cli_run('jobs resume 1')
+
+    assert res.exit_code == 0
+    assert [c.request.method for c in responses.calls] == \
+        ['POST', 'PATCH', 'PATCH']
+    lines = [json.loads(line) for line in report.readlines()]
+    assert [(r['line'], r['status']) for r in lines] == \
+        [(1, 'ok'), (2, 'error'), (2, 'ok')]
+    assert lines[-1]['pid'] == 'new-pid'
+
+
+@responses.activate
+def test_jobs_list_and_show(cli_run, tmpdir):
+    add_bucket_with_files('a.txt')
+    responses.add(responses.GET, BUCKET_URL + 'a.txt', body=b'a')
+    cli_run('files download -p some-pid --pattern *.txt -d {}'.format(tmpdir))
+
+    res = cli_run('jobs list')
+
+    assert res.exit_code == 0
+    jobs = json.loads(res.output)
+    assert [(j['id'], j['kind'], j['state'], j['done']) for j in jobs] == \
+        [(1, 'files.download', 'complete', 1)]
+
+    res = cli_run('jobs show 1')
+
+    job = json.loads(res.output)
+    assert job['params']['pattern'] == '*.txt'
+    assert job['units'] == [{'key': 'a.txt', 'state': 'done'}]
+
+    res = cli_run('jobs show 2')
+
+    assert res.exit_code == 2
+    assert 'Job 2 does not exist.' in res.output
+
+
+@responses.activate
+def test_jobs_resume_batch_uploads_from_directory_job_started_in(
+        cli_run, tmpdir, monkeypatch):
+    responses.add(responses.GET, API + 'deposits/some-pid',
+                  json={'links': {'bucket': BUCKET_URL[:-1]}})
+    responses.add(responses.PUT, BUCKET_URL + 'a.txt', status=400)
+    tmpdir.mkdir('data').join('a.txt').write('a')
+    manifest = tmpdir.join('ops.jsonl')
+    manifest.write(json.dumps(
+        {'op': 'files.upload', 'pid': 'some-pid', 'file': 'data/a.txt'}))
+    monkeypatch.chdir(tmpdir)
+
+    res = cli_run('batch run ops.jsonl')
+
+    assert res.exit_code == 1
+
+    responses.replace(responses.PUT, BUCKET_URL + 'a.txt', json={})
+    monkeypatch.chdir(tmpdir.mkdir('elsewhere'))
+    res = cli_run('jobs resume 1')
+
+    assert res.exit_code == 0
+    assert responses.calls[-1].request.url == BUCKET_URL + 'a.txt'
+    assert responses.calls[-1].request.method == 'PUT'
+
+
+def add_jobs(journal, states, age=0):
+    jobs = [journal.create('batch', {}) for _ in states]
+    for job, state in zip(jobs, states):
+        job.record('op')
+        journal._db.execute(
+            'UPDATE jobs SET state = ?, updated = ? WHERE id = ?',
+            (state, time.time() - age * 24 * 3600, job.id))
+
+    return [job.id for job in jobs]
+
+
+@pytest.mark.parametrize('keep,max_age,kept', [
+    (2, 30, [1, 3, 4, 5]),
+    (10, 30, [1, 2, 3, 4, 5]),
+    (10, 0.5, [1, 4, 5]),
+])
+def test_journal_prunes_finished_jobs_when_job_finishes(
+        tmpdir, monkeypatch, keep, max_age, kept):
+    monkeypatch.setattr('cap_client.jobs.JOB_RETENTION_COUNT', keep)
+    monkeypatch.setattr('cap_client.jobs.JOB_RETENTION_DAYS', max_age)
+    journal = JobJournal(str(tmpdir.join('jobs.db')))
+    add_jobs(journal, ['running', 'complete', 'failed'], age=2)
+    add_jobs(journal, ['running'])
+
+    journal.create('batch', {}).finish()
+
+    assert [j['id'] for j in journal.list()] == kept[::-1]
+    units = journal._db.execute('SELECT DISTINCT job FROM units').fetchall()
+    assert sorted(job for job, in units) == [job for job in kept if job < 5]
+
+
+def test_jobs_prune(cli_run):
+    journal = JobJournal()
+    add_jobs(journal, ['complete', 'failed', 'running'], age=10)
+    add_jobs(journal, ['complete'])
+    journal.close()
+
+    res = cli_run('jobs prune --older-than 7')
+
+    assert res.exit_code == 0
+    assert json.loads(res.output) == [1, 2]
+
+    res = cli_run('jobs prune --keep 0')
+
+    assert json.loads(res.output) == [4]
+    assert [j['id'] for j in json.loads(cli_run('jobs list').output)] == [3]
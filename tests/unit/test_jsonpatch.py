@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of CERN Analysis Preservation Framework.
+# Copyright (C) 2020, 2020 CERN.
+#
+# CERN Analysis Preservation Framework is free software; you can redistribute
+# it and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# CERN Analysis Preservation Framework is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with CERN Analysis Preservation Framework; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+"""Tests for JSON Patch generation."""
+
+import copy
+import random
+
+import pytest
+
+from cap_client.jsonpatch import diff
+
+
+def apply(doc, patch):
+    """Apply add/remove/replace operations of a JSON Patch."""
+    doc = copy.deepcopy(doc)
+    for op in patch:
+        if not op['path']:
+            doc = op['value']
+            continue
+
+        keys = [k.replace('~1', '/').replace('~0', '~')
+                for k in op['path'].split('/')[1:]]
+        parent = doc
+        for key in keys[:-1]:
+            parent = parent[int(key) if isinstance(parent, list) else key]
+        key = int(keys[-1]) if isinstance(parent, list) else keys[-1]
+
+        if op['op'] == 'remove':
+            del parent[key]
+        elif op['op'] == 'add' and isinstance(parent, list):
+            parent.insert(key, op['value'])
+        else:
+            parent[key] = op['value']
+
+    return doc
+
+
+@pytest.mark.parametrize('src, dst, patch', [
+    ({'a': 1}, {'a': 1}, []),
+    ({'a': 1, 'b': 2}, {'a': 2, 'c': 3}, [
+        {'op': 'replace', 'path': '/a', 'value': 2},
+        {'op': 'remove', 'path': '/b'},
+        {'op': 'add', 'path': '/c', 'value': 3},
+    ]),
+    ({'a/b': {'c~': [1]}}, {'a/b': {'c~': [1, 2]}}, [
+        {'op': 'add', 'path': '/a~1b/c~0/1', 'value': 2},
+    ]),
+    ({'a': 1}, {'a': True}, [
+        {'op': 'replace', 'path': '/a', 'value': True},
+    ]),
+    ([1, 2, 3, 4], [1, 3, 4, 5], [
+        {'op': 'add', 'path': '/4', 'value': 5},
+        {'op': 'remove', 'path': '/1'},
+    ]),
+    ({'a': [1, 2]}, {'a': [3, 4]}, [
+        {'op': 'replace', 'path': '/a', 'value': [3, 4]},
+    ]),
+])
+def test_diff(src, dst, patch):
+    assert diff(src, dst) == patch
+    assert apply(src, patch) == dst
+
+
+def test_diff_of_large_array_only_touches_changed_items():
+    src = [{'id': i, 'tags': ['a', 'b']} for i in range(20000)]
+    dst = copy.deepcopy(src)
+    dst.insert(5000, {'id': -1})
+    del dst[100]
+    dst[15000]['tags'][1] = 'c'
+
+    patch = diff(src, dst, path='/items')
+
+    assert patch == [
+        {'op': 'replace', 'path': '/items/15000/tags/1', 'value': 'c'},
+        {'op': 'add', 'path': '/items/5000', 'value': {'id': -1}},
+        {'op': 'remove', 'path': '/items/100'},
+    ]
+
+
+def random_document(depth=0):
+    if depth > 3 or random.random() < 0.4:
+        return random.choice([0, 1, 1.5, True, False, None, 'a', 'b'])
+    elif random.random() < 0.5:
+        return [random_document(depth + 1)
+                for _ in range(random.randint(0, 6))]
+    return {random.choice('xy/~'): random_document(depth + 1)
+            for _ in range(random.randint(0, 4))}
+
+
+def mutate(doc):
+    doc = copy.deepcopy(doc)
+    if isinstance(doc, list):
+        for _ in range(random.randint(0, 3)):
+            i = random.randint(0, len(doc))
+            if random.random() < 0.5:
+                doc.insert(i, random_document(2))
+            elif i < len(doc):
+                doc[i] = mutate(doc[i]) if random.random() < 0.5 else None
+                del doc[i:i + random.randint(0, 1)]
+    elif isinstance(doc, dict):
+        for key in list(doc):
+            doc[key] = mutate(doc[key])
+        doc.pop(random.choice('xy/~'), None)
+        doc[random.choice('pq')] = random_document(2)
+    elif random.random() < 0.5:
+        doc = random_document(3)
+
+    return doc
+
+
+def test_diff_patches_turn_source_into_destination():
+    random.seed(0)
+    for _ in range(2000):
+        src = random_document()
+        dst = mutate(src)
+
+        assert apply(src, diff(src, dst)) == dst
@@ -456,6 +456,25 @@ def test_metadata_remove(cli_run):
     assert json.loads(res.stripped_output) == {}
 
 
+@responses.activate
+@mark.parametrize('command, expected', [
+    ('update -p some-pid --field files.a/b.0 --text x',
+     {'op': 'replace', 'path': '/files/a~1b/0', 'value': 'x'}),
+    ('remove -p some-pid --field files.a~b',
+     {'op': 'remove', 'path': '/files/a~0b'}),
+])
+def test_metadata_field_names_are_escaped(cli_run, command, expected):
+    responses.add(
+        responses.PATCH,
+        'https://analysispreservation-dev.cern.ch/api/deposits/some-pid',
+        json={'metadata': {}})
+
+    res = cli_run('metadata ' + command)
+
+    assert res.exit_code == 0
+    assert json.loads(responses.calls[0].request.body) == [expected]
+
+
 @responses.activate
 def test_metadata_remove_pid_not_exists(cli_run):
     responses.add(
@@ -503,3 +522,117 @@ def test_metadata_remove_no_field_given(cli_run):
 
     assert res.exit_code == 2
     assert "Error: Missing option '--field'." in res.output
+
+
+@responses.activate
+def test_metadata_update_with_diff_sends_only_changes(cli_run, tmpdir):
+    url = 'https://analysispreservation-dev.cern.ch/api/deposits/some-pid'
+    current = {
+        'general_title': 'test',
+        'people': [{'name': str(i)} for i in range(1000)],
+    }
+    responses.add(responses.GET, url, json={'metadata': current})
+    responses.add(responses.PATCH, url, json={'metadata': {}})
+    new = json.loads(json.dumps(current))
+    new['people'].insert(500, {'name': 'new'})
+    new['general_title'] = 'new-test'
+    jsonfile = tmpdir.join('metadata.json')
+    jsonfile.write(json.dumps(new))
+
+    res = cli_run('metadata update -p some-pid --diff -f {}'.format(jsonfile))
+
+    assert res.exit_code == 0
+    assert responses.calls[1].request.headers[
+        'Content-Type'] == 'application/json-patch+json'
+    assert json.loads(responses.calls[1].request.body) == [
+        {'op': 'replace', 'path': '/general_title', 'value': 'new-test'},
+        {'op': 'add', 'path': '/people/500', 'value': {'name': 'new'}},
+    ]
+
+
+@responses.activate
+def test_metadata_update_with_diff_and_field_without_changes(cli_run):
+    responses.add(
+        responses.GET,
+        'https://analysispreservation-dev.cern.ch/api/deposits/some-pid',
+        json={'metadata': {'basic_info': {'tags': ['a', 'b']}}})
+
+    res = cli_run('metadata update -p some-pid --diff '
+                  '--field basic_info.tags --json ["a","b"]')
+
+    assert res.exit_code == 0
+    assert len(responses.calls) == 1
+    assert json.loads(res.output) == {
+        'metadata': {'basic_info': {'tags': ['a', 'b']}}
+    }
+
+
+@responses.activate
+def test_metadata_update_with_diff_escapes_field(cli_run):
+    url = 'https://analysispreservation-dev.cern.ch/api/deposits/some-pid'
+    responses.add(responses.GET, url, json={'metadata': {'a/b': {'c': 1}}})
+    responses.add(responses.PATCH, url, json={'metadata': {}})
+
+    res = cli_run('metadata update -p some-pid --diff '
+                  '--field a/b --json {"c":2}')
+
+    assert res.exit_code == 0
+    assert json.loads(responses.calls[1].request.body) == [
+        {'op': 'replace', 'path': '/a~1b/c', 'value': 2},
+    ]
+
+
+# PATCH
+@responses.activate
+def test_metadata_patch_sends_all_changes_in_one_request(cli_run, tmpdir):
+    url = 'https://analysispreservation-dev.cern.ch/api/deposits/some-pid'
+    responses.add(responses.PATCH, url, json={'metadata': {}})
+    patch_file = tmpdir.join('patch.json')
+    patch_file.write(json.dumps([{'op': 'remove', 'path': '/old'}]))
+
+    res = cli_run('metadata patch -p some-pid '
+                  '--set general_title=new-test '
+                  '--set basic_info.ids=[1,2] '
+                  '--add people.-={{"name":"x"}} '
+                  '--remove basic_info.ana_notes.0 '
+                  '--add a/b=2 '
+                  '--patch-file {}'.format(patch_file))
+
+    assert res.exit_code == 0
+    assert len(responses.calls) == 1
+    assert responses.calls[0].request.headers[
+        'Content-Type'] == 'application/json-patch+json'
+    assert json.loads(responses.calls[0].request.body) == [
+        {'op': 'remove', 'path': '/old'},
+        {'op': 'replace', 'path': '/general_title', 'value': 'new-test'},
+        {'op': 'replace', 'path': '/basic_info/ids', 'value': [1, 2]},
+        {'op': 'add', 'path': '/people/-', 'value': {'name': 'x'}},
+        {'op': 'add', 'path': '/a~1b', 'value': 2},
+        {'op': 'remove', 'path': '/basic_info/ana_notes/0'},
+    ]
+    assert json.loads(res.output) == {'metadata': {}}
+
+
+def test_metadata_patch_no_changes_given(cli_run):
+    res = cli_run('metadata patch -p some-pid')
+
+    assert res.exit_code == 2
+    assert 'Error: No changes given.' in res.output
+
+
+def test_metadata_patch_set_without_value(cli_run):
+    res = cli_run('metadata patch -p some-pid --set general_title')
+
+    assert res.exit_code == 2
+    assert "Expected FIELD=VALUE, got 'general_title'." in res.output
+
+
+def test_metadata_patch_file_not_a_patch(cli_run, tmpdir):
+    patch_file = tmpdir.join('patch.json')
+    patch_file.write(json.dumps({'general_title': 'x'}))
+
+    res = cli_run('metadata patch -p some-pid --patch-file {}'.format(
+        patch_file))
+
+    assert res.exit_code == 2
+    assert 'Not a valid JSON Patch (an array of operations).' in res.output
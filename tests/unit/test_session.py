@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of CERN Analysis Preservation Framework.
+# Copyright (C) 2020 CERN.
+#
+# CERN Analysis Preservation Framework is free software; you can redistribute
+# it and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# CERN Analysis Preservation Framework is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with CERN Analysis Preservation Framework; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+"""Tests for the shared HTTP session."""
+
+import json
+
+import responses
+
+from cap_client.api import AnalysisAPI, FilesAPI, MetadataAPI
+from cap_client.api.session import close_session, create_session, \
+    get_session, stats
+
+
+def test_api_classes_share_one_session():
+    session = AnalysisAPI().session
+
+    assert FilesAPI().session is session
+    assert MetadataAPI().session is session
+    assert get_session() is session
+
+
+def test_close_session_creates_a_new_one_on_next_use():
+    session = get_session()
+    close_session()
+
+    assert get_session() is not session
+
+
+def test_create_session_pool_settings():
+    session = create_session(pool_connections=3, pool_maxsize=7,
+                             idle_timeout=5)
+    adapter = session.get_adapter('https://analysispreservation.cern.ch')
+
+    assert adapter._pool_connections == 3
+    assert adapter._pool_maxsize == 7
+    assert adapter.idle_timeout == 5
+
+
+def test_connections_are_reused_between_requests(local_server):
+    local_server.routes['/api/deposits/some-pid/files'] = (200, b'[]')
+
+    api = FilesAPI()
+    for _ in range(5):
+        assert api.get('some-pid') == []
+
+    snapshot = stats.snapshot()
+    assert snapshot['requests'] == 5
+    assert snapshot['connections_opened'] == 1
+    assert snapshot['connections_reused'] == 4
+
+
+def test_idle_pool_is_dropped_after_timeout(local_server):
+    local_server.routes['/api/deposits/some-pid/files'] = (200, b'[]')
+
+    api = FilesAPI()
+    adapter = api.session.get_adapter(local_server.url)
+    adapter.idle_timeout = 0
+
+    api.get('some-pid')
+    api.get('some-pid')
+
+    assert stats.get('idle_pool_resets') == 1
+    assert stats.get('connections_opened') == 2
+
+
+@responses.activate
+def test_stats_flag_prints_transport_stats(cli_run):
+    responses.add(
+        responses.GET,
+        'https://analysispreservation-dev.cern.ch/api/deposits/some-pid/files',
+        json=[],
+        status=200)
+
+    res = cli_run('--stats files get -p some-pid')
+
+    assert res.exit_code == 0
+    assert json.loads(res.stderr)['requests'] == 1
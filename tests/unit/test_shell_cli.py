@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of CERN Analysis Preservation Framework.
+# Copyright (C) 2020, 2020 CERN.
+#
+# CERN Analysis Preservation Framework is free software; you can redistribute
+# it and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# CERN Analysis Preservation Framework is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with CERN Analysis Preservation Framework; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+"""Tests for shell and daemon commands."""
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from cap_client.daemon import CommandServer, forward, main, may_prompt
+
+FILES_PATH = '/api/deposits/some-pid/files'
+
+
+def test_shell_runs_commands_on_one_session(cli_run, local_server):
+    local_server.routes[FILES_PATH] = (200, b'[]')
+
+    res = cli_run('shell', input='files get -p some-pid\n'
+                  '--stats files get -p some-pid\n'
+                  'files get\n'
+                  'exit\n')
+
+    assert res.exit_code == 0
+    assert res.stdout.count('[]') == 2
+    assert 'Missing option' in res.stderr
+    stats, _ = json.JSONDecoder().raw_decode(res.stderr)
+    assert stats['requests'] == 1
+    assert stats['connections_reused'] == 1
+
+
+@pytest.fixture
+def daemon(tmpdir):
+    path = str(tmpdir.join('cap.sock'))
+    proc = subprocess.Popen([
+        sys.executable, '-c',
+        'from cap_client.cli import cli; cli(["serve", "--socket", "{}"])'
+        .format(path)
+    ], stderr=subprocess.PIPE)
+
+    for _ in range(100):
+        if os.path.exists(path):
+            break
+        time.sleep(0.05)
+
+    yield path
+
+    proc.terminate()
+    proc.wait()
+
+
+def test_commands_are_forwarded_to_daemon(daemon, local_server, capsys):
+    local_server.routes[FILES_PATH] = (200, b'[]')
+
+    assert forward(daemon, ['files', 'get', '-p', 'some-pid']) == 0
+    assert capsys.readouterr().out.strip() == '[]'
+
+    assert forward(daemon, ['--stats', 'files', 'get', '-p', 'some-pid']) == 0
+    assert json.loads(capsys.readouterr().err)['connections_reused'] == 1
+
+    assert forward(daemon, ['files', 'get']) == 2
+    assert 'Missing option' in capsys.readouterr().err
+    assert len(local_server.requests) == 2
+
+
+def test_main_runs_command_when_daemon_is_not_running(
+        tmpdir, monkeypatch, capsys):
+    monkeypatch.setenv('CAP_CLIENT_SOCKET', str(tmpdir.join('none.sock')))
+    monkeypatch.setattr('sys.argv', ['cap-client', '--version'])
+
+    with pytest.raises(SystemExit) as e:
+        main()
+
+    assert e.value.code == 0
+    assert capsys.readouterr().out.strip()
+
+
+@pytest.mark.parametrize('args, expected', [
+    (['files', 'download', '-p', 'x', 'a.txt'], True),
+    (['--stats', 'files', 'upload', '-p', 'x', 'dir'], True),
+    (['files', 'upload', '-p', 'x', 'dir', '--yes-i-know'], False),
+    (['files', 'get', '-p', 'x'], False),
+    (['metadata', 'get', '-p', 'x'], False),
+])
+def test_may_prompt(args, expected):
+    assert may_prompt(args) is expected
+
+
+def test_main_runs_prompting_command_locally(daemon, monkeypatch):
+    monkeypatch.setenv('CAP_CLIENT_SOCKET', daemon)
+    monkeypatch.setattr('sys.argv', ['cap-client', 'files', 'download'])
+    monkeypatch.setattr('cap_client.daemon.forward', lambda *args: 1 / 0)
+
+    with pytest.raises(SystemExit) as e:
+        main()
+
+    assert e.value.code == 2
+
+
+def test_daemon_uses_only_server_settings_of_client(monkeypatch):
+    seen = {}
+
+    def run_command(args):
+        seen.update((k, v) for k, v in os.environ.items()
+                    if k.startswith('CAP_'))
+        return 0
+
+    monkeypatch.setattr('cap_client.daemon.run_command', run_command)
+    monkeypatch.setenv('CAP_RETRY_TOTAL', '3')
+    monkeypatch.setenv('CAP_ACCESS_TOKEN', 'daemon-token')
+    monkeypatch.delenv('CAP_SERVER_API_PATH', raising=False)
+
+    code = CommandServer.run(None, {
+        'args': [],
+        'env': {'CAP_ACCESS_TOKEN': 'client-token', 'CAP_RETRY_TOTAL': '0'},
+    }, None)
+
+    assert code == 0
+    assert seen['CAP_ACCESS_TOKEN'] == 'client-token'
+    assert seen['CAP_RETRY_TOTAL'] == '3'
+    assert 'CAP_SERVER_URL' not in seen
+    assert os.environ['CAP_ACCESS_TOKEN'] == 'daemon-token'